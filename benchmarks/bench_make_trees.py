@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Benchmarks building river trees from reaches with workflow.tree.make_trees().
+
+Compares the original implementation -- which compares every segment
+to every other with workflow.utils.close() to find outlets, scans all
+segments for the upstream matches of each one, and recurses once per
+segment -- to the indexed, iterative one.  Reaches form a synthetic,
+randomly branching network, as NHD flowlines of a HUC4 would, in shuffled
+order.  The trees are checked to be identical.
+
+Usage: python benchmarks/bench_make_trees.py [n_reaches ...]
+"""
+
+import sys
+import time
+import numpy as np
+import shapely.geometry
+
+import workflow.tree
+import workflow.utils
+
+
+def legacy_get_matches(seg, segments, segment_found):
+    matches = [i for i in range(len(segments)) if not segment_found[i]
+               and workflow.utils.close(segments[i].coords[-1], seg.coords[0])]
+    segment_found[matches] = True
+    return matches
+
+def legacy_go(i_seg, tree, segments, segments_found):
+    count = 0
+    tree.addChild(segments[i_seg])
+    for m in legacy_get_matches(segments[i_seg], segments, segments_found):
+        count += legacy_go(m, tree, segments, segments_found)
+    return count + 1
+
+def legacy_find_endpoints(segments):
+    endpoints = []
+    for i,s in enumerate(segments):
+        c = s.coords[-1]
+        try:
+            next(s2 for s2 in segments if workflow.utils.close(s2.coords[0], c))
+        except StopIteration:
+            endpoints.append(i)
+    return endpoints
+
+def legacy_make_trees(segments):
+    endpoint_indices = legacy_find_endpoints(segments)
+    for endpoint_index in endpoint_indices:
+        endpoint_seg = shapely.geometry.LineString(segments[endpoint_index].coords[-2:])
+        try:
+            next(i for i,seg in enumerate(segments)
+                 if endpoint_seg.intersects(seg)
+                 and i is not endpoint_index
+                 and workflow.utils.close(endpoint_seg.intersection(seg).coords[0], endpoint_seg.coords[-1], 1.e-5))
+        except StopIteration:
+            pass
+        else:
+            raise RuntimeError('benchmark networks have no faux outlets')
+
+    segment_found = np.zeros((len(segments),), bool)
+    gcount = 0
+    trees = []
+    for endpoint_index in endpoint_indices:
+        tree = workflow.tree.Tree()
+        gcount += legacy_go(endpoint_index, tree, segments, segment_found)
+        trees.append(tree)
+    assert(gcount == len(segments))
+    return trees
+
+
+def network(n_reaches, n_outlets=4):
+    """Random branching reaches, each flowing from its start to its end.
+
+    Reaches are drawn in layers by depth, each subtree over an interval
+    of x proportional to its number of leaves, so that none cross.
+    """
+    np.random.seed(0)
+    # random topology, grown upstream from the outlets
+    parent = [-1,]*n_outlets
+    tips = list(range(n_outlets))
+    while len(parent) < n_reaches:
+        k = np.random.randint(len(tips))
+        p = tips[k]
+        tips[k] = tips[-1]
+        tips.pop()
+        for b in range(2 if np.random.random() < 0.45 else 1):
+            tips.append(len(parent))
+            parent.append(p)
+    parent = np.array(parent[0:n_reaches])
+
+    # leaves per subtree and depth, children always after their parent
+    children = [[] for p in parent]
+    for i, p in enumerate(parent):
+        if p >= 0:
+            children[p].append(i)
+    leaves = np.ones(len(parent))
+    for i in reversed(range(len(parent))):
+        if len(children[i]) > 0:
+            leaves[i] = sum(leaves[c] for c in children[i])
+    depth = np.zeros(len(parent))
+    x0 = np.zeros(len(parent))
+    x0[0:n_outlets] = np.cumsum(leaves[0:n_outlets]) - leaves[0:n_outlets]
+    for i in range(len(parent)):
+        if parent[i] >= 0:
+            depth[i] = depth[parent[i]] + 1
+        x = x0[i]
+        for c in children[i]:
+            x0[c] = x
+            x += leaves[c]
+    start = np.stack([x0 + leaves/2, depth + 1], axis=1)
+    end = np.stack([np.where(parent >= 0, start[parent,0], start[:,0]), depth], axis=1)
+
+    t = np.linspace(0, 1, 4)[None,:,None]
+    coords = start[:,None,:] + t * (end - start)[:,None,:]
+    reaches = [shapely.geometry.LineString(np.round(c, 6)) for c in coords]
+    order = np.random.permutation(len(reaches))
+    return [reaches[i] for i in order]
+
+
+def segment_lists(trees):
+    return [[tuple(s.coords) for s in tree.dfs()] for tree in trees]
+
+
+def bench(n_reaches):
+    reaches = network(n_reaches)
+    t0 = time.perf_counter()
+    trees = workflow.tree.make_trees(reaches)
+    t_new = time.perf_counter() - t0
+
+    if n_reaches <= 5000:
+        t0 = time.perf_counter()
+        legacy = legacy_make_trees(reaches)
+        t_legacy = time.perf_counter() - t0
+        identical = segment_lists(trees) == segment_lists(legacy)
+        print('{:7d} reaches: legacy {:8.3f}s, indexed {:7.3f}s, speedup {:6.1f}x, identical = {}'.format(
+            len(reaches), t_legacy, t_new, t_legacy/t_new, identical))
+        assert(identical)
+    else:
+        print('{:7d} reaches: legacy  skipped, indexed {:7.3f}s'.format(len(reaches), t_new))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] if len(sys.argv) > 1 else [500, 1000, 50000]
+    sys.setrecursionlimit(100000)
+    for n in sizes:
+        bench(n)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmarks the river-distance refinement callback.
+
+Compares the original refine_from_river_distance callback, which asks
+shapely for the distance from each triangle centroid to the whole
+river MultiLineString, to one using workflow.river_distance, on
+meandering rivers with increasing numbers of vertices.  Reports the
+cost per call, the build time of the distance oracle, and how many
+refinement decisions differ, which can only happen within the accuracy
+bound of the threshold.  It then triangulates a square watershed with
+each callback.
+
+Usage: python benchmarks/bench_river_distance.py [n_vertices ...]
+"""
+
+import sys
+import time
+import numpy as np
+import shapely.geometry
+
+import workflow.tree
+import workflow.split_hucs
+import workflow.triangulation
+import workflow.river_distance
+
+SIZE = 10000.
+GRADING = (50., 500., 1000., 50000.)
+
+
+def meander(n_vertices):
+    """A river crossing the domain with n_vertices, as a forest."""
+    x = np.linspace(0.05*SIZE, 0.95*SIZE, n_vertices)
+    y = 0.5*SIZE + 0.3*SIZE*np.sin(x / SIZE * 6*np.pi) + 0.01*SIZE*np.sin(x / SIZE * 300*np.pi)
+    return [workflow.tree.Tree(shapely.geometry.LineString(np.stack([x,y], axis=1)))]
+
+
+def refine_legacy(near_distance, near_area, away_distance, away_area, rivers):
+    """The original callback."""
+    def max_area_valid(distance):
+        if distance > away_distance:
+            area = away_area
+        elif distance < near_distance:
+            area = near_area
+        else:
+            area = near_area + (distance - near_distance) / (away_distance - near_distance) * (away_area - near_area)
+        return area
+
+    river_multiline = workflow.tree.forest_to_list(rivers)
+    def refine(vertices, area):
+        bary = np.sum(np.array(vertices), axis=0)/3
+        bary_p = shapely.geometry.Point(bary[0], bary[1])
+        distance = bary_p.distance(river_multiline)
+        return bool(area > max_area_valid(distance))
+    return refine
+
+
+def random_triangles(n):
+    np.random.seed(0)
+    centers = np.random.random((n,2)) * SIZE
+    tris = centers[:,None,:] + np.random.random((n,3,2)) * 100.
+    areas = np.random.random((n,)) * 2 * GRADING[3]
+    return [[tuple(v) for v in t] for t in tris], areas
+
+
+def time_calls(refine, tris, areas):
+    t0 = time.perf_counter()
+    decisions = [refine(t, a) for t, a in zip(tris, areas)]
+    return (time.perf_counter() - t0) / len(tris), np.array(decisions)
+
+
+def bench(n_vertices, n_calls=20000):
+    rivers = meander(n_vertices)
+    tris, areas = random_triangles(n_calls)
+
+    t0 = time.perf_counter()
+    fast = workflow.triangulation.refine_from_river_distance(*GRADING, rivers)
+    t_build = time.perf_counter() - t0
+    legacy = refine_legacy(*GRADING, rivers)
+
+    t_legacy, d_legacy = time_calls(legacy, tris, areas)
+    t_fast, d_fast = time_calls(fast, tris, areas)
+    print('{:>8d} river vertices: shapely {:8.1f}us/call, oracle {:6.1f}us/call ({:6.1f}x, build {:6.3f}s), {} of {} decisions differ'.format(
+        n_vertices, t_legacy*1e6, t_fast*1e6, t_legacy/t_fast, t_build, np.count_nonzero(d_legacy != d_fast), n_calls))
+
+
+def bench_triangulate(n_vertices):
+    rivers = meander(n_vertices)
+    hucs = workflow.split_hucs.SplitHUCs([shapely.geometry.box(0, 0, SIZE, SIZE)])
+    for label, refine in [('shapely', refine_legacy(*GRADING, rivers)),
+                          ('oracle', workflow.triangulation.refine_from_river_distance(*GRADING, rivers))]:
+        t0 = time.perf_counter()
+        points, tris = workflow.triangulation.triangulate(hucs, rivers, refinement_func=refine)
+        print('  triangulate, {:>8d} river vertices, {:>7s}: {:8.3f}s, {} triangles'.format(
+            n_vertices, label, time.perf_counter() - t0, len(tris)))
+        if label == 'oracle':
+            closure = dict(zip(refine.__code__.co_freevars, refine.__closure__))
+            info = closure['river_distance'].cell_contents._cell_distance.cache_info()
+            print('    {} calls, {:.0f}% memoized'.format(info.hits + info.misses,
+                                                      100. * info.hits / (info.hits + info.misses)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sizes = [int(n) for n in sys.argv[1:]]
+    else:
+        sizes = [100, 1000, 10000, 100000]
+    for n in sizes:
+        bench(n)
+    bench_triangulate(2000)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Benchmarks snapping of river endpoints and crossings to HUC boundaries.
+
+Builds an n-by-n grid of square HUCs, each with one river ending just
+short of its eastern boundary and one crossing its northern boundary,
+then runs snap_river_endpoints and snap_crossings with and without the
+segment spatial index, checking that both give identical HUCs and
+rivers.  Without the index, every river is checked against every
+segment, so the cost grows quadratically in the number of HUCs.
+
+Usage: python benchmarks/bench_snap.py [n_grid ...]
+"""
+
+import sys
+import time
+import shapely.geometry
+
+import workflow.split_hucs
+import workflow.hydrography
+import workflow.tree
+
+
+def grid_hucs(n, dx=10.):
+    """An n x n grid of square HUCs."""
+    return [shapely.geometry.box(i*dx, j*dx, (i+1)*dx, (j+1)*dx)
+            for i in range(n) for j in range(n)]
+
+
+def grid_rivers(n, dx=10., tol=0.1):
+    """Rivers, one tree per reach, to be snapped onto grid_hucs(n)."""
+    reaches = []
+    for i in range(n):
+        for j in range(n):
+            x0 = i*dx
+            y0 = j*dx
+            # ends within tol of the eastern boundary
+            reaches.append(shapely.geometry.LineString([(x0+0.5*dx, y0+0.5*dx),
+                                                        (x0+dx-0.5*tol, y0+0.6*dx)]))
+            # crosses the northern boundary
+            reaches.append(shapely.geometry.LineString([(x0+0.2*dx, y0+0.7*dx),
+                                                        (x0+0.3*dx, y0+1.2*dx)]))
+    return [workflow.tree.Tree(r) for r in reaches]
+
+
+def run(n, use_index, tol=0.1):
+    hucs = workflow.split_hucs.SplitHUCs(grid_hucs(n))
+    rivers = grid_rivers(n, tol=tol)
+
+    t0 = time.perf_counter()
+    workflow.hydrography.snap_river_endpoints(hucs, rivers, tol, use_index=use_index)
+    t_endpoints = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    workflow.hydrography.snap_crossings(hucs, rivers, tol, use_index=use_index)
+    t_crossings = time.perf_counter() - t0
+    return hucs, rivers, t_endpoints, t_crossings
+
+
+def same(run1, run2):
+    hucs1, rivers1 = run1[0:2]
+    hucs2, rivers2 = run2[0:2]
+    if list(hucs1.segments.handles()) != list(hucs2.segments.handles()):
+        return False
+    if not all(list(hucs1.segments[h].coords) == list(hucs2.segments[h].coords)
+               for h in hucs1.segments.handles()):
+        return False
+    segs1 = [list(r.coords) for tree in rivers1 for r in tree.dfs()]
+    segs2 = [list(r.coords) for tree in rivers2 for r in tree.dfs()]
+    return segs1 == segs2
+
+
+def bench(n, compare=True):
+    indexed = run(n, True)
+    if compare:
+        brute = run(n, False)
+        identical = same(indexed, brute)
+        print('{:>5d}^2 HUCs: endpoints {:8.3f}s -> {:8.3f}s, crossings {:8.3f}s -> {:8.3f}s, identical = {}'.format(
+            n, brute[2], indexed[2], brute[3], indexed[3], identical))
+        assert(identical)
+    else:
+        print('{:>5d}^2 HUCs: endpoints {:8.3f}s, crossings {:8.3f}s'.format(n, indexed[2], indexed[3]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sizes = [int(n) for n in sys.argv[1:]]
+    else:
+        sizes = [5, 10, 20, 40]
+    for n in sizes:
+        bench(n, n <= 20)
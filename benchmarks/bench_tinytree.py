@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmarks traversals of workflow.tinytree.Tree on deep chains.
+
+Compares the original recursive generators of tinytree -- preOrder()
+and postOrder() yield each node through the generators of all of its
+ancestors, so a traversal takes O(n * depth) time, and count() and
+findForwards() are built on them -- to the iterative traversals and
+the preOrderList() cached on the root.  Trees are synthetic chains, as long
+mainstems are, and a shallow, bushy tree of the same size for
+reference.  Traversal orders and results are checked to be identical.
+
+Usage: python benchmarks/bench_tinytree.py [n_nodes ...]
+"""
+
+import sys
+import time
+
+import workflow.tinytree
+
+
+def legacy_preOrder(node):
+    yield node
+    for i in node.children[:]:
+        for j in legacy_preOrder(i):
+            yield j
+
+def legacy_postOrder(node):
+    for i in node.children[:]:
+        for j in legacy_postOrder(i):
+            yield j
+    yield node
+
+def legacy_count(node):
+    return len(list(legacy_preOrder(node)))
+
+def legacy_findForwards(node, func):
+    itr = legacy_preOrder(node.getRoot())
+    for i in itr:
+        if i is node:
+            break
+    return node._find(itr, func)
+
+
+def chain(n):
+    nodes = [workflow.tinytree.Tree() for i in range(n)]
+    for i in range(1, n):
+        nodes[i-1].addChild(nodes[i])
+    return nodes
+
+def bushy(n, branching=4):
+    nodes = [workflow.tinytree.Tree() for i in range(n)]
+    for i in range(1, n):
+        nodes[(i-1)//branching].addChild(nodes[i])
+    return nodes
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def bench(name, nodes):
+    root = nodes[0]
+    last = nodes[-1]
+    target = lambda x: x is last
+    for op, old, new in [('preOrder', lambda: list(legacy_preOrder(root)), lambda: list(root.preOrder())),
+                         ('postOrder', lambda: list(legacy_postOrder(root)), lambda: list(root.postOrder())),
+                         ('count x10', lambda: [legacy_count(root) for i in range(10)],
+                                       lambda: [root.count() for i in range(10)]),
+                         ('findForwards x10', lambda: [legacy_findForwards(nodes[1], target) for i in range(10)],
+                                              lambda: [nodes[1].findForwards(target) for i in range(10)])]:
+        r_old, t_old = timed(old)
+        r_new, t_new = timed(new)
+        identical = r_old == r_new
+        print('  {:>8s} {:7d} nodes, {:>16s}: recursive {:8.3f}s, iterative {:8.4f}s, speedup {:7.1f}x, identical = {}'.format(
+            name, len(nodes), op, t_old, t_new, t_old/t_new, identical))
+        assert(identical)
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] if len(sys.argv) > 1 else [1000, 5000]
+    sys.setrecursionlimit(1000000)
+    for n in sizes:
+        bench('chain', chain(n))
+        bench('bushy', bushy(n))
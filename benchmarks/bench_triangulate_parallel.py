@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Benchmarks parallel, per-HUC triangulation against a single Triangle call.
+
+Triangulates an n-by-n grid of perturbed quadrilateral HUCs, each with
+a short river inside it, to a maximum triangle area, once with
+workflow.triangulation.triangulate() and then with
+triangulate_parallel() on increasing numbers of processes.  The meshes
+differ, since HUC boundaries are split up front rather than by
+Triangle, so instead of identical meshes this checks that each covers
+the same area, meets the area target, and is conforming: its only
+boundary is the exterior of the HUCs.
+
+Usage: python benchmarks/bench_triangulate_parallel.py [n_grid] [--max-area A] [--nprocs N ...]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import shapely.geometry
+
+import workflow.split_hucs
+import workflow.hydrography
+import workflow.triangulation
+import workflow.connectivity
+import workflow.extrude
+
+
+def grid_hucs(n, dx=1000.):
+    """An n x n grid of quadrilaterals with randomly perturbed corners,
+    and a river inside each."""
+    np.random.seed(0)
+    x = np.round(np.arange(n+1)*dx + 0.2*dx*(np.random.random((n+1,n+1))-0.5), 3)
+    y = np.round(np.arange(n+1)[:,None]*dx + 0.2*dx*(np.random.random((n+1,n+1))-0.5), 3)
+    shapes = [shapely.geometry.Polygon([(x[j,i], y[j,i]), (x[j,i+1], y[j,i+1]),
+                                        (x[j+1,i+1], y[j+1,i+1]), (x[j+1,i], y[j+1,i])])
+              for j in range(n) for i in range(n)]
+    rivers = [shapely.geometry.LineString([((i+0.3)*dx, (j+0.5)*dx), ((i+0.7)*dx, (j+0.5)*dx)])
+              for j in range(n) for i in range(n)]
+    return workflow.split_hucs.SplitHUCs(shapes), workflow.hydrography.make_global_tree(rivers)
+
+
+def check(points, tris, area, max_area):
+    coords = np.zeros((len(points),3),'d')
+    coords[:,0:2] = points
+    areas = workflow.connectivity.signed_areas(coords, tris)
+    loops = workflow.extrude.Mesh2D(coords, tris).boundary_loops()
+    return (np.isclose(areas.sum(), area) and areas.max() <= max_area and len(loops) == 1)
+
+
+def bench(n, max_area, nprocs_list):
+    hucs, rivers = grid_hucs(n)
+    area = hucs.exterior().area
+    refine = workflow.triangulation.refine_from_max_area(max_area)
+    edge_length = np.sqrt(4 / np.sqrt(3) * max_area)
+
+    t0 = time.perf_counter()
+    points, tris = workflow.triangulation.triangulate(hucs, rivers, refinement_func=refine)
+    t_serial = time.perf_counter() - t0
+    assert(check(points, tris, area, max_area))
+    print('{:>5d} HUCs: single Triangle call {:8.3f}s, {:>8d} triangles'.format(n*n, t_serial, len(tris)))
+
+    for nprocs in nprocs_list:
+        t0 = time.perf_counter()
+        points, tris = workflow.triangulation.triangulate_parallel(hucs, rivers, nprocs, edge_length,
+                                                                   refinement_func=refine)
+        t_parallel = time.perf_counter() - t0
+        valid = check(points, tris, area, max_area)
+        print('{:>5d} HUCs: {:>3d} processes {:8.3f}s ({:5.2f}x), {:>8d} triangles, valid = {}'.format(
+            n*n, nprocs, t_parallel, t_serial/t_parallel, len(tris), valid))
+        assert(valid)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    max_area = 500.
+    if '--max-area' in args:
+        i = args.index('--max-area')
+        max_area = float(args[i+1])
+        args = args[:i] + args[i+2:]
+    nprocs_list = None
+    if '--nprocs' in args:
+        i = args.index('--nprocs')
+        nprocs_list = [int(a) for a in args[i+1:]]
+        args = args[:i]
+    if nprocs_list is None:
+        ncores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        nprocs_list = [1,]
+        while nprocs_list[-1]*2 <= ncores:
+            nprocs_list.append(nprocs_list[-1]*2)
+        if nprocs_list[-1] != ncores:
+            nprocs_list.append(ncores)
+    n = int(args[0]) if len(args) > 0 else 8
+    bench(n, max_area, nprocs_list)
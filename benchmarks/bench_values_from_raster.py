@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Benchmarks piecewise bilinear raster sampling.
+
+Compares the original pointwise loop from workflow.hilev to the
+array-based engine in workflow.interpolate, checking that the two are
+bitwise identical.
+
+Usage: python benchmarks/bench_values_from_raster.py [n_points ...]
+"""
+
+import sys
+import math
+import time
+import numpy as np
+import rasterio.transform
+
+import workflow.interpolate
+
+
+def values_from_raster_loop(points, raster, raster_profile):
+    """The original, pointwise piecewise bilinear algorithm."""
+    eps = 1.e-10
+    invtransform = ~raster_profile['transform']
+    mybox = np.zeros((2,2),'d')
+    values = np.zeros((len(points),),'d')
+    for k,xy in enumerate(points):
+        xy = tuple(xy)
+        j,i = invtransform * xy
+
+        # center on pixel
+        i -= 0.5
+        j -= 0.5
+
+        i = max(eps, min(raster_profile['height']-1-eps, i))
+        j = max(eps, min(raster_profile['width']-1-eps, j))
+
+        mybox[0,0] = raster[math.floor(i), math.floor(j)]
+        mybox[0,1] = raster[math.floor(i), math.ceil(j)]
+        mybox[1,0] = raster[math.ceil(i), math.floor(j)]
+        mybox[1,1] = raster[math.ceil(i), math.ceil(j)]
+        ii = i%1
+        jj = j%1
+
+        up = mybox[0,0] + jj * (mybox[0,1] - mybox[0,0])
+        dn = mybox[1,0] + jj * (mybox[1,1] - mybox[1,0])
+        values[k] = up + (dn - up) * ii
+    return values
+
+
+def bench(n_points, shape=(2000,2000), dx=30.):
+    np.random.seed(0)
+    raster = np.random.random(shape).astype(np.float32) * 1000
+    transform = rasterio.transform.from_origin(500000., 4000000., dx, dx)
+    profile = {'transform':transform, 'height':shape[0], 'width':shape[1]}
+
+    x = 500000. + np.random.random(n_points) * dx * shape[1]
+    y = 4000000. - np.random.random(n_points) * dx * shape[0]
+    points = np.array([x,y]).transpose()
+
+    t0 = time.perf_counter()
+    v_loop = values_from_raster_loop(points, raster, profile)
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    v_array = workflow.interpolate.interpolate(points, raster, transform)
+    t_array = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    workflow.interpolate.interpolate(points, raster, transform, 'piecewise bicubic')
+    t_cubic = time.perf_counter() - t0
+
+    identical = np.array_equal(v_loop, v_array)
+    print('{:>10d} points: loop {:8.3f}s, bilinear {:8.4f}s ({:6.0f}x), bicubic {:8.4f}s, identical = {}'.format(
+        n_points, t_loop, t_array, t_loop/t_array, t_cubic, identical))
+    assert(identical)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sizes = [int(n) for n in sys.argv[1:]]
+    else:
+        sizes = [10**3, 10**4, 10**5, 10**6]
+    for n in sizes:
+        bench(n)
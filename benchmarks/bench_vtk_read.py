@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Benchmarks reading large surface meshes from legacy VTK files.
+
+Writes a structured triangulation of an n-by-n grid with
+workflow_tpls.vtk_io, then compares the original reader, which finds
+cell offsets with a Python loop and gathers each cell separately, to
+vtk_io.read_buffer_flat and Mesh2D.read_VTK, checking that both read
+the same points and cells.
+
+Usage: python benchmarks/bench_vtk_read.py [n_grid ...] [--ascii]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+from workflow_tpls import vtk_io
+import workflow.extrude
+
+
+def grid_surface(n):
+    """Points and triangles of an n x n grid, two triangles per cell."""
+    x, y = np.meshgrid(np.arange(n+1, dtype='d'), np.arange(n+1, dtype='d'))
+    points = np.stack([x.ravel(), y.ravel(), np.sin(x.ravel())], axis=1)
+    corner = (np.arange(n)[None,:] + (n+1)*np.arange(n)[:,None]).ravel()
+    tris = np.concatenate([np.stack([corner, corner+1, corner+n+2], axis=1),
+                           np.stack([corner, corner+n+2, corner+n+1], axis=1)])
+    return points, tris
+
+
+def read_legacy(filename):
+    """The original reading of POINTS, CELLS and CELL_TYPES."""
+    with open(filename, 'rb') as f:
+        f.readline()
+        f.readline()
+        is_ascii = f.readline().decode('utf-8').strip() == 'ASCII'
+        while True:
+            line = f.readline().decode('utf-8')
+            if not line:
+                break
+            split = line.strip().split()
+            if len(split) == 0:
+                continue
+            if split[0] == 'POINTS':
+                num_points = int(split[1])
+                if is_ascii:
+                    points = np.fromfile(f, count=num_points*3, sep=' ', dtype='d')
+                else:
+                    points = np.fromstring(f.read(num_points*3*8), dtype='>f8')
+                    f.readline()
+                points = points.reshape((num_points, 3))
+            elif split[0] == 'CELLS':
+                num_items = int(split[2])
+                if is_ascii:
+                    c = np.fromfile(f, count=num_items, sep=' ', dtype=int)
+                else:
+                    c = np.fromstring(f.read(num_items*4), dtype='>i4')
+                    f.readline()
+                offsets = []
+                if len(c) > 0:
+                    offsets.append(0)
+                    while offsets[-1] + c[offsets[-1]] + 1 < len(c):
+                        offsets.append(offsets[-1] + c[offsets[-1]] + 1)
+                offsets = np.array(offsets)
+            elif split[0] == 'CELL_TYPES':
+                num_items = int(split[1])
+                if is_ascii:
+                    ct = np.fromfile(f, count=num_items, sep=' ', dtype=int)
+                else:
+                    ct = np.fromstring(f.read(num_items*4), dtype='>i4')
+                    f.readline()
+
+    cells = {}
+    for tpe in np.unique(ct):
+        b = np.where(ct == tpe)[0]
+        n = c[offsets[b[0]]]
+        indices = np.array([np.arange(1, n+1) + o for o in offsets[b]])
+        cells[vtk_io.vtk_to_meshio_type[tpe]] = c[indices]
+    return points, cells
+
+
+def bench(n, binary, compare=True):
+    points, tris = grid_surface(n)
+    fd, filename = tempfile.mkstemp(suffix='.vtk')
+    os.close(fd)
+    try:
+        vtk_io.write(filename, points, {'triangle':tris}, write_binary=binary)
+
+        t0 = time.perf_counter()
+        with open(filename, 'rb') as fid:
+            flat = vtk_io.read_buffer_flat(fid)
+        t_flat = time.perf_counter() - t0
+        assert(np.array_equal(flat[0], points))
+        assert(np.array_equal(flat[2].reshape(-1,3), tris))
+
+        t0 = time.perf_counter()
+        m2 = workflow.extrude.Mesh2D.read_VTK(filename)
+        t_mesh = time.perf_counter() - t0
+        assert(np.array_equal(m2.conn, tris))
+
+        if compare:
+            t0 = time.perf_counter()
+            legacy = read_legacy(filename)
+            t_legacy = time.perf_counter() - t0
+            identical = np.array_equal(legacy[0], flat[0]) and \
+                np.array_equal(legacy[1]['triangle'], flat[2].reshape(-1,3))
+            print('{:>9d} triangles, {}: legacy {:8.3f}s, flat {:7.3f}s ({:6.1f}x), Mesh2D {:7.3f}s, identical = {}'.format(
+                len(tris), 'binary' if binary else 'ASCII', t_legacy, t_flat, t_legacy/t_flat, t_mesh, identical))
+            assert(identical)
+        else:
+            print('{:>9d} triangles, {}: flat {:7.3f}s, Mesh2D {:7.3f}s'.format(
+                len(tris), 'binary' if binary else 'ASCII', t_flat, t_mesh))
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    binary = '--ascii' not in args
+    args = [a for a in args if a != '--ascii']
+    if len(args) > 0:
+        sizes = [int(n) for n in args]
+    else:
+        sizes = [100, 500, 1000, 2000]
+    for n in sizes:
+        bench(n, binary, n <= 1000)
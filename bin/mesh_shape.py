@@ -64,8 +64,7 @@ def mesh_shapes(args):
                                                    enforce_delaunay=args.enforce_delaunay)
 
     # elevate to 3D
-    dem_profile, dem = workflow.get_raster_on_shape(sources['DEM'], shapes.exterior(), crs)
-    mesh_points3 = workflow.elevate(mesh_points2, crs, dem, dem_profile)
+    mesh_points3 = workflow.elevate_from_source(mesh_points2, crs, sources['DEM'])
 
     return shapes, rivers, (mesh_points3, mesh_tris)
 
@@ -1,7 +1,11 @@
+import heapq
+import collections
 import numpy as np
 import attr
 import sortedcontainers
 
+import workflow.connectivity
+
 @attr.s
 class Point:
     """POD struct that stores coords, a np array of length 3 (x,y,z) and neighbors, 
@@ -149,7 +153,111 @@ def condition3(points, outletID):
                     
         
 
-def condition(mesh, outlet=None, algorithm=3):
+def node_adjacency(conn, num_nodes):
+    """Generates a CSR node-to-node adjacency from cell-to-node connectivity.
+
+    Two nodes are neighbors if they share a cell, matching
+    points_from_mesh().
+
+    Inputs:
+      conn      | cell-to-node connectivity, either a list of lists, a
+                | (NCELLS, NNODES_PER_CELL) integer array, or a
+                | workflow.connectivity.CSR
+      num_nodes | number of nodes in the mesh
+
+    Returns (indptr, indices), where the neighbors of node i are
+    indices[indptr[i]:indptr[i+1]].
+    """
+    if type(conn) is np.ndarray:
+        groups = [conn,]
+    elif isinstance(conn, workflow.connectivity.CSR):
+        groups = [cells.astype(np.int64) for rows, cells in conn.by_length()]
+    else:
+        # group cells by their number of nodes
+        by_size = dict()
+        for c in conn:
+            by_size.setdefault(len(c), []).append(c)
+        groups = [np.array(cells, dtype=np.int64) for cells in by_size.values()]
+
+    rows = []
+    cols = []
+    for cells in groups:
+        k = cells.shape[1]
+        for a in range(k):
+            for b in range(k):
+                if a != b:
+                    rows.append(cells[:,a])
+                    cols.append(cells[:,b])
+
+    if len(rows) == 0:
+        return np.zeros((num_nodes+1,), np.int64), np.zeros((0,), np.int64)
+
+    # unique (row, col) pairs, sorted by row
+    keys = np.unique(np.concatenate(rows).astype(np.int64) * num_nodes + np.concatenate(cols))
+    indices = keys % num_nodes
+    indptr = np.zeros((num_nodes+1,), np.int64)
+    np.cumsum(np.bincount(keys // num_nodes, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices
+
+
+def condition4(elev, adjacency, outletID):
+    """Conditions a mesh, in place, by removing pits.
+
+    Inputs:
+      elev      | np array of node elevations, modified in place
+      adjacency | (indptr, indices) CSR node adjacency, from node_adjacency()
+      outletID  | ID of the outlet
+
+    This is the boundary marching method of condition3(), also known
+    as priority-flood, working on arrays: the boundary is a binary
+    heap and membership is tracked in a boolean array, so each node
+    is pushed and popped exactly once.  Memory is O(n).
+    """
+    indptr, indices = adjacency
+    num_nodes = len(elev)
+
+    # lists are much faster than numpy arrays for scalar access
+    z = elev.tolist()
+    indptr_l = indptr.tolist()
+    indices_l = indices.tolist()
+
+    # a node is queued once it enters the boundary, and stays so
+    queued = bytearray(num_nodes)
+    queued[outletID] = 1
+    boundary = [(z[outletID], outletID),]
+    count = 0
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+
+    # Nodes that get raised sit exactly at the current waterway
+    # elevation, which is no higher than anything in the boundary, so
+    # they can skip the heap and go in a plain FIFO "pit" queue.
+    pits = collections.deque()
+
+    while boundary or pits:
+        # pop the lowest boundary point and stick it in the waterway,
+        # raising any new neighbors to at least this elevation
+        if pits:
+            current = pits.popleft()
+            waterway_max = z[current]
+        else:
+            waterway_max, current = heappop(boundary)
+        count += 1
+        for n in indices_l[indptr_l[current]:indptr_l[current+1]]:
+            if not queued[n]:
+                queued[n] = 1
+                if z[n] <= waterway_max:
+                    z[n] = waterway_max
+                    pits.append(n)
+                else:
+                    heappush(boundary, (z[n], n))
+
+    assert(count == num_nodes)
+    elev[:] = z
+    return
+
+
+def condition(mesh, outlet=None, algorithm=4):
     """Condition a 2D mesh, in place.
     
     Starts at outlet, if not provided, this defaults to the lowpoint on the boundary.
@@ -158,12 +266,21 @@ def condition(mesh, outlet=None, algorithm=3):
      1: original, 2-pass algorithm
      2: refactored single-pass algorithm based on sorted lists
      3: boundary marching method.  Should be fastest, and likely equivalent?
+     4: boundary marching method on arrays.  Same result as 3, much faster
+        and with far less memory.
     """
-    points_dict = points_from_mesh(mesh)
     if outlet is None:
         boundary_nodes = mesh.boundary_nodes()
         outlet = boundary_nodes[np.argmin(mesh.coords[boundary_nodes,2])]
 
+    if algorithm == 4:
+        adjacency = node_adjacency(mesh.conn, mesh.num_nodes())
+        elev = mesh.coords[:,2].copy()
+        condition4(elev, adjacency, outlet)
+        mesh.coords[:,2] = elev
+        return
+
+    points_dict = points_from_mesh(mesh)
     if algorithm == 1:
         condition1(points_dict, outlet)
     elif algorithm == 2:
@@ -174,4 +291,3 @@ def condition(mesh, outlet=None, algorithm=3):
         raise RuntimeError('Unknown algorithm "%r"'%(algorithm))
 
     mesh.points = np.array([p.coords for p in points_dict.values()])
-    
@@ -0,0 +1,369 @@
+"""Compact, array-based storage of mesh connectivity.
+
+Mesh connectivity -- cell-to-node, face-to-node, or cell-to-face -- is a
+ragged list of lists of integers.  CSR stores it as two flat arrays:
+indices, all rows concatenated, and offsets, of length n_rows+1, so
+that row i is indices[offsets[i]:offsets[i+1]].  This uses a fraction
+of the memory of lists of lists and allows whole-mesh operations to be
+done with a few array operations.
+
+CSR objects also behave as a read-only sequence of rows, where each row
+is a list of ints, so code written for lists of lists keeps working.
+"""
+
+import numpy as np
+
+
+def index_dtype(n):
+    """Smallest of int32/int64 that can hold indices up to n."""
+    if n < 2**31:
+        return np.int32
+    return np.int64
+
+
+class CSR(object):
+    """Ragged rows of integers, stored as offsets and indices arrays."""
+    def __init__(self, offsets, indices):
+        """Creates from offsets, of length n_rows+1, and indices."""
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.indices = np.asarray(indices)
+        assert(len(self.offsets.shape) == 1 and len(self.indices.shape) == 1)
+        assert(len(self.offsets) > 0 and self.offsets[0] == 0)
+        assert(self.offsets[-1] == len(self.indices))
+
+    @classmethod
+    def from_lists(cls, lists):
+        """Creates from a list of lists."""
+        lengths = np.array([len(l) for l in lists], dtype=np.int64)
+        offsets = np.zeros((len(lengths)+1,), np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if offsets[-1] > 0:
+            indices = np.fromiter((i for l in lists for i in l), dtype=np.int64, count=offsets[-1])
+        else:
+            indices = np.zeros((0,), np.int64)
+        return cls(offsets, indices.astype(index_dtype(indices.max(initial=0)+1)))
+
+    @classmethod
+    def from_array(cls, array):
+        """Creates from a fixed-width, (n_rows, width) array."""
+        array = np.asarray(array)
+        assert(len(array.shape) == 2)
+        n, width = array.shape
+        return cls(np.arange(0, n*width+1, width, dtype=np.int64), array.ravel())
+
+    @classmethod
+    def from_lengths(cls, lengths, indices):
+        """Creates from the length of each row and indices."""
+        lengths = np.asarray(lengths)
+        offsets = np.zeros((len(lengths)+1,), np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets, indices)
+
+    @classmethod
+    def from_any(cls, conn):
+        """Converts a CSR, fixed-width array, or list of lists to CSR."""
+        if isinstance(conn, cls):
+            return conn
+        if isinstance(conn, np.ndarray) and len(conn.shape) == 2:
+            return cls.from_array(conn)
+        return cls.from_lists(conn)
+
+    @classmethod
+    def concatenate(cls, csrs):
+        """Stacks the rows of several CSRs."""
+        csrs = list(csrs)
+        lengths = np.concatenate([c.lengths() for c in csrs])
+        return cls.from_lengths(lengths, np.concatenate([c.indices for c in csrs]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """Row i, as a list."""
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("CSR row index out of range")
+        return self.indices[self.offsets[i]:self.offsets[i+1]].tolist()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.indices[self.offsets[i]:self.offsets[i+1]].tolist()
+
+    def lengths(self):
+        """Number of entries in each row."""
+        return np.diff(self.offsets)
+
+    def row_ids(self):
+        """The row of each entry in indices."""
+        return np.repeat(np.arange(len(self), dtype=index_dtype(len(self))), self.lengths())
+
+    def take(self, rows):
+        """A new CSR of the given rows, in the given order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.offsets[rows+1] - self.offsets[rows]
+        offsets = np.zeros((len(rows)+1,), np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # position of each new entry in the old indices
+        positions = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1] - self.offsets[rows], lengths)
+        return CSR(offsets, self.indices[positions])
+
+    def map(self, new_ids):
+        """A new CSR with each index i replaced by new_ids[i]."""
+        return CSR(self.offsets, np.asarray(new_ids)[self.indices])
+
+    def is_uniform(self):
+        """True if all rows have the same length."""
+        return len(self) == 0 or bool(np.all(self.lengths() == self.offsets[1]))
+
+    def to_array(self):
+        """The (n_rows, width) array of a uniform CSR."""
+        if not self.is_uniform():
+            raise ValueError("CSR rows are not all the same length")
+        width = 0 if len(self) == 0 else int(self.offsets[1])
+        return self.indices.reshape(len(self), width)
+
+    def tolist(self):
+        """Rows as a list of lists."""
+        return list(iter(self))
+
+    def by_length(self):
+        """Generates (rows, array) for each distinct row length, where
+        array is the (len(rows), length) array of those rows."""
+        lengths = self.lengths()
+        if self.is_uniform():
+            if len(self) > 0:
+                yield np.arange(len(self)), self.to_array()
+            return
+        for length in np.nonzero(np.bincount(lengths))[0]:
+            rows = np.nonzero(lengths == length)[0]
+            yield rows, self.take(rows).indices.reshape(-1, length)
+
+    def has_duplicates(self):
+        """True if any row contains the same index more than once."""
+        for rows, array in self.by_length():
+            array = np.sort(array, axis=1)
+            if np.any(array[:,1:] == array[:,:-1]):
+                return True
+        return False
+
+    def next_positions(self):
+        """For each entry, the position of the next entry around its row."""
+        rows = self.row_ids()
+        nxt = np.arange(1, len(self.indices)+1, dtype=np.int64)
+        last = nxt == self.offsets[1:][rows]
+        nxt[last] = self.offsets[:-1][rows[last]]
+        return nxt
+
+    def reverse_rows(self, rows):
+        """Reverses, in place, the order of the given rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        lengths = self.offsets[rows+1] - self.offsets[rows]
+        starts = np.repeat(self.offsets[rows], lengths)
+        ends = np.repeat(self.offsets[rows+1]-1, lengths)
+        local = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        self.indices[starts + local] = self.indices[ends - local]
+
+
+def signed_areas(coords, conn):
+    """Signed area of each cell, positive for counter-clockwise cells.
+
+    Parameters
+    ----------
+    coords : np.array((n_nodes, dim), float)
+        Node coordinates; only x and y are used.
+    conn : CSR, np.array((n_cells, width), int), or list of lists
+        Cell-to-node connectivity.
+
+    Returns
+    -------
+    np.array((n_cells,), float)
+
+    Triangles are done with a single cross product per cell, other
+    fixed-width cells with the shoelace formula along each row, and
+    mixed polygons with the shoelace formula summed per row of a CSR.
+    """
+    x = coords[:,0]
+    y = coords[:,1]
+    if isinstance(conn, np.ndarray) and len(conn.shape) == 2:
+        if conn.shape[1] == 3:
+            x0, y0 = x[conn[:,0]], y[conn[:,0]]
+            return 0.5 * ((x[conn[:,1]] - x0) * (y[conn[:,2]] - y0)
+                          - (x[conn[:,2]] - x0) * (y[conn[:,1]] - y0))
+        nxt = np.roll(conn, -1, axis=1)
+        return 0.5 * np.sum(x[conn]*y[nxt] - x[nxt]*y[conn], axis=1)
+
+    conn = CSR.from_any(conn)
+    nxt = conn.indices[conn.next_positions()]
+    cross = x[conn.indices]*y[nxt] - x[nxt]*y[conn.indices]
+    return 0.5 * np.bincount(conn.row_ids(), weights=cross, minlength=len(conn))
+
+
+def reverse_cells(conn, cells):
+    """Reverses, in place, the node order of the given cells.
+
+    conn may be a CSR, a fixed-width array, or a list of lists.
+    """
+    if isinstance(conn, CSR):
+        conn.reverse_rows(cells)
+    elif isinstance(conn, np.ndarray):
+        conn[cells] = conn[cells,::-1]
+    else:
+        for c in cells:
+            conn[c].reverse()
+
+
+def orient(coords, conn):
+    """Reverses, in place, all clockwise cells so that every cell is
+    counter-clockwise.  Returns the reversed cells."""
+    cells = np.nonzero(signed_areas(coords, conn) < 0)[0]
+    if len(cells) > 0:
+        reverse_cells(conn, cells)
+    return cells
+
+
+def edge_topology(conn, num_nodes):
+    """Finds the unique edges of a polygonal mesh.
+
+    Parameters
+    ----------
+    conn : CSR
+        Cell-to-node connectivity.
+    num_nodes : int
+        Number of nodes in the mesh.
+
+    Returns
+    -------
+    edge_ids : np.array((len(conn.indices),), int)
+        For each entry of conn, the id of the edge from that node to
+        the next node around the cell.
+    edges : np.array((n_edges, 2), int)
+        The two nodes of each edge, sorted.
+    counts : np.array((n_edges,), int)
+        The number of cells sharing each edge.
+
+    Edges are numbered in order of first appearance in conn.
+    """
+    n0 = conn.indices.astype(np.int64)
+    n1 = n0[conn.next_positions()]
+    keys = np.minimum(n0, n1) * num_nodes + np.maximum(n0, n1)
+    unique, first, inverse, counts = np.unique(keys, return_index=True,
+                                               return_inverse=True, return_counts=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    edges = np.stack([unique[order] // num_nodes, unique[order] % num_nodes], axis=1)
+    return rank[inverse.ravel()], edges, counts[order]
+
+
+class EdgeTopology(object):
+    """Unique edges of a polygonal mesh, with their cells and boundary.
+
+    Attributes
+    ----------
+    conn : CSR
+        Cell-to-node connectivity the topology was built from.
+    edge_ids : np.array((len(conn.indices),), int)
+        For each entry of conn, the id of the edge from that node to
+        the next node around the cell.
+    edges : np.array((n_edges, 2), int)
+        The two nodes of each edge, sorted.
+    counts : np.array((n_edges,), int)
+        The number of cells sharing each edge.
+    edge_cells : CSR
+        The cells sharing each edge, in increasing order.
+    boundary : np.array((n_boundary_edges,), int)
+        Ids of the edges in exactly one cell.
+
+    See edge_topology() for the edge numbering.
+    """
+    def __init__(self, conn, num_nodes):
+        self.conn = conn
+        self.edge_ids, self.edges, self.counts = edge_topology(conn, num_nodes)
+        self._entries = np.argsort(self.edge_ids, kind='stable')
+        self.edge_cells = CSR.from_lengths(self.counts, conn.row_ids()[self._entries])
+        self.boundary = np.nonzero(self.counts == 1)[0]
+        self._loops = None
+
+    def __len__(self):
+        return len(self.edges)
+
+    def boundary_directed(self):
+        """Boundary edges, (n_boundary_edges, 2), ordered as in their cell."""
+        first = self.edge_cells.offsets[self.boundary]
+        entries = self._entries[first]
+        cells = self.edge_cells.indices[first]
+        nxt = entries + 1
+        wrap = nxt == self.conn.offsets[cells+1]
+        nxt[wrap] = self.conn.offsets[cells[wrap]]
+        return np.stack([self.conn.indices[entries], self.conn.indices[nxt]], axis=1)
+
+    def boundary_nodes(self):
+        """Sorted nodes on any boundary edge."""
+        return np.unique(self.edges[self.boundary])
+
+    def boundary_loops(self):
+        """Boundary edges, ordered into closed loops.
+
+        Returns
+        -------
+        loops : list(np.array((n, 2), int))
+            The edges of each loop, in order around it.  Each loop is
+            traversed in the direction of its first edge in that edge's
+            cell, so for counter-clockwise cells the mesh is to the left
+            of every loop: outer boundaries are counter-clockwise and
+            holes are clockwise.  Each loop starts at its smallest node,
+            and loops are ordered by that node.
+
+        Every boundary edge is visited once, so this is linear in the
+        number of boundary edges.  Where loops touch at a node, the
+        edge continuing in the direction of its cell is preferred.
+        """
+        if self._loops is not None:
+            return self._loops
+
+        directed = self.boundary_directed()
+        nb = len(directed)
+        if nb == 0:
+            self._loops = []
+            return self._loops
+
+        # boundary edges incident to each boundary node, as CSR
+        nodes, ends = np.unique(directed.ravel(), return_inverse=True)
+        ends = ends.reshape(-1,2)
+        incident = np.argsort(ends.ravel(), kind='stable') // 2
+        offsets = np.zeros((len(nodes)+1,), np.int64)
+        np.cumsum(np.bincount(ends.ravel(), minlength=len(nodes)), out=offsets[1:])
+
+        start = ends[:,0].tolist()
+        finish = ends[:,1].tolist()
+        incident = incident.tolist()
+        offsets = offsets.tolist()
+        used = [False,]*nb
+
+        loops = []
+        for seed in np.argsort(ends.min(axis=1), kind='stable').tolist():
+            if used[seed]:
+                continue
+            used[seed] = True
+            loop = [(start[seed], finish[seed]),]
+            current = finish[seed]
+            while current != start[seed]:
+                candidates = [e for e in incident[offsets[current]:offsets[current+1]] if not used[e]]
+                if len(candidates) == 0:
+                    raise RuntimeError("Mesh boundary is not closed at node %i"%nodes[current])
+                forward = [e for e in candidates if start[e] == current]
+                e = forward[0] if len(forward) > 0 else candidates[0]
+                used[e] = True
+                other = finish[e] if start[e] == current else start[e]
+                loop.append((current, other))
+                current = other
+
+            loop = nodes[np.array(loop)]
+            loop = np.roll(loop, -int(np.argmin(loop[:,0])), axis=0)
+            loops.append(loop)
+
+        self._loops = loops
+        return loops
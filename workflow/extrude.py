@@ -16,10 +16,31 @@ your PYTHONPATH.
 import numpy as np
 import collections
 import logging
-import exodus
+
+import workflow.connectivity
 
 def _list_or_array(obj):
     return type(obj) == list or type(obj) == np.ndarray
+
+def _first_uses(indices):
+    """Unique entries of indices, in order of first appearance."""
+    unique, first = np.unique(indices, return_index=True)
+    return unique[np.argsort(first)]
+
+def _as_csr(conn):
+    """CSR view of array or CSR connectivity, or None for lists of lists."""
+    if isinstance(conn, workflow.connectivity.CSR):
+        return conn
+    if type(conn) is np.ndarray and len(conn.shape) == 2:
+        return workflow.connectivity.CSR.from_array(conn)
+    return None
+
+def _validate_csr(conn, size):
+    """Checks a CSR connectivity indexes into [0,size) with no repeats."""
+    if len(conn.indices) > 0:
+        assert conn.indices.min() >= 0
+        assert conn.indices.max() < size
+    assert not conn.has_duplicates()
     
 
 class SideSet(object):
@@ -55,9 +76,13 @@ class Mesh2D(object):
         coords          | numpy array of shape (NCOORDS, NDIMS)
         connectivity    | list of lists of integer indices into coords specifying a
                         | (clockwise OR counterclockwise) ordering of the nodes around
-                        | the 2D cell
+                        | the 2D cell, or equivalently an integer array of shape
+                        | (NCELLS, NNODES_PER_CELL) or a workflow.connectivity.CSR
         labeled_sets    | list of LabeledSet objects
 
+        Array and CSR connectivity are kept as is, and all checks on
+        them are done with array operations.
+
         Note: coords, connectivity is the output provided by a
         workflow.triangulation.triangulate() call.
         """
@@ -75,30 +100,39 @@ class Mesh2D(object):
             self.labeled_sets = []
 
         self.validate()
-        self.edge_counts()
         if check_handedness:
             self.check_handedness()
+        self.edge_topology()
 
     def validate(self):
         """Checks the validity of the mesh, or throws an AssertionError."""
         assert self.coords.shape[1] == 2 or self.coords.shape[1] == 3
-        assert(_list_or_array(self.conn))
-        for f in self.conn:
-            assert(_list_or_array(f))
-            assert len(set(f)) == len(f)
-            for i in f:
-                assert i < self.coords.shape[0]
+        conn = _as_csr(self.conn)
+        if conn is not None:
+            _validate_csr(conn, self.coords.shape[0])
+        else:
+            assert(_list_or_array(self.conn))
+            for f in self.conn:
+                assert(_list_or_array(f))
+                assert len(set(f)) == len(f)
+                for i in f:
+                    assert i < self.coords.shape[0]
 
         for ls in self.labeled_sets:
             if ls.entity == "NODE":
                 size = len(self.coords)
             elif ls.entity == "CELL":
                 size = len(self.conn)
-
-            for i in ls.ent_ids:
-                assert i < size
+            assert np.all(ls.ent_ids < size)
         return True
 
+    def conn_csr(self):
+        """Cell-to-node connectivity as a workflow.connectivity.CSR."""
+        conn = _as_csr(self.conn)
+        if conn is None:
+            conn = workflow.connectivity.CSR.from_lists(self.conn)
+        return conn
+
     def num_cells(self):
         return len(self.conn)
 
@@ -106,7 +140,7 @@ class Mesh2D(object):
         return self.coords.shape[0]
 
     def num_edges(self):
-        return len(self.edges())
+        return len(self.edge_counts())
 
     @staticmethod
     def edge_hash(i,j):
@@ -116,62 +150,70 @@ class Mesh2D(object):
     def edges(self):
         return self.edge_counts().keys()
 
+    def edge_topology(self):
+        """Unique edges, their cells, and the boundary, as a
+        workflow.connectivity.EdgeTopology.  This is computed once and
+        cached on the mesh."""
+        try:
+            return self._topology
+        except AttributeError:
+            self._topology = workflow.connectivity.EdgeTopology(self.conn_csr(), self.num_nodes())
+        return self._topology
+
     def edge_counts(self):
+        """Counter of the number of cells sharing each edge, keyed by edge_hash."""
         try:
             return self._edges
         except AttributeError:
-            self._edges = collections.Counter(self.edge_hash(f[i], f[(i+1)%len(f)]) for f in self.conn for i in range(len(f)))
+            topology = self.edge_topology()
+            self._edges = collections.Counter(dict(zip(map(tuple, topology.edges.tolist()),
+                                                       topology.counts.tolist())))
         return self._edges
 
+    def boundary_loops(self):
+        """All boundary loops, outer boundaries and holes, as a list of
+        (n,2) arrays of edges ordered around each loop.  See
+        workflow.connectivity.EdgeTopology.boundary_loops()."""
+        return self.edge_topology().boundary_loops()
+
     def boundary_edges(self):
-        """Return edges in the boundary of the mesh, ordered around the boundary."""
-        be = sorted([k for (k,count) in self.edge_counts().items() if count == 1], key=lambda a : a[0])
-        seed = be.pop(0)
-        be_ordered = [seed,]
+        """Return edges in the boundary of the mesh, ordered around the boundary.
 
-        done = False
-        while not done:
-            try:
-                new_e = next( e for e in be if e[0] == be_ordered[-1][1])
-                be.remove(new_e)
-            except StopIteration:
-                new_e = next( e for e in be if e[1] == be_ordered[-1][1])
-                be.remove(new_e)
-                new_e = list(reversed(new_e))
-
-            be_ordered.append(new_e)
-            done = len(be) == 0
-        assert(be_ordered[-1][-1] == be_ordered[0][0])
-        return be_ordered
+        The boundary is traversed counter-clockwise, starting at its
+        lowest-numbered node.  Before boundary_loops(), the direction
+        from that node was arbitrary, so boundary_nodes() may come out
+        reversed compared to older versions.
+
+        If the mesh has holes or several disconnected pieces, this is
+        the loop enclosing the largest area; use boundary_loops() for
+        all of them.
+        """
+        loops = self.boundary_loops()
+        xy = self.coords[:,0:2]
+        areas = [np.sum(xy[l[:,0],0]*xy[l[:,1],1] - xy[l[:,1],0]*xy[l[:,0],1]) for l in loops]
+        return [tuple(e) for e in loops[int(np.argmax(np.abs(areas)))].tolist()]
 
     def boundary_nodes(self):
         return [e[0] for e in self.boundary_edges()]
-        
-        
-    
+
     def check_handedness(self):
         """Ensures all cells are oriented via the right-hand-rule, i.e. in the +z direction."""
-        for conn in self.conn:
-            points = np.array([self.coords[c] for c in conn])
-            cross = 0
-            for i in range(len(points)):
-                im = i - 1
-                ip = i + 1
-                if ip == len(points):
-                    ip = 0
-
-                p = points[ip] - points[i]
-                m = points[i] - points[im]
-                cross = cross + p[1] * m[0] - p[0] * m[1]
-            if cross < 0:
-                conn.reverse()
+        reverse = workflow.connectivity.orient(self.coords, self.conn)
+        if len(reverse) == 0:
+            return
+
+        # reversing cells renumbers edges and flips the boundary
+        for cached in ['_topology', '_edges']:
+            self.__dict__.pop(cached, None)
 
     def centroids(self):
         """Calculate surface mesh centroids."""
+        conn = self.conn_csr()
+        rows = conn.row_ids()
+        lengths = conn.lengths()
         result = np.zeros((self.num_cells(),3),'d')
-        for c, conn in enumerate(self.conn):
-            points = np.array([self.coords[c] for c in conn])
-            result[c,:] = points.mean(axis=0)
+        for d in range(self.dim):
+            result[:,d] = np.bincount(rows, weights=self.coords[conn.indices,d], minlength=len(conn)) / lengths
         return result
     
     def plot(self, color=None, ax=None):
@@ -192,127 +234,52 @@ class Mesh2D(object):
         ax.add_collection(gons)
         ax.autoscale_view()
 
-    def write_VTK(self, filename):
-        """Writes to VTK."""
-        assert(all(len(c) == 3 for c in self.conn))
+    def write_VTK(self, filename, write_binary=True):
+        """Writes to VTK, as triangles, quads, or general polygons."""
         from workflow_tpls import vtk_io
-        vtk_io.write(filename, self.coords, {'triangle':np.array(self.conn)})
+        conn = self.conn_csr()
+        lengths = conn.lengths()
+        types = np.full((len(conn),), vtk_io.meshio_to_vtk_type['polygon'], np.int32)
+        types[lengths == 3] = vtk_io.meshio_to_vtk_type['triangle']
+        types[lengths == 4] = vtk_io.meshio_to_vtk_type['quad']
+        vtk_io.write_flat(filename, self.coords, conn.offsets, conn.indices, types,
+                          write_binary=write_binary)
         
 
     @classmethod
     def read_VTK(cls, filename):
-        """Constructor from a VTK file."""
-        try:
-            return cls.read_VTK_Simplices(filename)
-        except AssertionError:
-            return cls.read_VTK_Unstructured(filename)
-        
-    @classmethod
-    def read_VTK_Unstructured(cls, filename):
-        """Constructor from an unstructured VTK file."""
-        with open(filename,'rb') as fid:
-            points_found = False
-            polygons_found = False
-            while True:
-                line = fid.readline().decode('utf-8')
-                if not line:
-                    # EOF
-                    break
-
-                line = line.strip()
-                if len(line) == 0:
-                    continue
-
-                split = line.split()
-                section = split[0]
-
-                if section == 'POINTS':
-                    ncoords = int(split[1])
-                    points = np.fromfile(fid, count=ncoords*3, sep=' ', dtype='d')
-                    points = points.reshape(ncoords, 3)
-                    points_found = True
-
-                elif section == 'POLYGONS':
-                    ncells = int(split[1])
-                    n_to_read = int(split[2])
-
-                    gons = []
-                    
-                    data = np.fromfile(fid, count=n_to_read, sep=' ', dtype='i')
-                    idx = 0
-                    for i in range(ncells):
-                        n_in_gon = data[idx]
-                        gon = list(data[idx+1:idx+1+n_in_gon])
-
-                        # check handedness -- need normals to point up!
-                        cross = []
-                        for i in range(len(gon)):
-                            if i == len(gon)-1:
-                                ip = 0
-                                ipp = 1
-                            elif i == len(gon)-2:
-                                ip = i+1
-                                ipp = 0
-                            else:
-                                ip = i+1
-                                ipp = i+2
-                            d2 = points[gon[ipp]] - points[gon[ip]]
-                            d1 = points[gon[i]] - points[gon[ip]]
-                            cross.append(np.cross(d2, d1))
-                        if (np.array([c[2] for c in cross]).mean() < 0):
-                            gon.reverse()
-
-                        gons.append(gon)
-
-                        idx += n_in_gon + 1
-                    assert(idx == n_to_read)
-                    polygons_found = True
-                        
-
-        if not points_found:
-            raise RuntimeError("Unstructured VTK must contain sections 'POINTS'")
-        if not polygons_found:
-            raise RuntimeError("Unstructured VTK must contain sections 'POLYGONS'")
-        return cls(points, gons)
+        """Constructor from a VTK file.
 
-        
-    @classmethod
-    def read_VTK_Simplices(cls, filename):
-        """Constructor from an structured VTK file.
-
-        Stolen from meshio, https://github.com/nschloe/meshio/blob/master/meshio/vtk_io.py
+        Reads legacy ASCII or binary files, with either an
+        UNSTRUCTURED_GRID of surface cells or POLYDATA POLYGONS, in a
+        single pass.  All-triangle (or all-quad) meshes get array
+        connectivity, mixed polygons get a workflow.connectivity.CSR.
         """
         from workflow_tpls import vtk_io
         with open(filename,'rb') as fid:
-            data = vtk_io.read_buffer(fid)
-
-        points = data[0]
-        if len(data[1]) != 1:
-            raise RuntimeError("Simplex VTK file is readable by vtk_io but not by meshing_ats.  Includes: %r"%data[1].keys())
-
-        gons = next(v for v in data[1].values())
-        gons = gons.tolist()
-
-        # check handedness
-        for gon in gons:
-            cross = []
-            for i in range(len(gon)):
-                if i == len(gon)-1:
-                    ip = 0
-                    ipp = 1
-                elif i == len(gon)-2:
-                    ip = i+1
-                    ipp = 0
-                else:
-                    ip = i+1
-                    ipp = i+2
-                d2 = points[gon[ipp]] - points[gon[ip]]
-                d1 = points[gon[i]] - points[gon[ip]]
-                cross.append(np.cross(d2, d1))
-            if (np.array([c[2] for c in cross]).mean() < 0):
-                gon.reverse()
-
+            points, offsets, conn, types = vtk_io.read_buffer_flat(fid)[0:4]
+
+        surface_types = [vtk_io.meshio_to_vtk_type[t] for t in ['triangle', 'quad', 'polygon']]
+        not_surface = set(types.tolist()).difference(surface_types)
+        if len(not_surface) > 0:
+            raise RuntimeError("VTK file is readable by vtk_io but not a surface mesh.  Includes: %r"
+                               %[vtk_io.vtk_to_meshio_type.get(t, t) for t in sorted(not_surface)])
+
+        gons = workflow.connectivity.CSR(offsets, conn.astype(workflow.connectivity.index_dtype(len(points))))
+        if gons.is_uniform():
+            gons = gons.to_array()
+        # the constructor orients the cells, all at once
         return cls(points, gons)
+
+    @classmethod
+    def read_VTK_Unstructured(cls, filename):
+        """Constructor from an unstructured VTK file.  Same as read_VTK()."""
+        return cls.read_VTK(filename)
+
+    @classmethod
+    def read_VTK_Simplices(cls, filename):
+        """Constructor from an structured VTK file.  Same as read_VTK()."""
+        return cls.read_VTK(filename)
             
     @classmethod
     def from_Transect(cls, x, z, width=1):
@@ -348,6 +315,10 @@ class Mesh3D(object):
                           | the face
         elem_to_face_conn | list of lists of integer indices into face_to_node_conn
                           | specifying a list of faces that make up the elem
+
+        Either connectivity may instead be a fixed-width integer array,
+        e.g. (NFACES, 4) for quads, or a workflow.connectivity.CSR,
+        which are kept as is.
         """
         assert type(coords) == np.ndarray
         assert len(coords.shape) == 2
@@ -370,11 +341,13 @@ class Mesh3D(object):
             self.side_sets = []
             
         if material_ids is not None:
-            self.material_id_list = collections.Counter(material_ids).keys()
+            # unique ids, in order of first appearance
+            ids, first = np.unique(np.asarray(material_ids), return_index=True)
+            self.material_id_list = [int(i) for i in ids[np.argsort(first)]]
             self.material_ids = material_ids
         else:
             self.material_id_list = [10000,]
-            self.material_ids = [10000,]*len(self.elem_to_face_conn)
+            self.material_ids = np.full((len(self.elem_to_face_conn),), 10000, 'i')
 
         self.validate()
 
@@ -382,19 +355,27 @@ class Mesh3D(object):
     def validate(self):
         """Checks the validity of the mesh, or throws an AssertionError."""
         assert self.coords.shape[1] == 3
-        assert type(self.face_to_node_conn) is list
-        for f in self.face_to_node_conn:
-            assert type(f) is list
-            assert len(set(f)) == len(f)
-            for i in f:
-                assert i < self.coords.shape[0]
-
-        assert type(self.elem_to_face_conn) is list
-        for e in self.elem_to_face_conn:
-            assert type(e) is list
-            assert len(set(e)) == len(e)
-            for i in e:
-                assert i < len(self.face_to_node_conn)
+        face_to_node = _as_csr(self.face_to_node_conn)
+        if face_to_node is not None:
+            _validate_csr(face_to_node, self.coords.shape[0])
+        else:
+            assert type(self.face_to_node_conn) is list
+            for f in self.face_to_node_conn:
+                assert type(f) is list
+                assert len(set(f)) == len(f)
+                for i in f:
+                    assert i < self.coords.shape[0]
+
+        elem_to_face = _as_csr(self.elem_to_face_conn)
+        if elem_to_face is not None:
+            _validate_csr(elem_to_face, len(self.face_to_node_conn))
+        else:
+            assert type(self.elem_to_face_conn) is list
+            for e in self.elem_to_face_conn:
+                assert type(e) is list
+                assert len(set(e)) == len(e)
+                for i in e:
+                    assert i < len(self.face_to_node_conn)
 
         for ls in self.labeled_sets:
             if ls.entity == "NODE":
@@ -403,14 +384,17 @@ class Mesh3D(object):
                 size = self.num_faces()
             elif ls.entity == "CELL":
                 size = self.num_cells()
-
-            for i in ls.ent_ids:
-                assert i < size
+            assert np.all(ls.ent_ids < size)
 
         for ss in self.side_sets:
-            for j,i in zip(ss.elem_list, ss.side_list):
-                assert j < self.num_cells()
-                assert i < len(self.elem_to_face_conn[j])
+            if elem_to_face is not None:
+                elems = np.asarray(ss.elem_list, dtype=np.int64)
+                assert np.all(elems < self.num_cells())
+                assert np.all(np.asarray(ss.side_list) < elem_to_face.lengths()[elems])
+            else:
+                for j,i in zip(ss.elem_list, ss.side_list):
+                    assert j < self.num_cells()
+                    assert i < len(self.elem_to_face_conn[j])
 
 
 
@@ -426,6 +410,12 @@ class Mesh3D(object):
 
     def write_exodus(self, filename, face_block_mode="one block"):
         """Write the 3D mesh to ExodusII using arbitrary polyhedra spec"""
+        import exodus
+
+        # all work is done on CSR arrays, converting list connectivity if needed
+        face_to_node = workflow.connectivity.CSR.from_any(self.face_to_node_conn)
+        elem_to_face = workflow.connectivity.CSR.from_any(self.elem_to_face_conn)
+        material_ids = np.asarray(self.material_ids)
 
         # put cells in with blocks, which renumbers the cells, so we have to track sidesets.
         # Therefore we keep a map of old cell to new cell ordering
@@ -435,72 +425,50 @@ class Mesh3D(object):
         # make face blocks here too, which requires renumbering the faces.
 
         # -- first pass, form all elem blocks and make the map from old-to-new
-        new_to_old_elems = []
-        elem_blks = []
-        for i_m,m_id in enumerate(self.material_id_list):
-            # split out elems of this material, save new_to_old map
-            elems_tuple = [(i,c) for (i,c) in enumerate(self.elem_to_face_conn) if self.material_ids[i] == m_id]
-            new_to_old_elems.extend([i for (i,c) in elems_tuple])
-            elems = [c for (i,c) in elems_tuple]
-            elem_blks.append(elems)
-
-        old_to_new_elems = sorted([(old,i) for (i,old) in enumerate(new_to_old_elems)], key=lambda a: a[0])
+        blk_elems = [np.nonzero(material_ids == m_id)[0] for m_id in self.material_id_list]
+        new_to_old_elems = np.concatenate(blk_elems)
+        old_to_new_elems = np.zeros((len(elem_to_face),), int) - 1
+        old_to_new_elems[new_to_old_elems] = np.arange(len(new_to_old_elems))
+        elem_blks = [elem_to_face.take(elems) for elems in blk_elems]
 
         # -- deal with faces, form all face blocks and make the map from old-to-new
         face_blks = []
         if face_block_mode == "one block":
             # no reordering of faces needed
-            face_blks.append(self.face_to_node_conn)
+            face_blks.append(face_to_node)
             
         elif face_block_mode == "n blocks, not duplicated":
-            used_faces = np.zeros((len(self.face_to_node_conn),),'bool')
+            # each face goes in the block of the first elem block using it
+            used_faces = np.zeros((len(face_to_node),),'bool')
             new_to_old_faces = []
-            for i_m,m_id in enumerate(self.material_id_list):
-                # split out faces of this material, save new_to_old map
-                def used(f):
-                    result = used_faces[f]
-                    used_faces[f] = True
-                    return result
-
-                elem_blk = elem_blks[i_m]
-                faces_tuple = [(f,self.face_to_node_conn[f]) for c in elem_blk for (j,f) in enumerate(c) if not used(f)]
-                new_to_old_faces.extend([j for (j,f) in faces_tuple])
-                faces = [f for (j,f) in faces_tuple]
-                face_blks.append(faces)
+            for elem_blk in elem_blks:
+                faces = _first_uses(elem_blk.indices)
+                faces = faces[~used_faces[faces]]
+                used_faces[faces] = True
+                new_to_old_faces.append(faces)
+                face_blks.append(face_to_node.take(faces))
 
             # get the renumbering in the elems
-            old_to_new_faces = sorted([(old,j) for (j,old) in enumerate(new_to_old_faces)], key=lambda a: a[0])
-            elem_blks = [[[old_to_new_faces[f][1] for f in c] for c in elem_blk] for elem_blk in elem_blks]
+            new_to_old_faces = np.concatenate(new_to_old_faces)
+            old_to_new_faces = np.zeros((len(face_to_node),), int) - 1
+            old_to_new_faces[new_to_old_faces] = np.arange(len(new_to_old_faces))
+            elem_blks = [elem_blk.map(old_to_new_faces) for elem_blk in elem_blks]
 
         elif face_block_mode == "n blocks, duplicated":
+            # each elem block gets its own copy of all the faces it uses
             elem_blks_new = []
-            offset = 0
-            for i_m, m_id in enumerate(self.material_id_list):
-                used_faces = np.zeros((len(self.face_to_node_conn),),'bool')
-                def used(f):
-                    result = used_faces[f]
-                    used_faces[f] = True
-                    return result
-
-                elem_blk = elem_blks[i_m]
-
-                tuple_old_f = [(f,self.face_to_node_conn[f]) for c in elem_blk for f in c if not used(f)]
-                tuple_new_old_f = [(new,old,f) for (new,(old,f)) in enumerate(tuple_old_f)]
-
-                old_to_new_blk = np.zeros((len(self.face_to_node_conn),),'i')-1
-                for new,old,f in tuple_new_old_f:
-                    old_to_new_blk[old] = new + offset
-
-                elem_blk_new = [[old_to_new_blk[f] for f in c] for c in elem_blk]
-                #offset = offset + len(ftuple_new)
-
-                elem_blks_new.append(elem_blk_new)
-                face_blks.append([f for i,j,f in tuple_new_old_f])
+            for elem_blk in elem_blks:
+                faces = _first_uses(elem_blk.indices)
+                old_to_new_blk = np.zeros((len(face_to_node),),'i')-1
+                old_to_new_blk[faces] = np.arange(len(faces))
+                elem_blks_new.append(elem_blk.map(old_to_new_blk))
+                face_blks.append(face_to_node.take(faces))
             elem_blks = elem_blks_new
+
         elif face_block_mode == "one block, repeated":
             # no reordering of faces needed, just repeat
             for eblock in elem_blks:
-                face_blks.append(self.face_to_node_conn)
+                face_blks.append(face_to_node)
         else:
             raise RuntimeError("Invalid face_block_mode: '%s', valid='one block', 'n blocks, duplicated', 'n blocks, not duplicated'"%face_block_mode)
                 
@@ -525,29 +493,25 @@ class Mesh3D(object):
 
         # put the face blocks
         for i_blk, face_blk in enumerate(face_blks):
-            face_raveled = [n for f in face_blk for n in f]
-            e.put_polyhedra_face_blk(i_blk+1, len(face_blk), len(face_raveled), 0)
-            e.put_node_count_per_face(i_blk+1, np.array([len(f) for f in face_blk]))
-            e.put_face_node_conn(i_blk+1, np.array(face_raveled)+1)
+            e.put_polyhedra_face_blk(i_blk+1, len(face_blk), len(face_blk.indices), 0)
+            e.put_node_count_per_face(i_blk+1, face_blk.lengths().astype(int))
+            e.put_face_node_conn(i_blk+1, face_blk.indices.astype(int)+1)
 
         # put the elem blocks
         assert len(elem_blks) == len(self.material_id_list)
         for i_blk, (m_id, elem_blk) in enumerate(zip(self.material_id_list, elem_blks)):
-            elems_raveled = [f for c in elem_blk for f in c]
-
-            e.put_polyhedra_elem_blk(m_id, len(elem_blk), len(elems_raveled), 0)
+            e.put_polyhedra_elem_blk(m_id, len(elem_blk), len(elem_blk.indices), 0)
             e.put_elem_blk_name(m_id, 'MATERIAL_ID_%d'%m_id)
-            e.put_face_count_per_polyhedra(m_id, np.array([len(c) for c in elem_blk]))
-            e.put_elem_face_conn(m_id, np.array(elems_raveled)+1)
+            e.put_face_count_per_polyhedra(m_id, elem_blk.lengths().astype(int))
+            e.put_elem_face_conn(m_id, elem_blk.indices.astype(int)+1)
 
         # add sidesets
         e.put_side_set_names([ss.name for ss in self.side_sets])
         for ss in self.side_sets:
-            for elem in ss.elem_list:
-                assert old_to_new_elems[elem][0] == elem
-            new_elem_list = [old_to_new_elems[elem][1] for elem in ss.elem_list]                
+            new_elem_list = old_to_new_elems[np.asarray(ss.elem_list, dtype=int)]
+            assert np.all(new_elem_list >= 0)
             e.put_side_set_params(ss.setid, len(ss.elem_list), 0)
-            e.put_side_set(ss.setid, np.array(new_elem_list)+1, np.array(ss.side_list)+1)
+            e.put_side_set(ss.setid, new_elem_list+1, np.asarray(ss.side_list, dtype=int)+1)
 
         # finish and close
         e.close()
@@ -638,10 +602,10 @@ class Mesh3D(object):
                 assert len(ncells_per_layer) == len(layer_data)
 
         elif is_list(ncells_per_layer):
-            layer_type = [layer_type,]*len(ncells_per_layer)
+            layer_types = [layer_types,]*len(ncells_per_layer)
             layer_data = [layer_data,]*len(ncells_per_layer)
         else:
-            layer_type = [layer_type,]
+            layer_types = [layer_types,]
             layer_data = [layer_data,]
             ncells_per_layer = [ncells_per_layer,]
                 
@@ -650,31 +614,22 @@ class Mesh3D(object):
         if min(ncells_per_layer) < 0:
             raise RuntimeError("Invalid number of cells, negative value provided.")
         ncells_tall = sum(ncells_per_layer)
-        ncells_total = ncells_tall * mesh2D.num_cells()
-        nfaces_total = (ncells_tall+1) * mesh2D.num_cells() + ncells_tall * mesh2D.num_edges()
+        ncols = mesh2D.num_cells()
+        # unique edges of the surface mesh, numbered in order of first
+        # appearance around the cells
+        topology = mesh2D.edge_topology()
+        conn2 = topology.conn
+        edge_ids, edges, edge_counts = topology.edge_ids, topology.edges, topology.counts
+        nedges = len(edges)
+
+        ncells_total = ncells_tall * ncols
+        nfaces_total = (ncells_tall+1) * ncols + ncells_tall * nedges
         nnodes_total = (ncells_tall+1) * mesh2D.num_nodes()
 
         np_mat_ids = np.array(mat_ids, dtype=int)
-        if np_mat_ids.size == np.size(np_mat_ids, 0):
-            if np_mat_ids.size == 1:
-                np_mat_ids = np.full((len(ncells_per_layer), mesh2D.num_cells()), mat_ids[0], dtype=int)
-            else:
-                np_mat_ids = np.empty((len(ncells_per_layer), mesh2D.num_cells()), dtype=int)
-                for ilay in range(len(ncells_per_layer)):
-                    np_mat_ids[ilay, :] = np.full(mesh2D.num_cells(), mat_ids[ilay], dtype=int)
-
-
-        def col_to_id(column, z_cell):
-            """Maps 2D cell ID and index in the vertical to a 3D cell ID"""
-            return z_cell + column * ncells_tall
-
-        def node_to_id(node, z_node):
-            """Maps 2D node ID and index in the vertical to a 3D node ID"""
-            return z_node + node * (ncells_tall+1)
-
-        def edge_to_id(edge, z_cell):
-            """Maps 2D edge hash and index in the vertical to a 3D face ID of a vertical face"""
-            return (ncells_tall + 1) * mesh2D.num_cells() + z_cell + edge * ncells_tall
+        if np_mat_ids.ndim < 2:
+            # one id for all layers, or one id per layer, in all columns
+            np_mat_ids = np.broadcast_to(np_mat_ids.reshape(-1,1), (len(ncells_per_layer), ncols))
 
         # create coordinates
         # ---------------------------------
@@ -712,7 +667,7 @@ class Mesh3D(object):
                 elif layer_type.lower() == 'cell':
                     # interpolate cell thicknesses to node thicknesses
                     import scipy.interpolate
-                    centroids = mesh2D.cell_centroids()
+                    centroids = mesh2D.centroids()
                     interp = scipy.interpolate.interp2d(centroids[:,0], centroids[:,1], layer_datum, kind='linear')
                     layer_bottom[:] = coords[:,cell_layer_start,2] - interp(mesh2D.coords[:,0], mesh2D.coords[:,1])
 
@@ -720,116 +675,91 @@ class Mesh3D(object):
                     raise RuntimeError("Unrecognized layer_type '%s'"%layer_type)
 
                 # linspace from bottom of previous layer to bottom of this layer
-                for node_col in range(mesh2D.coords.shape[0]):
-                    coords[node_col,cell_layer_start:cell_layer_start+ncells+1,2] = np.linspace(coords[node_col,cell_layer_start,2], layer_bottom[node_col], ncells+1)
+                coords[:,cell_layer_start:cell_layer_start+ncells+1,2] = \
+                    np.linspace(coords[:,cell_layer_start,2], layer_bottom, ncells+1, axis=1)
                 
             cell_layer_start = cell_layer_start + ncells
 
         # create faces, face sets, cells
-        bottom = []
-        surface = []
-        faces = []
-        cells = [list() for c in range(ncells_total)]
-
-        # -- loop over the columns, adding the horizontal faces
-        for col in range(mesh2D.num_cells()):
-            nodes_2 = mesh2D.conn[col]
-            surface.append(col_to_id(col,0))
-            for z_face in range(ncells_tall + 1):
-                i_f = len(faces)
-                f = [node_to_id(n, z_face) for n in nodes_2]
-
-                if z_face != ncells_tall:
-                    cells[col_to_id(col, z_face)].append(i_f)
-                if z_face != 0:
-                    cells[col_to_id(col, z_face-1)].append(i_f)
-
-                faces.append(f)
-            bottom.append(col_to_id(col,ncells_tall-1))
-
-        # -- loop over the columns, adding the vertical faces
-        added = dict()
-        vertical_side_cells = []
-        vertical_side_indices = []
-        for col in range(mesh2D.num_cells()):
-            nodes_2 = mesh2D.conn[col]
-            for i in range(len(nodes_2)):
-                edge = mesh2D.edge_hash(nodes_2[i], nodes_2[(i+1)%len(nodes_2)])
-                try:
-                    i_e = added[edge]
-                except KeyError:
-                    # faces not yet added to facelist
-                    i_e = len(added.keys())
-                    added[edge] = i_e
-                    
-                    for z_face in range(ncells_tall):
-                        i_f = len(faces)
-                        assert i_f == edge_to_id(i_e, z_face)
-                        f = [node_to_id(edge[0], z_face),
-                             node_to_id(edge[1], z_face),
-                             node_to_id(edge[1], z_face+1),
-                             node_to_id(edge[0], z_face+1)]
-                        faces.append(f)
-                        face_cell = col_to_id(col, z_face)
-                        cells[face_cell].append(i_f)
-
-                        # check if this is an external
-                        if mesh2D._edges[edge] == 1:
-                            vertical_side_cells.append(face_cell)
-                            vertical_side_indices.append(len(cells[face_cell])-1)
-                        
-                else:
-                    # faces already added from previous column
-                    for z_face in range(ncells_tall):
-                        i_f = edge_to_id(i_e, z_face)
-                        cells[col_to_id(col, z_face)].append(i_f)
-
+        #
+        # Nodes are numbered z-fastest within each column of nodes, and
+        # cells z-fastest within each column of cells.  Faces are all
+        # horizontal faces, column by column, followed by all vertical
+        # faces, edge by edge.  Each cell's faces are its top, its
+        # bottom, and then its sides in the order of the surface cell's
+        # edges.
+        nz = ncells_tall
+        itype = workflow.connectivity.index_dtype(max(nnodes_total, nfaces_total))
+        z_faces = np.arange(nz+1, dtype=itype)
+        z_cells = np.arange(nz, dtype=itype)
+
+        # -- horizontal faces, (ncols, nz+1), are the surface cells at each level
+        col_lengths = conn2.lengths()
+        hface_cols = np.repeat(np.arange(ncols, dtype=np.int64), nz+1)
+        hfaces = conn2.take(hface_cols)
+        hfaces.indices = hfaces.indices.astype(itype) * (nz+1) + \
+            np.repeat(np.tile(z_faces, ncols), col_lengths[hface_cols])
+
+        # -- vertical faces, (nedges, nz), are quads between the two edge nodes
+        e0 = edges[:,0].astype(itype)[:,None] * (nz+1) + z_cells[None,:]
+        e1 = edges[:,1].astype(itype)[:,None] * (nz+1) + z_cells[None,:]
+        vfaces = np.stack([e0, e1, e1+1, e0+1], axis=-1).reshape(nedges*nz, 4)
+
+        faces = workflow.connectivity.CSR.concatenate([hfaces, workflow.connectivity.CSR.from_array(vfaces)])
+
+        # -- cells: top and bottom faces, followed by the sides
+        cell_cols = np.repeat(np.arange(ncols, dtype=np.int64), nz)
+        cell_zs = np.tile(z_cells, ncols)
+        cell_lengths = col_lengths[cell_cols] + 2
+        cells = workflow.connectivity.CSR.from_lengths(cell_lengths, np.zeros((cell_lengths.sum(),), itype))
+        starts = cells.offsets[:-1]
+        top = cell_cols * (nz+1) + cell_zs
+        cells.indices[starts] = top
+        cells.indices[starts+1] = top + 1
+
+        sides = np.ones((len(cells.indices),), bool)
+        sides[starts] = False
+        sides[starts+1] = False
+        side_edges = workflow.connectivity.CSR(conn2.offsets, edge_ids).take(cell_cols)
+        cells.indices[sides] = (nz+1) * ncols + side_edges.indices.astype(itype) * nz + \
+            np.repeat(cell_zs, col_lengths[cell_cols])
 
         # Do some idiot checking
         # -- check we got the expected number of faces
         assert len(faces) == nfaces_total
+        assert len(cells) == ncells_total
         # -- check every cell is at least a tet
-        for c in cells:
-            assert len(c) > 4
-        # -- check surface sideset has the right number of entries
-        assert len(surface) == mesh2D.num_cells()
-        # -- check bottom sideset has the right number of entries
-        assert len(bottom) == mesh2D.num_cells()
+        assert np.all(cells.lengths() > 4)
+
+        # make the material ids, layer by layer in each column
+        cell_layers = np.repeat(np.arange(len(ncells_per_layer)), ncells_per_layer)
+        material_ids = np_mat_ids[cell_layers,:].transpose().ravel().astype('i')
+
+        # make the side sets
+        # -- the surface and bottom are the top face of the first, and
+        #    bottom face of the last, cell in each column
+        surface = np.arange(ncols, dtype=np.int64) * nz
+        bottom = surface + nz - 1
+
+        # -- vertical sides are the side faces on boundary edges, for
+        #    every cell in the column
+        side_cols = conn2.row_ids()
+        side_local = np.arange(len(conn2.indices)) - conn2.offsets[side_cols]
+        external = edge_counts[edge_ids] == 1
+        vertical_side_cells = (side_cols[external].astype(np.int64)[:,None] * nz + z_cells[None,:]).ravel()
+        vertical_side_indices = np.repeat(side_local[external] + 2, nz)
 
         # -- len of vertical sides sideset is number of external edges * number of cells, no pinchouts here
-        num_sides = ncells_tall * sum(1 for e,c in mesh2D.edge_counts().items() if c == 1)
+        num_sides = ncells_tall * np.count_nonzero(edge_counts == 1)
         assert num_sides == len(vertical_side_cells)
-        assert num_sides == len(vertical_side_indices)
-
-        # make the material ids
-        material_ids = np.zeros((len(cells),),'i')
-        for col in range(mesh2D.num_cells()):
-            z_cell = 0
-            for ilay in range(len(ncells_per_layer)):
-                ncells = ncells_per_layer[ilay]
-                for i in range(z_cell, z_cell+ncells):
-                    material_ids[col_to_id(col, i)] = np_mat_ids[ilay, col]
-                z_cell = z_cell + ncells
 
-        # make the side sets
         side_sets = []
-        side_sets.append(SideSet("bottom", 1, bottom, [1,]*len(bottom)))
-        side_sets.append(SideSet("surface", 2, surface, [0,]*len(surface)))
+        side_sets.append(SideSet("bottom", 1, bottom, np.ones((ncols,), int)))
+        side_sets.append(SideSet("surface", 2, surface, np.zeros((ncols,), int)))
         side_sets.append(SideSet("external_sides", 3, vertical_side_cells, vertical_side_indices))
 
         # reshape coords
         coords = coords.reshape(nnodes_total, 3)        
-        
-        for e,s in zip(side_sets[0].elem_list, side_sets[0].side_list):
-            face = cells[e][s]
-            fz_coords = np.array([coords[n] for n in faces[face]])
 
-        for e,s in zip(side_sets[1].elem_list, side_sets[1].side_list):
-            face = cells[e][s]
-            fz_coords = np.array([coords[n] for n in faces[face]])
-        
         # instantiate the mesh
         return cls(coords, faces, cells, side_sets=side_sets, material_ids=material_ids)
-
-
-
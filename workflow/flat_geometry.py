@@ -0,0 +1,165 @@
+"""Collections of fiona-style shapes stored as flat coordinate arrays.
+
+Sources hand back shapes as nested lists of coordinate tuples.
+Reprojecting and rounding them one ring at a time, and then converting
+them to shapely, costs several passes through Python lists per ring.
+FlatGeometry instead packs the coordinates of all shapes into one
+contiguous array, with offset tables describing how they nest, so that
+whole collections are reprojected and rounded in single array
+operations and shapely shapes are built directly from slices of it.
+
+The layout has three levels of offsets into the level below:
+
+  coords        | np.array((n_coords, dim), 'd')
+  ring_offsets  | np.array((n_rings+1,), int), into coords: a ring is a
+                | point, a line, or a polygon's shell or hole
+  part_offsets  | np.array((n_parts+1,), int), into rings: a part is a
+                | point, a line, or a polygon with its holes
+  geom_offsets  | np.array((n_geoms+1,), int), into parts: one entry
+                | per shape, with several parts for Multi types
+"""
+
+import itertools
+import numpy as np
+import shapely.geometry
+
+import workflow.warp
+
+
+_types = ['Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon']
+
+
+class FlatGeometry:
+    """A collection of shapes with all coordinates in one array.
+
+    Build one from fiona-style features with from_features(); then
+    warp() and round() change coordinates in place, and to_shapely()
+    gives shapely shapes, collapsed as by workflow.utils.shply().
+    """
+    def __init__(self, types, coords, ring_offsets, part_offsets, geom_offsets, properties=None):
+        self.types = list(types)
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.geom_offsets = geom_offsets
+        if properties is None:
+            properties = [None,]*len(self.types)
+        self.properties = list(properties)
+
+    def __len__(self):
+        return len(self.types)
+
+    @classmethod
+    def from_features(cls, features):
+        """Packs a list of fiona-style features, or geometries, into a FlatGeometry.
+
+        Coordinates are gathered into one list and converted to an
+        array once.  If shapes mix 2D and 3D coordinates, only x and y
+        are kept.
+        """
+        types = []
+        properties = []
+        all_coords = []
+        ring_lengths = []
+        part_lengths = []
+        geom_lengths = []
+
+        for f in features:
+            if 'geometry' in f:
+                properties.append(f['properties'] if 'properties' in f else None)
+                f = f['geometry']
+            else:
+                properties.append(None)
+
+            gtype = f['type']
+            if gtype not in _types:
+                raise ValueError("FlatGeometry does not support geometries of type '%s'"%gtype)
+            types.append(gtype)
+            coords = f['coordinates']
+
+            # normalize to a list of parts, each a list of rings
+            if gtype == 'Point':
+                parts = [[[coords,]],]
+            elif gtype == 'MultiPoint':
+                parts = [[[p,]] for p in coords]
+            elif gtype == 'LineString':
+                parts = [[coords,]] if len(coords) > 0 else []
+            elif gtype == 'MultiLineString':
+                parts = [[l,] for l in coords]
+            elif gtype == 'Polygon':
+                parts = [coords,] if len(coords) > 0 else []
+            else:
+                parts = coords
+
+            geom_lengths.append(len(parts))
+            for part in parts:
+                part_lengths.append(len(part))
+                for ring in part:
+                    ring_lengths.append(len(ring))
+                    all_coords.extend(ring)
+
+        if len(all_coords) == 0:
+            coords = np.zeros((0,2), 'd')
+        else:
+            # chaining the tuples is much faster than np.array() on them
+            dim = len(all_coords[0])
+            coords = np.fromiter(itertools.chain.from_iterable(all_coords), 'd')
+            if len(coords) == dim * len(all_coords):
+                coords = coords.reshape(-1, dim)
+            else:
+                # mixed dimensions
+                coords = np.array([c[0:2] for c in all_coords], 'd')
+
+        def offsets(lengths):
+            return np.concatenate([[0,], np.cumsum(lengths, dtype=np.int64)])
+        return cls(types, coords, offsets(ring_lengths), offsets(part_lengths),
+                   offsets(geom_lengths), properties)
+
+    def warp(self, old_crs, new_crs):
+        """Reprojects all coordinates in one call, IN PLACE.
+
+        As with workflow.warp.warp_shape(), only x and y are kept.
+        """
+        self.coords = workflow.warp.warp_coords(self.coords[:,0:2], old_crs, new_crs)
+        return self
+
+    def round(self, digits):
+        """Rounds all coordinates to digits, IN PLACE."""
+        np.round(self.coords, digits, out=self.coords)
+        return self
+
+    def _ring(self, i):
+        return self.coords[self.ring_offsets[i]:self.ring_offsets[i+1]]
+
+    def _part(self, gtype, j):
+        rings = range(self.part_offsets[j], self.part_offsets[j+1])
+        if gtype == 'Point' or gtype == 'MultiPoint':
+            return shapely.geometry.Point(self._ring(rings[0])[0])
+        elif gtype == 'LineString' or gtype == 'MultiLineString':
+            return shapely.geometry.LineString(self._ring(rings[0]))
+        else:
+            return shapely.geometry.Polygon(self._ring(rings[0]), [self._ring(r) for r in rings[1:]])
+
+    def shape(self, i, collapse=True):
+        """Shapely shape i.
+
+        If collapse, Multi shapes with a single part become that part,
+        as in workflow.utils.shply().  Properties are attached.
+        """
+        gtype = self.types[i]
+        parts = [self._part(gtype, j) for j in range(self.geom_offsets[i], self.geom_offsets[i+1])]
+        if gtype.startswith('Multi'):
+            if collapse and len(parts) == 1:
+                thing = parts[0]
+            else:
+                thing = getattr(shapely.geometry, gtype)(parts)
+        elif len(parts) == 0:
+            thing = getattr(shapely.geometry, gtype)()
+        else:
+            thing = parts[0]
+        thing.properties = self.properties[i]
+        return thing
+
+    def to_shapely(self, collapse=True):
+        """List of shapely shapes, see shape()."""
+        return [self.shape(i, collapse) for i in range(len(self))]
@@ -10,9 +10,7 @@ capability.
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import logging
-import math
 
 import rasterio
 import rasterio.transform
@@ -24,20 +22,24 @@ from workflow_tpls import vtk_io
 
 import workflow.conf
 import workflow.triangulation
+import workflow.mesh_quality
 import workflow.warp
+import workflow.flat_geometry
+import workflow.interpolate
 import workflow.plot
 import workflow.tree
 import workflow.split_hucs
 import workflow.hydrography
 import workflow.sources.utils 
 import workflow.sources.manager_shape
+import workflow.sources.raster_mosaic
 
 __all__ = ['get_huc', 'get_hucs', 'get_split_form_hucs',
            'get_shapes', 'get_split_form_shapes', 'get_reaches',
            'get_raster_on_shape', 'get_masked_raster_on_shape',
            'find_huc', 'simplify_and_prune',
            'triangulate',
-           'elevate', 'values_from_raster', 'color_raster_from_shapes']
+           'elevate', 'elevate_from_source', 'values_from_raster', 'color_raster_from_shapes']
 #
 # functions for getting objects
 # -----------------------------------------------------------------------------
@@ -107,20 +109,19 @@ def get_hucs(source, huc, level, crs=None, digits=None):
     for hu in hus:
         logging.info('  -- {}'.format(hu['properties']['HUC{:d}'.format(level)]))
     
-    # convert to destination crs
+    # convert to destination crs and round, all coordinates at once
+    flat = workflow.flat_geometry.FlatGeometry.from_features(hus)
     if crs and crs != profile['crs']:
-        for hu in hus:
-            workflow.warp.warp_shape(hu, profile['crs'], crs)
+        flat.warp(profile['crs'], crs)
     else:
         crs = profile['crs']
 
-    # round
     if digits is None:
         digits = workflow.conf.rcParams['digits']
-    workflow.utils.round(hus, digits)
+    flat.round(digits)
 
     # convert to shapely
-    hu_shapes = [workflow.utils.shply(hu) for hu in hus]
+    hu_shapes = flat.to_shapely()
     return crs, hu_shapes
 
 
@@ -194,20 +195,19 @@ def get_shapes(source, index_or_bounds=-1, crs=None, digits=None):
 
     profile, shps = source.get_shapes(index_or_bounds, crs)
 
-    # convert to destination crs
+    # convert to destination crs and round, all coordinates at once
+    flat = workflow.flat_geometry.FlatGeometry.from_features(shps)
     if crs and crs != profile['crs']:
-        for shp in shps:
-            workflow.warp.warp_shape(shp, profile['crs'], crs)
+        flat.warp(profile['crs'], crs)
     else:
         crs = profile['crs']
-        
-    # round
+
     if digits is None:
         digits = workflow.conf.rcParams['digits']
-    workflow.utils.round(shps, digits)
+    flat.round(digits)
 
     # convert to shapely
-    shplys = [workflow.utils.shply(shp) for shp in shps]
+    shplys = flat.to_shapely()
     return crs, shplys
 
 def get_split_form_shapes(source, index_or_bounds=-1, crs=None, digits=None):
@@ -291,20 +291,19 @@ def get_reaches(source, huc, bounds=None, crs=None, digits=None, long=None, merg
     # get the reaches
     profile, reaches = source.get_hydro(huc, bounds, crs)
 
-    # convert to destination crs
+    # convert to destination crs and round, all coordinates at once
+    flat = workflow.flat_geometry.FlatGeometry.from_features(reaches)
     if crs and crs != profile['crs']:
-        for reach in reaches:
-            workflow.warp.warp_shape(reach, profile['crs'], crs)
+        flat.warp(profile['crs'], crs)
     else:
         crs = profile['crs']
 
-    # round
     if digits is None:
         digits = workflow.conf.rcParams['digits']
-    workflow.utils.round(reaches, digits)
+    flat.round(digits)
 
     # convert to shapely
-    reaches_s = [workflow.utils.shply(reach) for reach in reaches]
+    reaches_s = flat.to_shapely()
 
     if merge:
         reaches_s = list(shapely.ops.linemerge(shapely.geometry.MultiLineString(reaches_s)))
@@ -316,7 +315,7 @@ def get_reaches(source, huc, bounds=None, crs=None, digits=None, long=None, merg
     return crs, reaches_s
 
 
-def get_raster_on_shape(source, shape, crs, raster_crs=None, buffer=0.):
+def get_raster_on_shape(source, shape, crs, raster_crs=None, buffer=0., lazy=False):
     """Collects a raster DEM that covers the requested shape.
 
     Parameters
@@ -332,12 +331,18 @@ def get_raster_on_shape(source, shape, crs, raster_crs=None, buffer=0.):
     buffer : double
         Size of buffer added to shape to ensure pixels cover the 
         entire shape.
+    lazy : bool
+        If True, return a RasterMosaic that reads windows of the
+        raster on demand instead of an array, see
+        workflow.sources.raster_mosaic.  Requires a source whose
+        get_raster() supports it, such as FileManagerNED, and cannot
+        be combined with raster_crs.
 
     Returns
     -------
     profile : dict
         Rasterio profile of the image including crs and transform
-    raster : :obj:`np.array`
+    raster : :obj:`np.array` or :obj:`RasterMosaic`
         The raster array.
     """
     logging.info("")
@@ -351,6 +356,10 @@ def get_raster_on_shape(source, shape, crs, raster_crs=None, buffer=0.):
     shape = shape.buffer(buffer)
 
     logging.info("collecting raster")
+    if lazy:
+        if raster_crs is not None:
+            raise ValueError("get_raster_on_shape: lazy rasters cannot be warped to raster_crs")
+        return source.get_raster(shape, crs, lazy=True)
     profile, raster = source.get_raster(shape, crs)
 
     # warp the raster to the requested output
@@ -453,9 +462,9 @@ def find_huc(source, shape, crs, hint, shrink_factor=1.e-5):
             return hint
 
         profile, subhus = source.get_hucs(hint, search_level)
+        workflow.warp.warp_shapes(subhus, profile['crs'], crs)
         
         for subhu in subhus:
-            workflow.warp.warp_shape(subhu, profile['crs'], crs)
             subhu_shply = workflow.utils.shply(subhu['geometry'])        
             inhuc = _in_huc(shply, subhu_shply)
 
@@ -583,7 +592,8 @@ def simplify_and_prune(hucs, reaches, simplify=10, prune_reach_size=0, cut_inter
     
 def triangulate(hucs, rivers, diagnostics=True, verbosity=1,
                 refine_max_area=None, refine_distance=None, refine_max_edge_length=None,
-                refine_min_angle=None, enforce_delaunay=False):
+                refine_min_angle=None, enforce_delaunay=False, refine_distance_tol=None,
+                nprocs=1):
     """Triangulates HUCs and rivers.
 
     Parameters
@@ -595,7 +605,9 @@ def triangulate(hucs, rivers, diagnostics=True, verbosity=1,
         The list of reaches from get_reaches()
 
     diagnostics : bool
-        Plot diagnostics graphs of the triangle refinement.    
+        Log a summary of triangle quality, see
+        workflow.mesh_quality, and, if verbosity > 0, plot
+        diagnostics graphs of the triangle refinement.
 
     Refinement Parameters
     ---------------------
@@ -626,6 +638,10 @@ def triangulate(hucs, rivers, diagnostics=True, verbosity=1,
         of triangle distance from centroid and uses that as a max
         area criteria.
 
+    refine_distance_tol : float, optional
+        Accuracy of the distances used by refine_distance.  Defaults
+        to 1% of far_distance.
+
     refine_max_edge_length : float
         Refine a triangle if its max edge length is greater than
         this length.
@@ -643,6 +659,15 @@ def triangulate(hucs, rivers, diagnostics=True, verbosity=1,
         Attempt to ensure all triangles are proper Delaunay 
         triangles.        
 
+    nprocs : int, optional
+        If not 1, triangulate each HUC on its own, in this many
+        processes (None uses all available cores), and merge the
+        meshes; see workflow.triangulation.triangulate_parallel().
+        HUC boundaries are then not refined by Triangle, so they, and
+        the rivers, are first split into edges no longer than
+        refine_max_edge_length, or than the side of an equilateral
+        triangle of the smallest area target.
+
     Returns
     -------
     np.array((n_points, 2), 'd')
@@ -663,49 +688,44 @@ def triangulate(hucs, rivers, diagnostics=True, verbosity=1,
     if refine_max_area is not None:
         refine_funcs.append(workflow.triangulation.refine_from_max_area(refine_max_area))
     if refine_distance is not None:
-        refine_funcs.append(workflow.triangulation.refine_from_river_distance(*refine_distance, rivers))
+        refine_funcs.append(workflow.triangulation.refine_from_river_distance(*refine_distance, rivers,
+                                                                              tol=refine_distance_tol))
     if refine_max_edge_length is not None:
         refine_funcs.append(workflow.triangulation.refine_from_max_edge_length(refine_max_edge_length))
     def my_refine_func(*args):
         return any(rf(*args) for rf in refine_funcs)        
 
-    mesh_points, mesh_tris = workflow.triangulation.triangulate(hucs, rivers,
-                                                              verbose=verbose,
-                                                              refinement_func=my_refine_func,
-                                                              min_angle=refine_min_angle,
-                                                              enforce_delaunay=enforce_delaunay)
+    if nprocs == 1:
+        mesh_points, mesh_tris = workflow.triangulation.triangulate(hucs, rivers,
+                                                                  verbose=verbose,
+                                                                  refinement_func=my_refine_func,
+                                                                  min_angle=refine_min_angle,
+                                                                  enforce_delaunay=enforce_delaunay)
+    else:
+        segment_length = refine_max_edge_length
+        areas = [a for a in (refine_max_area,
+                             refine_distance[1] if refine_distance is not None else None) if a is not None]
+        if segment_length is None and len(areas) > 0:
+            segment_length = np.sqrt(4 / np.sqrt(3) * min(areas))
+        mesh_points, mesh_tris = workflow.triangulation.triangulate_parallel(hucs, rivers, nprocs,
+                                                                           segment_length,
+                                                                           verbose=verbose,
+                                                                           refinement_func=my_refine_func,
+                                                                           min_angle=refine_min_angle,
+                                                                           enforce_delaunay=enforce_delaunay)
 
     if diagnostics:
-        logging.info("Plotting triangulation diagnostics")
-        river_multiline = workflow.tree.forest_to_list(rivers)
-        distances = []
-        areas = []
-        needs_refine = []
-        for tri in mesh_tris:
-            vertices = mesh_points[tri]
-            bary = np.sum(np.array(vertices), axis=0)/3
-            bary_p = shapely.geometry.Point(bary[0], bary[1])
-            distances.append(bary_p.distance(river_multiline))
-            areas.append(workflow.utils.triangle_area(vertices))
-            needs_refine.append(my_refine_func(vertices, areas[-1]))
+        logging.info("Triangulation diagnostics")
+        tol = refine_distance_tol
+        if tol is None and refine_distance is not None:
+            tol = 0.01 * refine_distance[2]
+        quality = workflow.mesh_quality.triangle_quality(mesh_points, mesh_tris, rivers, tol)
+        workflow.mesh_quality.report(quality)
 
         if verbosity > 0:
-            plt.figure()
-            plt.subplot(121)
-            plt.hist(distances)
-            plt.xlabel("distance from river of triangle centroids [m]")
-            plt.ylabel("count [-]")
-            plt.subplot(122)
-            plt.scatter(distances, areas,c=needs_refine,marker='x')
-            plt.xlabel("distance [m]")
-            plt.ylabel("triangle area [m^2]")
-
-            # plt.figure()
-            # plt.subplot(111)
-            # workflow.plot.hucs(hucs)
-            # workflow.plot.rivers(rivers)
-            # workflow.plot.triangulation(mesh_points, mesh_tris, areas)
-            # plt.title("triangle area [m^2]")
+            needs_refine = workflow.mesh_quality.needs_refinement(quality, refine_max_area,
+                                                                  refine_distance, refine_max_edge_length)
+            workflow.plot.triangulation_diagnostics(quality, needs_refine)
     return mesh_points, mesh_tris
 
 def elevate(mesh_points, mesh_crs, dem, dem_profile, algorithm='piecewise bilinear'):
@@ -717,14 +737,16 @@ def elevate(mesh_points, mesh_crs, dem, dem_profile, algorithm='piecewise biline
         Array of triangle vertices.
     mesh_crs : :obj:`crs`
         Mesh coordinate system.
-    dem : np.array
-        2D array forming an elevation raster.
+    dem : np.array or :obj:`RasterMosaic`
+        2D array forming an elevation raster, or a lazily read mosaic,
+        of which only the blocks containing mesh points are read.
     dem_profile : dict
         rasterio profile for the elevation raster.
     algorithm : str
         Algorithm used for interpolation.  One of:
         * "nearest"
         * "piecewise bilinear"
+        * "piecewise bicubic"
 
     Returns
     -------
@@ -745,6 +767,43 @@ def elevate(mesh_points, mesh_crs, dem, dem_profile, algorithm='piecewise biline
     return mesh_points_3
 
 
+def elevate_from_source(mesh_points, mesh_crs, source, algorithm='piecewise bilinear'):
+    """Elevate mesh_points onto a DEM read directly from the source's tiles.
+
+    Unlike get_raster_on_shape() followed by elevate(), no raster
+    covering the whole domain is formed: sources that provide
+    `get_raster_on_points()`, such as FileManagerNED, open only the
+    tiles containing mesh points and read only the blocks around them,
+    interpolating across tile seams as if the tiles were merged, so
+    memory scales with the mesh rather than the area of the domain.
+    Other sources fall back to a DEM on the points' bounding box.
+
+    Parameters
+    ----------
+    mesh_points : np.array((n_points, 2), 'd')
+        Array of triangle vertices.
+    mesh_crs : :obj:`crs`
+        Mesh coordinate system.
+    source : :obj:`source-type`
+        DEM source object.
+    algorithm : str
+        Algorithm used for interpolation, see elevate().
+
+    Returns
+    -------
+    np.array((n_points, 3), 'd')
+        Array of triangle vertices, including a z-dimension.
+    """
+    if hasattr(source, 'get_raster_on_points'):
+        dem_profile, dem = source.get_raster_on_points(mesh_points, mesh_crs)
+        with dem:
+            return elevate(mesh_points, mesh_crs, dem, dem_profile, algorithm)
+
+    bounds = shapely.geometry.MultiPoint(mesh_points[:,0:2]).envelope
+    dem_profile, dem = get_raster_on_shape(source, bounds, mesh_crs)
+    return elevate(mesh_points, mesh_crs, dem, dem_profile, algorithm)
+
+
 def values_from_raster(points, points_crs, raster, raster_profile, algorithm='nearest'):
     """Interpolate a raster onto a collection of unstructured points.
 
@@ -754,14 +813,16 @@ def values_from_raster(points, points_crs, raster, raster_profile, algorithm='ne
         Array of points to interpolate onto.
     points_crs : :obj:`crs`
         Coordinate system of the points.
-    raster : np.array
-        2D array forming the raster.
+    raster : np.array or :obj:`RasterMosaic`
+        2D array forming the raster, or a lazily read mosaic, see
+        workflow.sources.raster_mosaic.
     raster_profile : dict
         rasterio profile for the raster.
     algorithm : str
         Algorithm used for interpolation.  One of:
         * "nearest"
         * "piecewise bilinear"
+        * "piecewise bicubic"
 
     Returns
     -------
@@ -770,36 +831,22 @@ def values_from_raster(points, points_crs, raster, raster_profile, algorithm='ne
 
     """
     points_raster_crs = np.array(workflow.warp.warp_xy(points[:,0], points[:,1], points_crs, raster_profile['crs'])).transpose()
+    lazy = isinstance(raster, workflow.sources.raster_mosaic.RasterMosaic)
     if algorithm == 'nearest':
-        values = raster[rasterio.transform.rowcol(raster_profile['transform'], points_raster_crs[:,0], points_raster_crs[:,1])]
-    elif algorithm == 'piecewise bilinear':
-        eps = 1.e-10
-        
-        # get the index of the point
-        invtransform = ~raster_profile['transform']
-        mybox = np.zeros((2,2),'d')
-        values = np.zeros((len(points),),'d')
-        for k,xy in enumerate(points_raster_crs):
-            xy = tuple(xy)
-            j,i = invtransform * xy
-
-            # center on pixel
-            i -= 0.5
-            j -= 0.5
-            
-            i = max(eps, min(raster_profile['height']-1-eps, i))
-            j = max(eps, min(raster_profile['width']-1-eps, j))
-
-            mybox[0,0] = raster[math.floor(i), math.floor(j)]
-            mybox[0,1] = raster[math.floor(i), math.ceil(j)]
-            mybox[1,0] = raster[math.ceil(i), math.floor(j)]
-            mybox[1,1] = raster[math.ceil(i), math.ceil(j)]
-            ii = i%1
-            jj = j%1
-
-            up = mybox[0,0] + jj * (mybox[0,1] - mybox[0,0])
-            dn = mybox[1,0] + jj * (mybox[1,1] - mybox[1,0])
-            values[k] = up + (dn - up) * ii
+        rowcol = workflow.interpolate.rowcol(points_raster_crs, raster_profile['transform'])
+        if lazy:
+            values = raster.sample(*rowcol)
+        else:
+            values = raster[rowcol]
+    elif algorithm in ['piecewise bilinear', 'piecewise bicubic'] and lazy:
+        values = workflow.interpolate.interpolate_windows(points_raster_crs, raster.window, raster.shape,
+                                                          raster_profile['transform'], algorithm,
+                                                          raster_profile.get('nodata', None), raster.block_size)
+    elif algorithm in ['piecewise bilinear', 'piecewise bicubic']:
+        values = workflow.interpolate.interpolate(points_raster_crs, raster, raster_profile['transform'],
+                                                  algorithm, raster_profile.get('nodata', None))
+    else:
+        raise ValueError('Unknown algorithm "{}"'.format(algorithm))
     return values
     
 
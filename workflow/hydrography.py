@@ -11,6 +11,8 @@ import shapely.geometry
 import workflow.conf
 import workflow.utils
 import workflow.tree
+import workflow.river_network
+import workflow.spatial_index
 import workflow.split_hucs
 import workflow.plot
 
@@ -19,7 +21,7 @@ def snap(hucs, rivers, tol=0.1, tol_triples=None, cut_intersections=False):
     """Snap HUCs to rivers."""
     assert(type(hucs) is workflow.split_hucs.SplitHUCs)
     assert(type(rivers) is list)
-    assert(all(workflow.tree.is_consistent(river) for river in rivers))
+    assert(workflow.tree.is_consistent(rivers))
     list(hucs.polygons())
 
     if len(rivers) is 0:
@@ -31,7 +33,7 @@ def snap(hucs, rivers, tol=0.1, tol_triples=None, cut_intersections=False):
     # snap boundary triple junctions to river endpoints
     logging.info("  snapping polygon segment boundaries to river endpoints")
     snap_polygon_endpoints(hucs, rivers, tol_triples)
-    if not all(workflow.tree.is_consistent(river) for river in rivers):
+    if not workflow.tree.is_consistent(rivers):
         logging.info("    ...resulted in inconsistent rivers!")
         return False
     try:
@@ -48,9 +50,8 @@ def snap(hucs, rivers, tol=0.1, tol_triples=None, cut_intersections=False):
     # snap endpoints of all rivers to the boundary if close
     # note this is a null-op on cases dealt with above
     logging.info("  snapping river endpoints to the polygon")
-    for tree in rivers:
-        snap_endpoints(tree, hucs, tol)
-    if not all(workflow.tree.is_consistent(river) for river in rivers):
+    snap_river_endpoints(hucs, rivers, tol)
+    if not workflow.tree.is_consistent(rivers):
         logging.info("    ...resulted in inconsistent rivers!")
         return False
     try:
@@ -67,8 +68,7 @@ def snap(hucs, rivers, tol=0.1, tol_triples=None, cut_intersections=False):
     if cut_intersections:
         logging.info("  cutting at crossings")
         snap_crossings(hucs, rivers, tol)
-        consistent = all(workflow.tree.is_consistent(river) for river in rivers)
-        if not consistent:
+        if not workflow.tree.is_consistent(rivers):
             logging.info("  ...resulted in inconsistent rivers!")
             return False
         try:
@@ -105,11 +105,42 @@ def _snap_and_cut(point, line, tol=0.1):
             return nearest_p
     return None
 
-def _snap_crossing(hucs, river_node, tol=0.1):
-    """Snap a single river node"""
+def _segment_owners(components):
+    """Map each segment handle to the position, in iteration order, of
+    the component (spine) that contains it."""
+    owners = dict()
+    for pos, component in enumerate(components):
+        for seg_handle in component:
+            owners[seg_handle] = pos
+    return owners
+
+def _point_bounds(p):
+    """Bounding box of a single point."""
+    return (p[0], p[1], p[0], p[1])
+
+def _snap_crossing(hucs, river_node, tol=0.1, spines=None, owners=None):
+    """Snap a single river node
+
+    spines, if provided, is the list of intersection spines then
+    boundary spines of hucs.  If owners, the map from segment handle to
+    position in spines (see _segment_owners), is also provided, the
+    segment spatial index is used to skip spines that cannot cross the
+    river, and owners is kept up to date as segments are split.
+    """
     r = river_node.segment
     logging.debug("len spine, boundary = {0},{1}".format(len(hucs.intersections), len(hucs.boundaries)))
-    for b,spine in itertools.chain(hucs.intersections.items(), hucs.boundaries.items()):
+    if spines is None:
+        spines = list(itertools.chain(hucs.intersections, hucs.boundaries))
+    if owners is not None:
+        # only spines with a segment whose bounding box overlaps the
+        # river's can intersect it
+        near = hucs.segment_index().query(r.bounds)
+        candidates = sorted(set(owners[h] for h in near))
+    else:
+        candidates = range(len(spines))
+
+    for pos in candidates:
+        spine = spines[pos]
         logging.debug("len spine seg = {0}".format(len(spine)))
         #for b,spine in hucs.intersections.items():
         for s,seg_handle in spine.items():
@@ -151,13 +182,25 @@ def _snap_crossing(hucs, river_node, tol=0.1):
                     assert(len(new_spine) == 2)
                     new_handle = hucs.segments.add(new_spine[1])
                     spine.add(new_handle)
+                    if owners is not None:
+                        owners[new_handle] = pos
                 break
                     
-def snap_crossings(hucs, rivers, tol=0.1):
-    """Snaps HUC boundaries and rivers to crossings."""
+def snap_crossings(hucs, rivers, tol=0.1, use_index=True):
+    """Snaps HUC boundaries and rivers to crossings.
+
+    If use_index is True, the segment spatial index of hucs is used to
+    find candidate crossings; otherwise every river is checked against
+    every segment.
+    """
+    spines = list(itertools.chain(hucs.intersections, hucs.boundaries))
+    if use_index:
+        owners = _segment_owners(spines)
+    else:
+        owners = None
     for tree in rivers:
         for river_node in tree.preOrder():
-            _snap_crossing(hucs, river_node, tol)
+            _snap_crossing(hucs, river_node, tol, spines, owners)
     
 def snap_polygon_endpoints(hucs, rivers, tol=0.1):
     """Snaps the endpoints of HUC segments to endpoints of rivers."""
@@ -182,16 +225,70 @@ def snap_polygon_endpoints(hucs, rivers, tol=0.1):
                 logging.debug("  Moving HUC segment point -1 to river at %r"%list(new_seg[-1]))
             hucs.segments[seg_handle] = shapely.geometry.LineString(new_seg)
 
-def snap_endpoints(tree, hucs, tol=0.1):
+def snap_river_endpoints(hucs, rivers, tol=0.1, use_index=True):
+    """Snap river endpoints to huc segments and insert that point into
+    the boundary, for all rivers.
+
+    If use_index is True, the segment spatial index of hucs is used to
+    find nearby segments; otherwise every river is checked against
+    every segment.
+    """
+    components = list(itertools.chain(hucs.boundaries, hucs.intersections))
+    if use_index:
+        owners = _segment_owners(components)
+    else:
+        owners = None
+    for tree in rivers:
+        _snap_endpoints(tree, hucs, tol, components, owners)
+
+def snap_endpoints(tree, hucs, tol=0.1, use_index=True):
     """Snap river endpoints to huc segments and insert that point into
     the boundary.
 
-    Note this is O(n^2), and could be made more efficient.
+    Components of the HUC boundary are checked in order, boundaries
+    first, then intersections.  If use_index is True, only components
+    with a segment near a river endpoint are visited, using the
+    segment spatial index of hucs.  Otherwise every component is
+    checked for every river, which is O(n^2).
+    """
+    components = list(itertools.chain(hucs.boundaries, hucs.intersections))
+    if use_index:
+        owners = _segment_owners(components)
+    else:
+        owners = None
+    return _snap_endpoints(tree, hucs, tol, components, owners)
+
+def _snap_endpoints(tree, hucs, tol, components, owners):
+    """Snap the endpoints of a single tree.
+
+    components is the list of boundary then intersection components of
+    hucs.  If owners, the map from segment handle to position in
+    components, is not None, the segment spatial index is used and
+    owners is kept up to date as segments are split.
     """
     to_add = []
+    if owners is not None:
+        index = hucs.segment_index()
+
     for node in tree.preOrder():
         river = node.segment
-        for b,component in itertools.chain(hucs.boundaries.items(), hucs.intersections.items()):
+        pos = -1
+        while True:
+            # find the next component to check
+            if owners is not None:
+                # the river is updated as it is snapped, so look for
+                # components near its current endpoints
+                near = index.query(_point_bounds(river.coords[0]), tol) + \
+                       index.query(_point_bounds(river.coords[-1]), tol)
+                later = [owners[h] for h in near if owners[h] > pos]
+                if len(later) == 0:
+                    break
+                pos = min(later)
+            else:
+                pos += 1
+                if pos == len(components):
+                    break
+            component = components[pos]
 
             # note, this is done in two stages to allow it deal with both endpoints touching
             for s,seg_handle in component.items():
@@ -326,6 +423,9 @@ def snap_endpoints(tree, hucs, tol=0.1):
         hucs.segments[seg_handle] = new_segs.pop(0)
         new_handles = hucs.segments.add_many(new_segs)
         insert_list[0][0].add_many(new_handles)
+        if owners is not None:
+            for h in new_handles:
+                owners[h] = owners[seg_handle]
 
     return river
 
@@ -399,11 +499,15 @@ def quick_cleanup(rivers, tol=0.1):
     rivers = shapely.ops.linemerge(rivers).simplify(tol)
     return rivers
 
-def cleanup(rivers, simp_tol=0.1, prune_tol=10, merge_tol=10):
+def cleanup(rivers, simp_tol=0.1, prune_tol=10, merge_tol=10, parallel_tol=None):
     """Some hydrography data seems to get some random branches, typically
     quite short, that are nearly perfectly parallel to other, longer
     branches.  Surely this is a data error -- remove them.
 
+    Short leaf branches are pruned, short interior reaches merged, and,
+    if parallel_tol is given, leaf branches lying within parallel_tol of
+    a longer reach removed, see remove_leaves().
+
     This returns rivers in a forest, not in a list.
     """
     # simplify
@@ -411,12 +515,130 @@ def cleanup(rivers, simp_tol=0.1, prune_tol=10, merge_tol=10):
         for tree in rivers:
             simplify(tree, simp_tol)
 
-    # prune short leaf branches and merge short interior reaches
-    for tree in rivers:
-        if merge_tol is not None:
+    # merge short interior reaches
+    if merge_tol is not None:
+        for tree in rivers:
             merge(tree, merge_tol)
-        if merge_tol != prune_tol and prune_tol is not None:
-            prune(tree, prune_tol)
+
+    # prune short and parallel leaf branches, all at once
+    if merge_tol == prune_tol:
+        prune_tol = None
+    if prune_tol is not None or parallel_tol is not None:
+        remove_leaves(rivers, prune_tol, parallel_tol)
+
+def _is_within(a, b, tol, chunk_size=2**16):
+    """Does all of the polyline a lie within tol of the polyline b?
+
+    a is sampled at its vertices and at most tol apart along its
+    segments, b is taken exactly.  Coordinates are arrays of xy.
+    Samples are checked in chunks of about chunk_size point-segment
+    pairs, stopping at the first sample farther than tol.
+    """
+    seg = np.diff(a, axis=0)
+    n = np.maximum(np.ceil(np.linalg.norm(seg, axis=1) / tol), 1).astype(int)
+    first = np.cumsum(n) - n
+    n_samples = n.sum() + 1
+
+    p = b[:-1]
+    d = np.diff(b, axis=0)
+    dd = np.sum(d**2, axis=1)
+    step = max(chunk_size // len(p), 1)
+    for start in range(0, n_samples, step):
+        # samples start to start+step, the last one being the end of a
+        i = np.arange(start, min(start+step, n_samples))
+        k = np.minimum(np.searchsorted(first, i, side='right') - 1, len(seg)-1)
+        t = (i - first[k]) / n[k]
+        points = a[k] + seg[k] * t[:,None]
+
+        # distance of each sample to each segment of b
+        w = points[:,None,:] - p[None,:,:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.where(dd > 0, np.sum(w * d[None,:,:], axis=2) / dd, 0.)
+        np.clip(s, 0., 1., out=s)
+        dist2 = np.sum((w - s[:,:,None] * d[None,:,:])**2, axis=2)
+        if np.any(dist2.min(axis=1) > tol**2):
+            return False
+    return True
+
+def find_parallel(network, tol, candidates=None):
+    """Finds leaf reaches of a RiverNetwork that nearly duplicate another reach.
+
+    A reach is a near duplicate if all of it lies within tol of a
+    reach at least as long -- the directed Hausdorff distance from it
+    to the other reach is at most tol.  Of reaches of equal length,
+    the one numbered last is the duplicate.  Only reaches overlapping
+    the bounding box of a candidate, expanded by tol, are compared,
+    found with an STRtree over reach bounding boxes.
+
+    Parameters
+    ----------
+    network : workflow.river_network.RiverNetwork
+    tol : float
+        Distance within which a reach is a duplicate.
+    candidates : np.array((n_reaches,), bool), optional
+        Reaches to consider removing, by default all leaves that are
+        not outlets.
+
+    Returns a mask of the duplicate reaches.
+    """
+    if candidates is None:
+        candidates = network.is_leaf() & (network.parent >= 0)
+    lengths = network.lengths()
+    xy = network.coords[:,0:2]
+    starts = network.coord_offsets[:-1]
+    lower = np.stack([np.minimum.reduceat(xy[:,0], starts), np.minimum.reduceat(xy[:,1], starts)], axis=1)
+    upper = np.stack([np.maximum.reduceat(xy[:,0], starts), np.maximum.reduceat(xy[:,1], starts)], axis=1)
+    index = workflow.spatial_index.BoundsIndex(np.concatenate([lower, upper], axis=1))
+
+    parallel = np.zeros((len(network),), bool)
+    for i in np.flatnonzero(candidates):
+        found = index.query(np.concatenate([lower[i], upper[i]]), tol)
+        # longer reaches whose expanded bounding box contains this one
+        found = found[(found != i) & ((lengths[found] > lengths[i]) | ((lengths[found] == lengths[i]) & (found < i)))]
+        found = found[np.all(lower[found] - tol <= lower[i], axis=1) & np.all(upper[found] + tol >= upper[i], axis=1)]
+        a = xy[network.coord_offsets[i]:network.coord_offsets[i+1]]
+        for j in found:
+            b = xy[network.coord_offsets[j]:network.coord_offsets[j+1]]
+            if _is_within(a, b, tol):
+                parallel[i] = True
+                break
+    return parallel
+
+def remove_leaves(rivers, prune_tol=None, parallel_tol=None):
+    """Removes leaf segments that are short or parallel to another reach.
+
+    Leaves shorter than prune_tol, as by prune(), and leaves within
+    parallel_tol of a longer reach, as by find_parallel(), are found
+    for the whole forest at once, on its RiverNetwork, and then removed
+    from each parent in one pass.  As with prune(), reaches that become
+    leaves are not removed, nor are roots of the trees.  Reaches under
+    a root without a segment, as made by workflow.tree.make_trees(), may
+    be removed, as by prune().
+
+    Returns the number of segments removed.
+    """
+    nodes = [node for tree in rivers for node in tree.preOrder() if node.segment is not None]
+    network = workflow.river_network.RiverNetwork.from_trees(rivers)
+    # network outlets include reaches whose Tree parent has no segment
+    has_parent = np.array([node.parent is not None for node in nodes], dtype=bool)
+    candidates = network.is_leaf() & has_parent
+    remove = np.zeros((len(network),), bool)
+    if prune_tol is not None:
+        remove = candidates & (network.lengths() < prune_tol)
+        logging.info("  ...cleaned %d leaf segments shorter than %g"%(np.count_nonzero(remove), prune_tol))
+    if parallel_tol is not None:
+        parallel = find_parallel(network, parallel_tol, candidates & ~remove)
+        logging.info("  ...cleaned %d leaf segments parallel to another reach"%np.count_nonzero(parallel))
+        remove |= parallel
+
+    removed = np.flatnonzero(remove)
+    by_parent = dict()
+    for i in removed:
+        logging.debug("  ...cleaned leaf segment of length: %g at centroid %r"%(nodes[i].segment.length, nodes[i].segment.centroid.coords[0]))
+        by_parent.setdefault(id(nodes[i].parent), []).append(nodes[i])
+    for group in by_parent.values():
+        group[0].parent.removeChildren(group)
+    return len(removed)
 
 def prune(tree, prune_tol=10):
     """Removes any leaf segments that are shorter than prune_tol"""
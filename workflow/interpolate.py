@@ -0,0 +1,264 @@
+"""Array-based interpolation of rasters onto unstructured points.
+
+All routines here work on whole arrays of points at once, processing
+them in chunks so that the temporary arrays stay bounded in size no
+matter how many points are requested.  Points are expected to already
+be in the raster's coordinate system.
+
+Pixels which are NaN, or equal to the raster's nodata value, are
+treated as missing.  Missing corners are skipped and the remaining
+weights are renormalized; if no valid pixel contributes to a point,
+that point gets NaN.
+"""
+
+import numpy as np
+
+_eps = 1.e-10
+
+# number of points processed at once -- bounds temporary memory to a
+# few tens of MB for bicubic interpolation
+default_chunk_size = 2**18
+
+
+def valid_mask(values, nodata=None):
+    """Mask of values which are neither NaN nor the nodata value."""
+    valid = ~np.isnan(values)
+    if nodata is not None and not np.isnan(nodata):
+        valid &= (values != nodata)
+    return valid
+
+
+def rowcol(points, transform):
+    """Integer (row, col) of the pixels containing points.
+
+    An array version of rasterio.transform.rowcol(), which transforms
+    and floors one point at a time, with identical results.
+    """
+    sa, sb, sc, sd, se, sf = tuple(~transform)[0:6]
+    x = points[:,0]
+    y = points[:,1]
+    j = x * sa + y * sb + sc
+    i = x * sd + y * se + sf
+    return np.floor(i).astype(np.intp), np.floor(j).astype(np.intp)
+
+
+def fractional_index(points, transform, height, width):
+    """Computes the fractional (row, col) of points, centered on pixels.
+
+    Indices are clamped into [eps, n-1-eps] so that the floor and ceil
+    of each index are always valid pixels.
+
+    Parameters
+    ----------
+    points : np.array((n_points, 2), 'd')
+        Points, in the raster's coordinate system.
+    transform : :obj:`affine.Affine`
+        The raster's (forward) affine transform.
+    height, width : int
+        Raster shape.
+
+    Returns
+    -------
+    i, j : np.array((n_points,), 'd')
+        Fractional row and column of each point.
+    """
+    sa, sb, sc, sd, se, sf = tuple(~transform)[0:6]
+    x = points[:,0]
+    y = points[:,1]
+
+    # apply the inverse transform, matching Affine.__mul__ term by term
+    j = x * sa + y * sb + sc
+    i = x * sd + y * se + sf
+
+    # center on pixel
+    i = i - 0.5
+    j = j - 0.5
+
+    i = np.maximum(_eps, np.minimum(height-1-_eps, i))
+    j = np.maximum(_eps, np.minimum(width-1-_eps, j))
+    return i, j
+
+
+def _bilinear(raster, i, j, nodata):
+    """Bilinear interpolation at fractional indices i,j."""
+    i0 = np.floor(i).astype(np.intp)
+    i1 = np.ceil(i).astype(np.intp)
+    j0 = np.floor(j).astype(np.intp)
+    j1 = np.ceil(j).astype(np.intp)
+
+    b00 = raster[i0, j0].astype('d')
+    b01 = raster[i0, j1].astype('d')
+    b10 = raster[i1, j0].astype('d')
+    b11 = raster[i1, j1].astype('d')
+    ii = i % 1
+    jj = j % 1
+
+    # same arithmetic, in the same order, as the original pointwise
+    # algorithm, so results are bitwise identical where all corners are valid
+    up = b00 + jj * (b01 - b00)
+    dn = b10 + jj * (b11 - b10)
+    values = up + (dn - up) * ii
+
+    # skip missing corners, renormalizing the weights of the rest
+    corners = np.stack([b00, b01, b10, b11])
+    valid = valid_mask(corners, nodata)
+    bad = ~valid.all(axis=0)
+    if bad.any():
+        iib = ii[bad]
+        jjb = jj[bad]
+        weights = np.stack([(1-iib)*(1-jjb), (1-iib)*jjb, iib*(1-jjb), iib*jjb])
+        weights = np.where(valid[:,bad], weights, 0.)
+        wsum = weights.sum(axis=0)
+        corner_vals = np.where(valid[:,bad], corners[:,bad], 0.)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values[bad] = np.where(wsum > 0, (weights*corner_vals).sum(axis=0) / wsum, np.nan)
+    return values
+
+
+def _cubic_weights(t, a=-0.5):
+    """Keys cubic convolution weights for offsets -1, 0, 1, 2 from floor."""
+    t2 = t*t
+    t3 = t2*t
+    w_m1 = a*t3 - 2*a*t2 + a*t
+    w_0 = (a+2)*t3 - (a+3)*t2 + 1
+    w_1 = -(a+2)*t3 + (2*a+3)*t2 - a*t
+    w_2 = -a*t3 + a*t2
+    return np.stack([w_m1, w_0, w_1, w_2])
+
+
+def _bicubic(raster, i, j, nodata):
+    """Bicubic (Keys, a=-1/2) interpolation at fractional indices i,j.
+
+    Stencils are clamped at the raster edges.  Points whose 4x4
+    stencil contains a missing pixel fall back to bilinear
+    interpolation, which skips missing corners.
+    """
+    height, width = raster.shape
+    i0 = np.floor(i).astype(np.intp)
+    j0 = np.floor(j).astype(np.intp)
+    offsets = np.arange(-1,3)
+    rows = np.clip(i0[:,None] + offsets[None,:], 0, height-1)
+    cols = np.clip(j0[:,None] + offsets[None,:], 0, width-1)
+
+    # (n_points, 4, 4) stencil of raster values
+    stencil = raster[rows[:,:,None], cols[:,None,:]].astype('d')
+    wi = _cubic_weights(i - i0).transpose()
+    wj = _cubic_weights(j - j0).transpose()
+    values = np.einsum('pk,pkl,pl->p', wi, stencil, wj)
+
+    bad = ~valid_mask(stencil, nodata).all(axis=(1,2))
+    if bad.any():
+        values[bad] = _bilinear(raster, i[bad], j[bad], nodata)
+    return values
+
+
+_algorithms = {'piecewise bilinear' : _bilinear,
+               'piecewise bicubic' : _bicubic,
+               }
+
+
+def interpolate(points, raster, transform, algorithm='piecewise bilinear',
+                nodata=None, chunk_size=None):
+    """Interpolate a raster onto a collection of points.
+
+    Parameters
+    ----------
+    points : np.array((n_points, 2), 'd')
+        Points, in the raster's coordinate system.
+    raster : np.array
+        2D array forming the raster.
+    transform : :obj:`affine.Affine`
+        The raster's affine transform.
+    algorithm : str
+        One of "piecewise bilinear" or "piecewise bicubic".
+    nodata : raster dtype, optional
+        Value marking missing pixels, in addition to NaN.
+    chunk_size : int, optional
+        Number of points to process at once.  Defaults to
+        default_chunk_size.
+
+    Returns
+    -------
+    np.array((n_points,), 'd')
+        Interpolated values.
+    """
+    try:
+        interp = _algorithms[algorithm]
+    except KeyError:
+        raise ValueError('Unknown interpolation algorithm "{}", valid are: {}'.format(algorithm, list(_algorithms.keys())))
+    if chunk_size is None:
+        chunk_size = default_chunk_size
+
+    points = np.asarray(points, dtype='d')
+    height, width = raster.shape
+    values = np.empty((len(points),),'d')
+    for start in range(0, len(points), chunk_size):
+        chunk = slice(start, start+chunk_size)
+        i, j = fractional_index(points[chunk], transform, height, width)
+        values[chunk] = interp(raster, i, j, nodata)
+    return values
+
+
+def interpolate_windows(points, window, shape, transform, algorithm='piecewise bilinear',
+                        nodata=None, block_size=512):
+    """Interpolate a raster that is read a window at a time onto points.
+
+    Points are binned by the block_size by block_size block of pixels
+    containing them.  For each block containing points, the window of
+    pixels its points' stencils reach is read, and the points are
+    interpolated from that window, giving the same values as
+    interpolate() on the whole raster.
+
+    Parameters
+    ----------
+    points : np.array((n_points, 2), 'd')
+        Points, in the raster's coordinate system.
+    window : function
+        window(row0, row1, col0, col1) returns the pixels [row0, row1) x
+        [col0, col1) of the raster, for instance
+        workflow.sources.raster_mosaic.RasterMosaic.window.
+    shape : (int, int)
+        Shape (height, width) of the whole raster.
+    transform : :obj:`affine.Affine`
+        The raster's affine transform.
+    algorithm, nodata
+        See interpolate().
+    block_size : int, optional
+        Size of the blocks points are binned into.
+
+    Returns
+    -------
+    np.array((n_points,), 'd')
+        Interpolated values.
+    """
+    try:
+        interp = _algorithms[algorithm]
+    except KeyError:
+        raise ValueError('Unknown interpolation algorithm "{}", valid are: {}'.format(algorithm, list(_algorithms.keys())))
+
+    points = np.asarray(points, dtype='d')
+    height, width = shape
+    i, j = fractional_index(points, transform, height, width)
+    values = np.empty((len(points),),'d')
+    if len(points) == 0:
+        return values
+
+    i0 = np.floor(i).astype(np.intp)
+    j0 = np.floor(j).astype(np.intp)
+    bi = i0 // block_size
+    bj = j0 // block_size
+    block_ids = bi * ((width - 1) // block_size + 1) + bj
+    order = np.argsort(block_ids, kind='stable')
+    sorted_ids = block_ids[order]
+    starts = np.flatnonzero(np.concatenate([[True,], sorted_ids[1:] != sorted_ids[:-1]]))
+    for start, end in zip(starts, np.append(starts[1:], len(order))):
+        chunk = order[start:end]
+        # stencils reach one pixel before and two after the floor; they
+        # are clamped to the window, which only clips where the raster does
+        row0 = max(0, i0[chunk].min() - 1)
+        col0 = max(0, j0[chunk].min() - 1)
+        row1 = min(height, i0[chunk].max() + 3)
+        col1 = min(width, j0[chunk].max() + 3)
+        values[chunk] = interp(window(row0, row1, col0, col1), i[chunk] - row0, j[chunk] - col0, nodata)
+    return values
+
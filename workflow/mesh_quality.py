@@ -0,0 +1,136 @@
+"""Quality diagnostics of triangulations.
+
+Computes areas, edge lengths, angles, aspect ratios and distances to
+the river network of every triangle at once, so that diagnostics cost
+little compared to the triangulation itself.  Plotting is separate,
+see workflow.plot.triangulation_diagnostics().
+"""
+
+import logging
+import numpy as np
+
+import workflow.river_distance
+
+
+def triangle_quality(points, tris, rivers=None, tol=None):
+    """Computes quality metrics of all triangles.
+
+    Parameters
+    ----------
+    points : np.array((n_points, 2 or 3), 'd')
+        Triangle vertices; only x and y are used.
+    tris : np.array((n_tris, 3), 'i')
+        Indices into points of each triangle.
+    rivers : list(workflow.tree.Tree) or RiverDistance, optional
+        If provided, distances of triangle centroids to these rivers
+        are included.
+    tol : float, optional
+        Accuracy of river distances, see
+        workflow.river_distance.RiverDistance.  Defaults to 1% of the
+        square root of the mean triangle area.
+
+    Returns
+    -------
+    dict
+        Arrays, one entry per triangle:
+
+        * `area` : signed area, positive for counter-clockwise triangles
+        * `edge_lengths` : (n_tris, 3) lengths of the edges opposite
+          each vertex
+        * `min_angle`, `max_angle` : smallest and largest angles, in
+          degrees
+        * `aspect_ratio` : circumradius over twice the inradius, 1 for
+          equilateral triangles and growing as they degenerate
+        * `centroid` : (n_tris, 2) centroids
+        * `river_distance` : distance from the centroid to the rivers,
+          if rivers were given
+    """
+    tris = np.asarray(tris)
+    xy = np.asarray(points)[:,0:2]
+    p = xy[tris]  # (n_tris, 3, 2)
+
+    # edge i is opposite vertex i
+    e = np.stack([p[:,2] - p[:,1], p[:,0] - p[:,2], p[:,1] - p[:,0]], axis=1)
+    lengths = np.linalg.norm(e, axis=2)
+    area = 0.5 * (e[:,2,0] * (-e[:,1,1]) - e[:,2,1] * (-e[:,1,0]))
+
+    # angle at vertex i, between the two edges adjacent to it
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos = np.stack([-np.sum(e[:,1]*e[:,2], axis=1) / (lengths[:,1]*lengths[:,2]),
+                        -np.sum(e[:,2]*e[:,0], axis=1) / (lengths[:,2]*lengths[:,0]),
+                        -np.sum(e[:,0]*e[:,1], axis=1) / (lengths[:,0]*lengths[:,1])], axis=1)
+        angles = np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+        # R / 2r = abc / (8 A^2 / s) with s the semi-perimeter
+        s = 0.5 * lengths.sum(axis=1)
+        aspect = np.prod(lengths, axis=1) * s / (8 * area**2)
+
+    quality = dict(area=area,
+                   edge_lengths=lengths,
+                   min_angle=angles.min(axis=1),
+                   max_angle=angles.max(axis=1),
+                   aspect_ratio=aspect,
+                   centroid=p.mean(axis=1))
+
+    if isinstance(rivers, workflow.river_distance.RiverDistance):
+        quality['river_distance'] = rivers.distances(quality['centroid'])
+    elif rivers is not None and len(rivers) > 0:
+        if tol is None:
+            tol = 0.01 * np.sqrt(np.abs(area).mean()) if len(area) > 0 else 1.
+        river_distance = workflow.river_distance.RiverDistance(rivers, tol)
+        quality['river_distance'] = river_distance.distances(quality['centroid'])
+    return quality
+
+
+def needs_refinement(quality, refine_max_area=None, refine_distance=None,
+                     refine_max_edge_length=None):
+    """Which triangles would be refined by the criteria of
+    workflow.hilev.triangulate(), given the output of
+    triangle_quality().
+
+    refine_distance requires quality to include river_distance.
+    """
+    area = quality['area']
+    refine = np.zeros(area.shape, bool)
+    if refine_max_area is not None:
+        refine |= area > refine_max_area
+    if refine_distance is not None:
+        near_distance, near_area, away_distance, away_area = refine_distance
+        d = quality['river_distance']
+        max_area = near_area + (d - near_distance) / (away_distance - near_distance) * (away_area - near_area)
+        max_area = np.where(d > away_distance, away_area, np.where(d < near_distance, near_area, max_area))
+        refine |= area > max_area
+    if refine_max_edge_length is not None:
+        refine |= quality['edge_lengths'].max(axis=1) > refine_max_edge_length
+    return refine
+
+
+def summarize(quality):
+    """Summary statistics of each scalar metric in quality.
+
+    Returns a dict of metric name to a dict of min, 5th percentile,
+    median, mean, 95th percentile and max.
+    """
+    summary = dict()
+    for key, values in quality.items():
+        if key == 'centroid':
+            continue
+        values = values.ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            continue
+        p5, median, p95 = np.percentile(values, [5, 50, 95])
+        summary[key] = dict(min=values.min(), p5=p5, median=median,
+                            mean=values.mean(), p95=p95, max=values.max())
+    return summary
+
+
+def report(quality, log=logging.info):
+    """Writes a table of summarize(quality), by default to the log."""
+    summary = summarize(quality)
+    log("  %i triangles"%len(quality['area']))
+    log("  %-16s %12s %12s %12s %12s %12s %12s"%('', 'min', '5%', 'median', 'mean', '95%', 'max'))
+    for key, stats in summary.items():
+        log("  %-16s %12.4g %12.4g %12.4g %12.4g %12.4g %12.4g"%(key, stats['min'], stats['p5'], stats['median'],
+                                                              stats['mean'], stats['p95'], stats['max']))
+    return summary
@@ -204,6 +204,34 @@ def triangulation(points, tris, crs, color='gray', ax=None, **kwargs):
     return col
 
 
+def triangulation_diagnostics(quality, needs_refine=None, fig=None):
+    """Plots histograms of triangle quality, from workflow.mesh_quality.triangle_quality().
+
+    With river distances, plots the distribution of centroid distances
+    and area against distance, colored by needs_refine; otherwise the
+    distributions of area and minimum angle.
+    """
+    if fig is None:
+        fig = plt.figure()
+    ax1 = fig.add_subplot(121)
+    ax2 = fig.add_subplot(122)
+    if 'river_distance' in quality:
+        ax1.hist(quality['river_distance'])
+        ax1.set_xlabel("distance from river of triangle centroids [m]")
+        ax1.set_ylabel("count [-]")
+        ax2.scatter(quality['river_distance'], quality['area'], c=needs_refine, marker='x')
+        ax2.set_xlabel("distance [m]")
+        ax2.set_ylabel("triangle area [m^2]")
+    else:
+        ax1.hist(quality['area'])
+        ax1.set_xlabel("triangle area [m^2]")
+        ax1.set_ylabel("count [-]")
+        ax2.hist(quality['min_angle'])
+        ax2.set_xlabel("minimum angle [degrees]")
+        ax2.set_ylabel("count [-]")
+    return fig
+
+
 def dem(profile, data, ax=None, vmin=None, vmax=None, **kwargs):
     """Plots a raster"""
     if ax is None:
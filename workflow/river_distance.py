@@ -0,0 +1,112 @@
+"""Fast distance queries to a river network.
+
+Refinement callbacks and mesh diagnostics ask for the distance from
+very many points to the same river network.  Asking shapely for each
+one costs time proportional to the total number of river vertices.
+RiverDistance instead densifies the rivers once, so that consecutive
+points are at most tol apart, and builds a KD-tree over those points;
+each query is then a logarithmic-time nearest neighbor search that
+overestimates the true distance by at most tol/2.
+
+Refinement callbacks ask for one point at a time, and Triangle asks
+about nearby, and often the same, points repeatedly.  Single-point
+queries are memoized on a grid of spacing tol/sqrt(2), answering with
+the distance from the cell center, which adds at most tol/2 in either
+direction, so the total error stays within tol.
+"""
+
+import functools
+import math
+import numpy as np
+import scipy.spatial
+import shapely.geometry
+
+import workflow.tree
+
+
+def _lines(rivers):
+    """List of LineStrings in a forest, a shapely geometry, or a list of lines."""
+    if isinstance(rivers, shapely.geometry.base.BaseGeometry):
+        if hasattr(rivers, 'geoms'):
+            return [l for l in rivers.geoms if not l.is_empty]
+        return [rivers,] if not rivers.is_empty else []
+    rivers = list(rivers)
+    if len(rivers) > 0 and isinstance(rivers[0], workflow.tree.Tree):
+        return list(workflow.tree.forest_to_list(rivers).geoms)
+    return [l for l in rivers if not l.is_empty]
+
+
+def densify(lines, spacing):
+    """Points along lines, no more than spacing apart.
+
+    Includes every original vertex, plus evenly spaced points on each
+    segment longer than spacing.
+    """
+    coords = [np.array(l.coords)[:,0:2] for l in lines]
+    coords = [c for c in coords if len(c) > 0]
+    if len(coords) == 0:
+        return np.zeros((0,2),'d')
+
+    starts = np.concatenate([c[:-1] for c in coords])
+    ends = np.concatenate([c[1:] for c in coords])
+    lengths = np.linalg.norm(ends - starts, axis=1)
+    nsub = np.maximum(1, np.ceil(lengths / spacing)).astype(np.int64)
+
+    # parameter of each point along its segment
+    seg = np.repeat(np.arange(len(starts)), nsub)
+    first = np.cumsum(nsub) - nsub
+    t = (np.arange(len(seg)) - first[seg]) / nsub[seg]
+    points = starts[seg] + t[:,None] * (ends[seg] - starts[seg])
+
+    # the last vertex of each line
+    last = np.array([c[-1] for c in coords])
+    return np.concatenate([points, last])
+
+
+class RiverDistance:
+    """Distance from points to a river network, to within tol.
+
+    Parameters
+    ----------
+    rivers : list(workflow.tree.Tree), shapely geometry, or list(LineString)
+        The river network.
+    tol : float
+        Accuracy bound: distances differ from the true distance by at
+        most tol.
+    cache_size : int, optional
+        Number of single-point queries to memoize.
+
+    Calling the object with (x, y) gives the distance from one point,
+    memoized; distances() gives the distances of an array of points,
+    which are never underestimates.  With no rivers, all distances are
+    infinite.
+    """
+    def __init__(self, rivers, tol, cache_size=2**16):
+        if not tol > 0:
+            raise ValueError("RiverDistance requires a positive tolerance, not %r"%tol)
+        self.tol = tol
+        self.points = densify(_lines(rivers), tol)
+        if len(self.points) > 0:
+            self._kdtree = scipy.spatial.cKDTree(self.points)
+        else:
+            self._kdtree = None
+
+        # memo grid spacing: cell centers are within dx/sqrt(2) = tol/2
+        self._dx = tol / math.sqrt(2)
+        self._cell_distance = functools.lru_cache(maxsize=cache_size)(self._cell_distance)
+
+    def _cell_distance(self, i, j):
+        if self._kdtree is None:
+            return np.inf
+        return float(self._kdtree.query(((i+0.5)*self._dx, (j+0.5)*self._dx))[0])
+
+    def __call__(self, x, y):
+        """Distance from (x, y), memoized."""
+        return self._cell_distance(math.floor(x / self._dx), math.floor(y / self._dx))
+
+    def distances(self, points):
+        """Distances from each of an (n,2) array of points."""
+        points = np.asarray(points, dtype='d').reshape(-1, 2)
+        if self._kdtree is None:
+            return np.full((len(points),), np.inf)
+        return self._kdtree.query(points)[0]
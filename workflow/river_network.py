@@ -0,0 +1,335 @@
+"""A compact, array-backed representation of river networks.
+
+workflow.tree.Tree keeps a Python object per reach, and every
+operation on it walks the tree node by node.  RiverNetwork instead
+stores a forest of reaches as arrays:
+
+  parent        | np.array((n_reaches,), int), the downstream reach of
+                | each reach, or -1 for outlets
+  child_offsets | np.array((n_reaches+1,), int), into children
+  children      | np.array((n_reaches - n_outlets,), int), the upstream
+                | reaches of reach i are
+                | children[child_offsets[i]:child_offsets[i+1]], in order
+  coords        | np.array((n_coords, dim), 'd'), all reach coordinates,
+                | each reach ordered from upstream to downstream
+  coord_offsets | np.array((n_reaches+1,), int), into coords
+
+and operations are array operations over all reaches at once, or over
+one level of the network at a time for accumulations from the leaves
+down to the outlets.  Networks converted from Trees number reaches in
+the preorder of the trees.
+"""
+
+import numpy as np
+import shapely.geometry
+
+import workflow.tree
+import workflow.utils
+
+
+def _csr(parent):
+    """CSR child lists from parent indices, children in index order."""
+    n = len(parent)
+    has_parent = np.flatnonzero(parent >= 0)
+    children = has_parent[np.argsort(parent[has_parent], kind='stable')]
+    counts = np.bincount(parent[has_parent], minlength=n)
+    offsets = np.zeros((n+1,), dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, children
+
+
+class RiverNetwork:
+    """A forest of river reaches stored as arrays.
+
+    Parameters
+    ----------
+    parent : np.array((n_reaches,), int)
+        Downstream reach of each reach, -1 for outlets.
+    coords : np.array((n_coords, dim), 'd')
+        Coordinates of all reaches, concatenated.
+    coord_offsets : np.array((n_reaches+1,), int)
+        Reach i is coords[coord_offsets[i]:coord_offsets[i+1]].
+    properties : list(dict), optional
+        Properties of each reach.
+
+    Use from_trees() and to_trees() to convert from and to
+    workflow.tree.Tree forests.
+    """
+    def __init__(self, parent, coords, coord_offsets, properties=None):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.coords = np.asarray(coords, dtype='d')
+        self.coord_offsets = np.asarray(coord_offsets, dtype=np.int64)
+        if properties is None:
+            properties = [dict() for i in range(len(self.parent))]
+        self.properties = list(properties)
+        self.child_offsets, self.children = _csr(self.parent)
+        self._levels = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def from_trees(cls, trees):
+        """Converts a forest of workflow.tree.Tree into a RiverNetwork.
+
+        Reaches are numbered in preorder.  Nodes without a segment, such
+        as the roots made by workflow.tree.make_trees(), are skipped,
+        their children becoming outlets.
+        """
+        if isinstance(trees, workflow.tree.Tree):
+            trees = [trees,]
+
+        segments = []
+        properties = []
+        parent = []
+        # (node, index of its parent reach), visited in preorder
+        stack = [(t, -1) for t in reversed(trees)]
+        while len(stack) > 0:
+            node, p = stack.pop()
+            if node.segment is not None:
+                segments.append(node.segment)
+                properties.append(node.properties)
+                parent.append(p)
+                p = len(parent) - 1
+            stack.extend((c, p) for c in reversed(node.children))
+
+        coords, coord_offsets = workflow.utils.linestring_coords(segments)
+        return cls(np.array(parent, dtype=np.int64), coords, coord_offsets, properties)
+
+    def segment(self, i):
+        """LineString of reach i."""
+        return shapely.geometry.LineString(self.coords[self.coord_offsets[i]:self.coord_offsets[i+1]])
+
+    def segments(self):
+        """List of LineStrings of all reaches."""
+        return [self.segment(i) for i in range(len(self))]
+
+    def to_trees(self):
+        """Converts to a list of workflow.tree.Tree, one per outlet."""
+        nodes = [workflow.tree.Tree(s, p) for (s, p) in zip(self.segments(), self.properties)]
+        for i in range(len(self)):
+            for c in self.children[self.child_offsets[i]:self.child_offsets[i+1]]:
+                nodes[i].addChild(nodes[c])
+        return [nodes[i] for i in self.outlets()]
+
+    def to_list(self):
+        """A MultiLineString of all reaches, as workflow.tree.forest_to_list()."""
+        return shapely.geometry.MultiLineString(self.segments())
+
+    def outlets(self):
+        """Indices of reaches with no downstream reach."""
+        return np.flatnonzero(self.parent < 0)
+
+    def num_children(self):
+        return np.diff(self.child_offsets)
+
+    def is_leaf(self):
+        """Mask of reaches with no upstream reaches."""
+        return self.num_children() == 0
+
+    def leaves(self):
+        """Indices of reaches with no upstream reaches."""
+        return np.flatnonzero(self.is_leaf())
+
+    def levels(self):
+        """Reaches grouped by distance, in reaches, from their outlet.
+
+        A list of arrays: outlets first, then their children, and so
+        on.  Every child is in the level after its parent.
+        """
+        if self._levels is None:
+            levels = []
+            level = self.outlets()
+            while len(level) > 0:
+                levels.append(level)
+                starts = self.child_offsets[level]
+                counts = self.child_offsets[level+1] - starts
+                # gather the CSR ranges of all reaches in the level
+                first = np.repeat(starts - np.cumsum(counts) + counts, counts)
+                level = self.children[first + np.arange(counts.sum())]
+            self._levels = levels
+        return self._levels
+
+    def order(self):
+        """A topological order of the reaches, each after its parent."""
+        if np.all(self.parent < np.arange(len(self))):
+            return np.arange(len(self))
+        levels = self.levels()
+        return np.concatenate(levels) if len(levels) > 0 else np.zeros((0,), np.int64)
+
+    def first_coords(self):
+        """First, most upstream, coordinate of each reach."""
+        return self.coords[self.coord_offsets[:-1]]
+
+    def last_coords(self):
+        """Last, most downstream, coordinate of each reach."""
+        return self.coords[self.coord_offsets[1:] - 1]
+
+    def lengths(self):
+        """Length of each reach."""
+        lengths = np.zeros((len(self),), 'd')
+        if len(self.coords) < 2:
+            return lengths
+        d = np.linalg.norm(np.diff(self.coords[:,0:2], axis=0), axis=1)
+        # pairs spanning two reaches
+        d[self.coord_offsets[1:-1] - 1] = 0.
+        counts = np.diff(self.coord_offsets)
+        long_enough = counts >= 2
+        lengths[long_enough] = np.add.reduceat(d, self.coord_offsets[:-1][long_enough])
+        return lengths
+
+    def is_consistent_reach(self, tol=workflow.utils._tol):
+        """Mask of reaches whose last coordinate is the first of their parent.
+
+        Outlets are always consistent.  This is the check of
+        workflow.tree.Tree.check_child_consistency(), for all reaches.
+        """
+        consistent = np.ones((len(self),), bool)
+        has_parent = np.flatnonzero(self.parent >= 0)
+        d2 = np.sum((self.last_coords()[has_parent] - self.first_coords()[self.parent[has_parent]])**2, axis=1)
+        consistent[has_parent] = d2 < tol**2
+        return consistent
+
+    def is_consistent(self, tol=workflow.utils._tol):
+        """Checks the geometric consistency of the network."""
+        return bool(np.all(self.is_consistent_reach(tol)))
+
+    def _sweep_upstream(self, values=(), strahler=False):
+        """One pass over the levels, from the leaves down to the outlets.
+
+        Returns the sums of each of values over each reach and all
+        reaches upstream of it, and, if strahler, the Strahler orders.
+        """
+        totals = [np.array(v, dtype='d') for v in values]
+        order = np.ones((len(self),), dtype=np.int64)
+        if strahler:
+            max_child = np.zeros((len(self),), dtype=np.int64)
+            n_max = np.zeros((len(self),), dtype=np.int64)
+        for level in reversed(self.levels()):
+            if strahler:
+                order[level] = np.where(n_max[level] >= 2, max_child[level] + 1, np.maximum(max_child[level], 1))
+            inner = level[self.parent[level] >= 0]
+            parents = self.parent[inner]
+            for total in totals:
+                np.add.at(total, parents, total[inner])
+            if strahler:
+                # all children of a reach are in the same level
+                np.maximum.at(max_child, parents, order[inner])
+                np.add.at(n_max, parents, order[inner] == max_child[parents])
+        return totals, order
+
+    def accumulate(self, values):
+        """Sums of values over each reach and all reaches upstream of it."""
+        return self._sweep_upstream([values,])[0][0]
+
+    def upstream_length(self):
+        """Length of each reach plus that of all reaches upstream of it."""
+        return self.accumulate(self.lengths())
+
+    def strahler_order(self):
+        """Strahler stream order of each reach.
+
+        Leaves are order 1; a reach whose upstream reaches have maximum
+        order m is order m+1 if two or more of them have order m, and
+        m otherwise.
+        """
+        return self._sweep_upstream(strahler=True)[1]
+
+    def shreve_magnitude(self):
+        """Shreve magnitude, the number of leaves upstream, of each reach."""
+        return self.accumulate(self.is_leaf()).astype(np.int64)
+
+    def distance_to_outlet(self, lengths=None):
+        """Distance along the network from the end of each reach to its outlet."""
+        if lengths is None:
+            lengths = self.lengths()
+        distance = np.zeros((len(self),), 'd')
+        for level in self.levels()[1:]:
+            parents = self.parent[level]
+            distance[level] = distance[parents] + lengths[parents]
+        return distance
+
+    def hydrologic_attributes(self, area=None):
+        """Strahler order, Shreve magnitude, lengths and distances of all reaches.
+
+        Parameters
+        ----------
+        area : str or np.array((n_reaches,)), optional
+            Area draining directly to each reach, or the property
+            holding it.  If given, drainage areas are accumulated too.
+
+        Returns a dict of arrays, one value per reach:
+
+          strahler_order     | Strahler stream order
+          shreve_magnitude   | number of leaves upstream
+          length             | length of the reach
+          upstream_length    | length of the reach and all upstream of it,
+                             | a proxy for drainage area
+          distance_to_outlet | distance from the end of the reach to its outlet
+          drainage_area      | area draining to the reach and all upstream
+                             | of it, only if area is given
+
+        Sums and orders are computed in one pass from the leaves to the
+        outlets, distances in one pass back up.
+        """
+        lengths = self.lengths()
+        values = [self.is_leaf(), lengths]
+        if area is not None:
+            if isinstance(area, str):
+                area = [p[area] for p in self.properties]
+            values.append(area)
+        totals, order = self._sweep_upstream(values, strahler=True)
+
+        attributes = dict(strahler_order=order,
+                          shreve_magnitude=totals[0].astype(np.int64),
+                          length=lengths,
+                          upstream_length=totals[1],
+                          distance_to_outlet=self.distance_to_outlet(lengths))
+        if area is not None:
+            attributes['drainage_area'] = totals[2]
+        return attributes
+
+    def subset(self, keep):
+        """A new network of the reaches in the mask keep.
+
+        Reaches whose parent is not kept become outlets.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        new_index = np.cumsum(keep) - 1
+        parent = self.parent[keep]
+        has_parent = parent >= 0
+        parent[has_parent] = np.where(keep[parent[has_parent]], new_index[parent[has_parent]], -1)
+
+        kept = np.flatnonzero(keep)
+        starts = self.coord_offsets[kept]
+        counts = self.coord_offsets[kept+1] - starts
+        coord_offsets = np.zeros((len(kept)+1,), dtype=np.int64)
+        np.cumsum(counts, out=coord_offsets[1:])
+        coords = self.coords[np.repeat(starts - coord_offsets[:-1], counts) + np.arange(coord_offsets[-1])]
+        return type(self)(parent, coords, coord_offsets, [self.properties[i] for i in kept])
+
+    def prune(self, prune_tol=10):
+        """A new network without the leaf reaches shorter than prune_tol.
+
+        As with workflow.hydrography.prune(), this is a single pass:
+        reaches that become leaves are not pruned.  Outlets are kept.
+        """
+        remove = self.is_leaf() & (self.lengths() < prune_tol) & (self.parent >= 0)
+        return self.subset(~remove)
+
+
+def hydrologic_attributes(forest, area=None):
+    """Computes hydrologic attributes of every reach of a forest of Trees.
+
+    See RiverNetwork.hydrologic_attributes().  Attributes are stored in
+    the properties of each node with a segment, and returned as a dict
+    of arrays in the order of workflow.tree.forest_to_list(forest).
+    """
+    network = RiverNetwork.from_trees(forest)
+    attributes = network.hydrologic_attributes(area)
+    # from_trees() keeps the properties dicts of the nodes
+    columns = [(k, v.tolist()) for (k, v) in attributes.items()]
+    for i, properties in enumerate(network.properties):
+        for k, v in columns:
+            properties[k] = v[i]
+    return attributes
@@ -0,0 +1,141 @@
+"""An on-disk cache of product catalog queries.
+
+Source managers find download URLs by querying The National Map's REST
+API, and some of those queries -- all products of a dataset, filtered
+locally -- are large.  Catalog keeps responses, and the HUC to URL and
+tile to URL mappings resolved from them, in a SQLite database in the
+data directory, so that repeated runs, and batch jobs over many HUCs,
+make no redundant queries, and runs without a connection still work
+for products already seen.
+
+Entries expire after a time to live, default_ttl.  Expired entries are
+not used unless a fresh query fails to connect, in which case they are
+used with a warning rather than failing.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import contextlib
+import requests.exceptions
+
+import workflow.conf
+import workflow.sources.download
+
+# seconds before an entry is queried again
+default_ttl = 30 * 24 * 3600
+
+# name of the database, in the data dir
+filename = 'catalog.sqlite'
+
+
+class Catalog:
+    """A key-value store of JSON-able values with timestamps.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite database.  Defaults to `filename` in
+        workflow.conf.rcParams['data dir'].
+    ttl : float, optional
+        Time to live of entries, in seconds; defaults to default_ttl.
+
+    Keys are tuples of strings and numbers, or strings.  Connections
+    are opened per operation, so a Catalog may be shared by threads and
+    the database by processes.
+    """
+    def __init__(self, path=None, ttl=None):
+        if path is None:
+            path = os.path.join(workflow.conf.rcParams['data dir'], filename)
+        self.path = path
+        self.ttl = default_ttl if ttl is None else ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, time REAL)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        with contextlib.closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            with conn:
+                yield conn
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    def get(self, key, ttl=None, expired=False):
+        """Value of key, or None if missing or older than ttl.
+
+        If expired, entries older than ttl are returned too.
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, time FROM entries WHERE key = ?', (self._key(key),)).fetchone()
+        if row is None:
+            return None
+        ttl = self.ttl if ttl is None else ttl
+        if not expired and time.time() - row[1] > ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Stores value, which must be JSON-able, under key."""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO entries (key, value, time) VALUES (?, ?, ?)',
+                         (self._key(key), json.dumps(value), time.time()))
+
+    def remove(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries WHERE key = ?', (self._key(key),))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries')
+
+    def cached(self, key, fetch, ttl=None):
+        """Value of key, calling fetch() to get and store it if needed.
+
+        If fetch() fails to connect, an expired value is used, if any.
+        fetch() returning None stores nothing.
+        """
+        value = self.get(key, ttl)
+        if value is not None:
+            return value
+        try:
+            value = fetch()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+            value = self.get(key, expired=True)
+            if value is None:
+                raise err
+            logging.warning('Catalog query failed, using an expired entry for {}: {}'.format(key, err))
+            return value
+        if value is not None:
+            self.put(key, value)
+        return value
+
+
+def catalog():
+    """The Catalog of the current data dir."""
+    return Catalog()
+
+
+def rest_get(url, params, validate=None, ttl=None):
+    """JSON response of a GET on a REST API, cached in the catalog.
+
+    Responses for which validate(response) is False are returned but
+    not stored.
+    """
+    invalid = []
+    def fetch():
+        r = workflow.sources.download.session().get(url, params=params, timeout=workflow.sources.download.timeout)
+        r.raise_for_status()
+        response = r.json()
+        if validate is not None and not validate(response):
+            invalid.append(response)
+            return None
+        return response
+
+    key = ('rest', url, sorted((k, str(v)) for (k, v) in params.items()))
+    response = catalog().cached(key, fetch, ttl)
+    return invalid[0] if response is None else response
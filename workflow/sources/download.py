@@ -0,0 +1,277 @@
+"""Robust, concurrent downloads of source data files.
+
+Source files are large -- NED tiles, NHD geodatabases, NLCD rasters --
+and come from servers that drop connections.  Files are streamed to a
+`.part` file next to their destination and renamed into place only
+once complete and validated, so an interrupted download never leaves
+something that looks like a finished file.  A later attempt resumes a
+`.part` file with an HTTP range request, rather than starting over.
+Sizes, from the server or from the caller, and checksums, from the
+caller, are checked before the rename.
+
+download_all() fetches many files at once on a bounded pool of threads,
+each with its own pooled requests.Session.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+import requests
+import requests.adapters
+import requests.exceptions
+
+# number of files downloaded at once by download_all()
+max_workers = 4
+
+# attempts per file, and the base of the exponential backoff between them, in seconds
+retries = 3
+backoff = 1.
+
+# bytes per read, and seconds to wait for the server
+chunk_size = 2**20
+timeout = 60
+
+
+class DownloadError(RuntimeError):
+    """A file could not be downloaded, or failed validation."""
+    pass
+
+
+_sessions = threading.local()
+
+def session():
+    """A requests.Session for the current thread, reusing its connections."""
+    try:
+        return _sessions.session
+    except AttributeError:
+        s = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        s.mount('http://', adapter)
+        s.mount('https://', adapter)
+        _sessions.session = s
+        return s
+
+
+class LogProgress:
+    """Logs the progress of each file every `step` fraction of its size."""
+    def __init__(self, step=0.1):
+        self.step = step
+        self._reported = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, url, nbytes, total):
+        with self._lock:
+            if total is None or total == 0:
+                if nbytes == 0:
+                    logging.info('  {}: started'.format(url))
+                return
+            done = int((nbytes / total) / self.step)
+            if done != self._reported.get(url, -1):
+                self._reported[url] = done
+                logging.info('  {}: {:3d}% of {:.1f} MB'.format(url, min(100, int(100*nbytes/total)), total/2**20))
+
+
+def file_checksum(filename, algorithm='md5'):
+    """Hex digest of a file."""
+    h = hashlib.new(algorithm)
+    with open(filename, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _parse_checksum(checksum):
+    """'algorithm:hexdigest', or a bare md5 hexdigest."""
+    if ':' in checksum:
+        algorithm, digest = checksum.split(':', 1)
+    else:
+        algorithm, digest = 'md5', checksum
+    return algorithm.lower(), digest.lower()
+
+
+def validate(filename, size=None, checksum=None):
+    """Raises DownloadError unless filename has this size and checksum."""
+    if size is not None and os.path.getsize(filename) != size:
+        raise DownloadError('{}: expected {} bytes, found {}'.format(filename, size, os.path.getsize(filename)))
+    if checksum is not None:
+        algorithm, digest = _parse_checksum(checksum)
+        found = file_checksum(filename, algorithm)
+        if found != digest:
+            raise DownloadError('{}: {} checksum {} does not match expected {}'.format(filename, algorithm, found, digest))
+
+
+def _total_size(response):
+    """Full size of the file, from the response's headers, or None."""
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # lengths are of the encoded stream, not of the file
+        return None
+    if response.status_code == 206:
+        content_range = response.headers.get('Content-Range', '')
+        if '/' in content_range and not content_range.endswith('*'):
+            return int(content_range.split('/')[-1])
+        return None
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None else None
+
+
+def _fetch(url, part, size, params, progress):
+    """One attempt at streaming url into part, resuming what is there.
+
+    Returns the total size, if known.
+    """
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    if size is not None and offset > size:
+        os.remove(part)
+        offset = 0
+    headers = {'Range': 'bytes={}-'.format(offset)} if offset > 0 else {}
+
+    with session().get(url, params=params, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 416:
+            # nothing left to fetch, or a stale part; the size check decides
+            return size if size is not None else offset
+        r.raise_for_status()
+        if r.status_code != 206:
+            # the server ignored the range, start over
+            offset = 0
+        total = _total_size(r)
+        if total is None:
+            total = size
+
+        nbytes = offset
+        progress(url, nbytes, total)
+        with open(part, 'ab' if offset > 0 else 'wb') as fid:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                fid.write(chunk)
+                nbytes += len(chunk)
+                progress(url, nbytes, total)
+    return total
+
+
+def download(url, location, force=False, size=None, checksum=None, params=None, progress=None):
+    """Download a file from a URL to a location, atomically.
+
+    Parameters
+    ----------
+    url : str
+        File to download.
+    location : str
+        Destination filename.  The file is written to location + '.part'
+        and renamed only once complete and valid.
+    force : bool, optional
+        If True, download even if location, or a partial download of
+        it, exists.
+    size : int, optional
+        Expected size, in bytes.  Otherwise the size given by the server,
+        if any, is checked.
+    checksum : str, optional
+        Expected checksum, as 'algorithm:hexdigest' for any algorithm of
+        hashlib, or an md5 hexdigest.
+    params : dict, optional
+        Query parameters of the request.
+    progress : function, optional
+        Called as progress(url, bytes_so_far, total_bytes_or_None).
+        Defaults to logging every 10%.
+
+    Returns
+    -------
+    str
+        location
+
+    An existing location that fails validation is downloaded again.
+    Failed attempts are retried `retries` times, resuming from what was
+    received; a file that is complete but invalid is discarded before
+    the next attempt.
+    """
+    if progress is None:
+        progress = LogProgress()
+    part = location + '.part'
+    if force:
+        for f in [location, part]:
+            if os.path.isfile(f):
+                os.remove(f)
+
+    if os.path.isfile(location):
+        try:
+            validate(location, size, checksum)
+            return location
+        except DownloadError as err:
+            logging.warning('{}; downloading again'.format(err))
+            os.remove(location)
+
+    logging.info('Downloading: "%s"'%url)
+    logging.info('         to: "%s"'%location)
+    for attempt in range(retries):
+        try:
+            total = _fetch(url, part, size, params, progress)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as err:
+            # transient; keep the part to resume from
+            error = err
+        except requests.exceptions.HTTPError as err:
+            if err.response is not None and err.response.status_code < 500:
+                raise DownloadError('{}: {}'.format(url, err)) from err
+            error = err
+        else:
+            received = os.path.getsize(part) if os.path.isfile(part) else 0
+            if total is not None and received < total:
+                error = DownloadError('{}: received {} of {} bytes'.format(url, received, total))
+            else:
+                try:
+                    validate(part, total, checksum)
+                except DownloadError as err:
+                    # complete but wrong, not worth resuming
+                    os.remove(part)
+                    error = err
+                else:
+                    os.replace(part, location)
+                    return location
+
+        logging.warning('  attempt {} of {} failed: {}'.format(attempt+1, retries, error))
+        if attempt + 1 < retries:
+            time.sleep(backoff * 2**attempt)
+    raise DownloadError('{}: failed to download after {} attempts'.format(url, retries)) from error
+
+
+def download_all(downloads, force=False, progress=None, nthreads=None):
+    """Download many files concurrently.
+
+    Parameters
+    ----------
+    downloads : list
+        Each entry is (url, location) or a dict of arguments to
+        download(), including url and location.
+    force, progress : optional
+        See download().
+    nthreads : int, optional
+        Number of files downloaded at once, defaults to max_workers.
+
+    Returns
+    -------
+    list(str)
+        The locations, in the order given.  If any download fails, the
+        others are finished first and then the first error is raised.
+    """
+    if progress is None:
+        progress = LogProgress()
+    if nthreads is None:
+        nthreads = max_workers
+    kwargs = [dict(d) if isinstance(d, dict) else dict(url=d[0], location=d[1]) for d in downloads]
+    for k in kwargs:
+        k.setdefault('force', force)
+        k.setdefault('progress', progress)
+    if len(kwargs) == 0:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(nthreads, len(kwargs))) as executor:
+        futures = [executor.submit(download, **k) for k in kwargs]
+        concurrent.futures.wait(futures)
+
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    for err in errors:
+        logging.error(str(err))
+    if len(errors) > 0:
+        raise errors[0]
+    return [f.result() for f in futures]
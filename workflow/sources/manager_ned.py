@@ -14,6 +14,9 @@ import workflow.sources.utils as source_utils
 import workflow.conf
 import workflow.warp
 import workflow.sources.names
+import workflow.sources.raster_mosaic
+import workflow.sources.download
+import workflow.sources.catalog
 
 
 
@@ -35,8 +38,14 @@ class FileManagerNED:
                                                   self.short_res+"_raw")
 
 
-    def get_raster(self, shape, crs):
-        """Download and read a DEM for this shape, clipping to the shape."""
+    def get_raster(self, shape, crs, lazy=False):
+        """Download and read a DEM for this shape, clipping to the shape.
+
+        If lazy, the DEM is returned as a
+        workflow.sources.raster_mosaic.RasterMosaic over the tiles,
+        which reads only the windows asked of it, rather than merged
+        into one array.
+        """
         if type(shape) is dict:
             shape = workflow.utils.shply(shape)
         
@@ -52,6 +61,11 @@ class FileManagerNED:
         feather_bounds[3] = feather_bounds[3] + .01
         files = self.download(feather_bounds)
 
+        if lazy:
+            mosaic = workflow.sources.raster_mosaic.RasterMosaic(files, feather_bounds, nodata=np.nan,
+                                                                 min_valid=-1.e-10)
+            return mosaic.profile, mosaic
+
         # merge into a single raster
         datasets = [rasterio.open(f) for f in files]
         profile = datasets[0].profile
@@ -67,6 +81,59 @@ class FileManagerNED:
         profile['nodata'] = np.nan
         return profile, dest[0]
 
+    def get_raster_on_points(self, points, crs, block_size=512, cache_size=64):
+        """Lazily read DEM covering points, from only the tiles they are in.
+
+        Unlike get_raster(), which covers the bounding box of a shape,
+        only tiles within the feather distance of a point are
+        downloaded and opened, and the returned
+        workflow.sources.raster_mosaic.RasterMosaic reads only the
+        blocks asked of it, so memory scales with the number of points
+        and the block cache rather than with the area they span.
+
+        Parameters
+        ----------
+        points : np.array((n_points, 2), 'd')
+            Points to be covered.
+        crs : :obj:`crs`
+            Coordinate system of the points.
+        block_size, cache_size : int, optional
+            See RasterMosaic.
+
+        Returns
+        -------
+        profile : dict
+            Rasterio profile of the mosaic.
+        mosaic : :obj:`RasterMosaic`
+            The DEM.  Close it when done.
+        """
+        points = np.asarray(points, dtype='d')
+        if len(points) == 0:
+            raise ValueError("{}: no points to get a DEM on".format(self.name))
+        points = workflow.warp.warp_coords(points[:,0:2], crs, workflow.conf.latlon_crs())
+
+        feather = .01
+        bounds = list(points.min(axis=0) - feather) + list(points.max(axis=0) + feather)
+        files = self.download(bounds, tiles=self.tile_indices(points, feather))
+        mosaic = workflow.sources.raster_mosaic.RasterMosaic(files, bounds, nodata=np.nan, min_valid=-1.e-10,
+                                                             block_size=block_size, cache_size=cache_size)
+        return mosaic.profile, mosaic
+
+    @staticmethod
+    def tile_indices(points, feather=0.):
+        """The 1-degree tiles containing lat-lon points, or within feather of them.
+
+        Returns a sorted list of (south, west) integer corners.
+        """
+        points = np.asarray(points, dtype='d')
+        offsets = np.array([(dx, dy) for dx in (-feather, feather) for dy in (-feather, feather)])
+        corners = np.floor(points[None,:,0:2] + offsets[:,None,:]).astype(np.int64).reshape(-1, 2)
+
+        # one integer per tile, ordered south then west, is much faster
+        # to make unique than rows
+        keys = np.unique((corners[:,1] + 90) * 360 + (corners[:,0] + 180))
+        return [(int(k // 360 - 90), int(k % 360 - 180)) for k in keys]
+
     def request(self, bounds):
         """Forms the REST API get to find URLs."""
         rest_url = 'https://viewer.nationalmap.gov/tnmaccess/api/products'
@@ -74,18 +141,52 @@ class FileManagerNED:
 
         rest_bounds = ','.join(str(b) for b in bounds)
         try:
-            r = requests.get(rest_url, params={'datasets':rest_dataset,
-                                               'bbox':rest_bounds,
-                                               'prodFormats':self.file_format})
+            response = workflow.sources.catalog.rest_get(rest_url, {'datasets':rest_dataset,
+                                                                    'bbox':rest_bounds,
+                                                                    'prodFormats':self.file_format},
+                                                         validate=lambda r: r['total'] > 0)
         except requests.exceptions.ConnectionError as err:
             logging.error('{}: Failed to access REST API for NED DEM products.'.format(self.name))
             raise err
 
-        assert(r.json()['total'] > 0)
-        return r.json()
-
-    def download(self, bounds, force=False):
-        """Download the files, returning list of filenames."""
+        assert(response['total'] > 0)
+        return response
+
+    def _tile_key(self, north, west):
+        return ('NED tile', self.name, self.resolution, self.file_format, north, west)
+
+    def _tile_items(self, bounds, tiles):
+        """Catalog items of the tiles, from the catalog if all of them
+        have been seen, otherwise from a request, which is then stored.
+
+        Tiles the catalog has no products for are omitted.
+        """
+        catalog = workflow.sources.catalog.catalog()
+        keys = [self._tile_key(j+1, i) for (j, i) in tiles]
+        items = [catalog.get(k) for k in keys]
+        if all(item is not None for item in items):
+            logging.info('  Using cached catalog entries for {} tiles'.format(len(items)))
+            return [item for item in items if item['downloadURL'] is not None]
+
+        items = self.request(bounds)['items']
+        found = dict()
+        for r in items:
+            key = self._tile_key(int(np.round(r['boundingBox']['maxY'])), int(np.round(r['boundingBox']['minX'])))
+            found[key] = dict(downloadURL=r['downloadURL'],
+                              boundingBox=dict(maxY=r['boundingBox']['maxY'], minX=r['boundingBox']['minX']))
+        for key in keys:
+            found.setdefault(key, dict(downloadURL=None))
+        for key, item in found.items():
+            catalog.put(key, item)
+        return items
+
+    def download(self, bounds, force=False, tiles=None):
+        """Download the files, returning list of filenames.
+
+        By default all tiles covering bounds are needed; tiles, a list
+        of (south, west) corners from tile_indices(), restricts this
+        to those tiles.
+        """
         logging.info("Collecting DEMs to tile bounds: {}".format(bounds))
         
         # check directory structure
@@ -97,13 +198,15 @@ class FileManagerNED:
         # already exists.
 
         # tile the bounds in lat/long 1-degree increments
-        west = int(np.floor(bounds[0]))
-        south = int(np.floor(bounds[1]))
-        east = int(np.ceil(bounds[2]))
-        north = int(np.ceil(bounds[3]))
+        if tiles is None:
+            west = int(np.floor(bounds[0]))
+            south = int(np.floor(bounds[1]))
+            east = int(np.ceil(bounds[2]))
+            north = int(np.ceil(bounds[3]))
+            tiles = [(j, i) for j in range(south, north) for i in range(west, east)]
 
         # generate the list of files needed
-        filenames = [self.names.file_name(j+1, -i) for j in range(south, north) for i in range(west, east)]
+        filenames = [self.names.file_name(j+1, -i) for (j, i) in tiles]
         logging.info('  Need:')
         for fname in filenames:
             logging.info('    {}'.format(fname))
@@ -111,8 +214,9 @@ class FileManagerNED:
         filenames_success = []
         if (any(not os.path.exists(f) for f in filenames) or force):
 
-            request = self.request(bounds)
-            for r in request['items']:
+            items = self._tile_items(bounds, tiles)
+            tiles = []
+            for r in items:
                 url = r['downloadURL']
                 north = int(np.round(r['boundingBox']['maxY']))
                 west = int(np.round(r['boundingBox']['minX']))
@@ -123,17 +227,24 @@ class FileManagerNED:
                     continue
                 
                 filenames.remove(filename)
+                tiles.append((url, north, west, filename))
 
+            # fetch all missing tiles at once
+            downloads = []
+            for url, north, west, filename in tiles:
                 if not os.path.exists(filename) or force:
                     downloadfilename = url.split("/")[-1]
                     downloadfile = os.path.join(self.names.raw_folder_name(north,west), downloadfilename)
                     assert(downloadfile.endswith('.ZIP') or downloadfile.endswith('.zip'))
+                    downloads.append((url, downloadfile))
+            logging.info("Attempting to download sources for {} tiles".format(len(downloads)))
+            workflow.sources.download.download_all(downloads, force)
 
-                    logging.info("Attempting to download source for target '%s'"%filename)
+            for url, north, west, filename in tiles:
+                if not os.path.exists(filename) or force:
+                    downloadfilename = url.split("/")[-1]
+                    downloadfile = os.path.join(self.names.raw_folder_name(north,west), downloadfilename)
                     work_dir = self.names.raw_folder_name(north, west)
-
-                    if not os.path.exists(downloadfile) or force:
-                        source_utils.download(url, downloadfile, force)
                     source_utils.unzip(downloadfile, work_dir)
                     unzip_filename = downloadfilename[0:-4]
 
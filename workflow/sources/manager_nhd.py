@@ -11,6 +11,7 @@ import workflow.conf
 import workflow.sources.names
 import workflow.utils
 import workflow.warp
+import workflow.sources.catalog
 
 
 @attr.s
@@ -91,18 +92,16 @@ class _FileManagerNHD:
     def _url(self, hucstr):
         """Use the REST API to find the URL."""
         import requests
+        import requests.exceptions
         rest_url = 'https://viewer.nationalmap.gov/tnmaccess/api/products'
         hucstr = hucstr[0:self.file_level]
 
         def attempt(params):        
-            r = requests.get(rest_url, params=params)
             try:
-                r.raise_for_status()
-            except Exception as e:
+                json = workflow.sources.catalog.rest_get(rest_url, params)
+            except requests.exceptions.HTTPError as e:
                 logging.error(e)
                 return 1,e
-                
-            json = r.json()
 
             # this feels hacky, but it does not appear that USGS has their
             # 'prodFormat' get option or 'format' return json value
@@ -126,19 +125,23 @@ class _FileManagerNHD:
                 return 1, '{}: too many matches for HUC {}'.format(self.name, hucstr)
             return 0, matches[0]['downloadURL']
 
-        # cheaper if it works, may not work in alaska?
-        a1 = attempt({'datasets':self.name,
-                      'polyType':'huc{}'.format(self.file_level),
-                      'polyCode':hucstr})
-        if not a1[0]:
-            return a1[1]
+        def resolve():
+            # cheaper if it works, may not work in alaska?
+            a1 = attempt({'datasets':self.name,
+                          'polyType':'huc{}'.format(self.file_level),
+                          'polyCode':hucstr})
+            if not a1[0]:
+                return a1[1]
+
+            # works more univerasally but is a BIG lookup, then filter
+            # locally -- the catalog keeps the response for other HUCs
+            a2 = attempt({'datasets':self.name})
+            if not a2[0]:
+                return a2[1]
 
-        # works more univerasally but is a BIG lookup, then filter locally
-        a2 = attempt({'datasets':self.name})
-        if not a2[0]:
-            return a2[1]
+            raise ValueError('{}: cannot find HUC {}'.format(self.name, hucstr))
 
-        raise ValueError('{}: cannot find HUC {}'.format(self.name, hucstr))
+        return workflow.sources.catalog.catalog().cached(('NHD url', self.name, hucstr), resolve)
         
 
     def _download(self, hucstr, force=False):
@@ -4,7 +4,6 @@ import os, sys
 import logging
 import fiona
 import shapely
-import requests
 import numpy as np
 
 import workflow.sources.utils as source_utils
@@ -89,11 +88,7 @@ class FileManagerNRCS:
             params = {'REQUEST':'GetFeature',
                       'TYPENAME':'MapunitPoly',
                       'BBOX':self.qstring.format(*bounds)}
-            r = requests.get(self.url, params=params)
-            r.raise_for_status()
-
-            with open(filename, 'w') as fid:
-                fid.write(r.text)
+            source_utils.download(self.url, filename, force, params=params)
 
         return filename
 
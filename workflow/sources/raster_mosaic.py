@@ -0,0 +1,169 @@
+"""A lazy, windowed mosaic of raster tiles.
+
+Merging every tile that covers a large domain into one in-memory array
+needs memory proportional to the area of the domain, and consumers such
+as workflow.hilev.elevate() only ever look at the pixels near mesh
+nodes.  RasterMosaic behaves like a virtual raster (a VRT) over the
+tiles: it describes the merged raster's grid, but only reads pixels
+when asked for a window, merging just the tiles that window touches.
+Windows are assembled from fixed-size blocks, which are kept in a small
+LRU cache, so that nearby requests share reads.
+"""
+
+import math
+import functools
+import numpy as np
+import rasterio
+import rasterio.merge
+import rasterio.transform
+
+import workflow.spatial_index
+
+
+class RasterMosaic:
+    """A mosaic of raster tiles, read lazily a window at a time.
+
+    Parameters
+    ----------
+    filenames : list(str)
+        Raster files, on a common grid.  Where tiles overlap, the first
+        one with data wins, as in rasterio.merge.merge().
+    bounds : [xmin, ymin, xmax, ymax], optional
+        Extent of the mosaic, expanded outward to the pixel grid of the
+        first tile.  Defaults to the union of the tiles.
+    nodata : float, optional
+        Value of pixels not covered by any tile.  Defaults to NaN.
+    min_valid : float, optional
+        Pixels smaller than this are replaced by nodata.
+    block_size : int, optional
+        Reads are made in square blocks of this many pixels.
+    cache_size : int, optional
+        Number of blocks to keep.
+
+    The mosaic's `profile` is that of the first tile, with the grid of
+    the mosaic; `shape` is (height, width).
+    """
+    def __init__(self, filenames, bounds=None, nodata=np.nan, min_valid=None,
+                 block_size=512, cache_size=64):
+        self.filenames = list(filenames)
+        if len(self.filenames) == 0:
+            raise ValueError("RasterMosaic requires at least one file")
+        self.datasets = [rasterio.open(f) for f in self.filenames]
+        self.nodata = nodata
+        self.min_valid = min_valid
+        self.block_size = block_size
+
+        first = self.datasets[0]
+        self.res = first.res
+        if bounds is None:
+            all_bounds = np.array([d.bounds for d in self.datasets])
+            bounds = (all_bounds[:,0].min(), all_bounds[:,1].min(),
+                      all_bounds[:,2].max(), all_bounds[:,3].max())
+
+        # expand to the first tile's pixel grid, so that every window
+        # is read as whole pixels of the tiles
+        left, bottom, right, top = first.bounds
+        dx, dy = self.res
+        eps = 1.e-6
+        west = left + math.floor((bounds[0] - left) / dx + eps) * dx
+        east = left + math.ceil((bounds[2] - left) / dx - eps) * dx
+        north = top - math.floor((top - bounds[3]) / dy + eps) * dy
+        south = top - math.ceil((top - bounds[1]) / dy - eps) * dy
+        self.bounds = (west, south, east, north)
+
+        width = int(round((east - west) / dx))
+        height = int(round((north - south) / dy))
+        self.shape = (height, width)
+        self.transform = rasterio.transform.Affine.translation(west, north) * rasterio.transform.Affine.scale(dx, -dy)
+        self.dtype = np.result_type(first.dtypes[0], np.min_scalar_type(nodata))
+
+        self.profile = first.profile.copy()
+        self.profile.update(transform=self.transform, height=height, width=width,
+                            count=1, dtype=self.dtype, nodata=nodata)
+
+        self._index = workflow.spatial_index.BoundsIndex([d.bounds for d in self.datasets])
+        self._block = functools.lru_cache(maxsize=cache_size)(self._block)
+
+    def close(self):
+        for d in self.datasets:
+            d.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_window(self, row_off, col_off, height, width):
+        """Reads a window of the mosaic, uncached.
+
+        The window is clipped to the mosaic.  Returns a new
+        np.array((height, width)).
+        """
+        row0, col0 = max(0, row_off), max(0, col_off)
+        row1 = min(self.shape[0], row_off + height)
+        col1 = min(self.shape[1], col_off + width)
+        if row1 <= row0 or col1 <= col0:
+            return np.zeros((max(0, row1-row0), max(0, col1-col0)), self.dtype)
+
+        dx, dy = self.res
+        west, north = self.transform * (col0, row0)
+        east, south = self.transform * (col1, row1)
+        bounds = (west, south, east, north)
+
+        # only tiles overlapping the interior of the window
+        tiles = [self.datasets[i] for i in self._index.query(bounds)]
+        tiles = [d for d in tiles if min(d.bounds.right, east) - max(d.bounds.left, west) > 0.5*dx and
+                 min(d.bounds.top, north) - max(d.bounds.bottom, south) > 0.5*dy]
+        if len(tiles) == 0:
+            return np.full((row1-row0, col1-col0), self.nodata, self.dtype)
+
+        dest, _ = rasterio.merge.merge(tiles, bounds=bounds, res=self.res, nodata=self.nodata,
+                                       dtype=self.dtype, indexes=[1,])
+        dest = dest[0, 0:row1-row0, 0:col1-col0]
+        if self.min_valid is not None:
+            dest[dest < self.min_valid] = self.nodata
+        return dest
+
+    def read(self):
+        """Reads the whole mosaic."""
+        return self.read_window(0, 0, self.shape[0], self.shape[1])
+
+    def _block(self, bi, bj):
+        block = self.read_window(bi*self.block_size, bj*self.block_size,
+                                 self.block_size, self.block_size)
+        block.flags.writeable = False
+        return block
+
+    def window(self, row0, row1, col0, col1):
+        """Pixels [row0, row1) x [col0, col1), clipped to the mosaic, from cached blocks."""
+        row0, col0 = max(0, row0), max(0, col0)
+        row1, col1 = min(self.shape[0], row1), min(self.shape[1], col1)
+        bs = self.block_size
+        out = np.empty((max(0, row1-row0), max(0, col1-col0)), self.dtype)
+        for bi in range(row0 // bs, (row1 - 1) // bs + 1):
+            for bj in range(col0 // bs, (col1 - 1) // bs + 1):
+                block = self._block(bi, bj)
+                r0, r1 = max(row0, bi*bs), min(row1, (bi+1)*bs)
+                c0, c1 = max(col0, bj*bs), min(col1, (bj+1)*bs)
+                out[r0-row0:r1-row0, c0-col0:c1-col0] = block[r0-bi*bs:r1-bi*bs, c0-bj*bs:c1-bj*bs]
+        return out
+
+    def sample(self, rows, cols):
+        """Values of the pixels at integer rows and cols, reading only their blocks."""
+        rows = np.asarray(rows, dtype=np.intp)
+        cols = np.asarray(cols, dtype=np.intp)
+        if np.any((rows < 0) | (rows >= self.shape[0]) | (cols < 0) | (cols >= self.shape[1])):
+            raise IndexError("RasterMosaic.sample: pixel outside of the mosaic")
+
+        bs = self.block_size
+        values = np.empty(rows.shape, self.dtype)
+        block_ids = (rows // bs) * ((self.shape[1] - 1) // bs + 1) + (cols // bs)
+        order = np.argsort(block_ids, kind='stable')
+        starts = np.flatnonzero(np.concatenate([[True,], block_ids[order][1:] != block_ids[order][:-1]]))
+        for start, end in zip(starts, np.append(starts[1:], len(order))):
+            points = order[start:end]
+            bi, bj = rows[points[0]] // bs, cols[points[0]] // bs
+            block = self._block(bi, bj)
+            values[points] = block[rows[points] - bi*bs, cols[points] - bj*bs]
+        return values
@@ -0,0 +1,106 @@
+import pytest
+
+import json
+import threading
+import http.server
+import requests.exceptions
+
+import workflow.conf
+import workflow.sources.catalog
+import workflow.sources.manager_ned
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(workflow.conf.rcParams, 'data dir', str(tmp_path))
+    return tmp_path
+
+
+def test_catalog(data_dir, monkeypatch):
+    catalog = workflow.sources.catalog.catalog()
+    assert(catalog.path == str(data_dir / workflow.sources.catalog.filename))
+    assert(catalog.get(('a', 1)) is None)
+    catalog.put(('a', 1), {'url':'http://x'})
+    assert(workflow.sources.catalog.catalog().get(('a', 1)) == {'url':'http://x'})
+
+    calls = []
+    def fetch():
+        calls.append(1)
+        return [1,2]
+    assert(catalog.cached('b', fetch) == [1,2])
+    assert(catalog.cached('b', fetch) == [1,2])
+    assert(len(calls) == 1)
+
+    # expired entries are fetched again, or used if offline
+    assert(catalog.get('b', ttl=-1) is None)
+    assert(catalog.cached('b', fetch, ttl=-1) == [1,2])
+    assert(len(calls) == 2)
+    def offline():
+        raise requests.exceptions.ConnectionError('offline')
+    assert(catalog.cached('b', offline, ttl=-1) == [1,2])
+    with pytest.raises(requests.exceptions.ConnectionError):
+        catalog.cached('c', offline)
+
+    catalog.clear()
+    assert(catalog.get(('a', 1)) is None)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = json.dumps({'total':int('empty' not in self.path), 'path':self.path}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_rest_get(data_dir):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, kwargs=dict(poll_interval=0.05), daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{}/products'.format(httpd.server_address[1])
+    try:
+        r1 = workflow.sources.catalog.rest_get(url, {'datasets':'NED', 'bbox':'1,2,3,4'})
+        r2 = workflow.sources.catalog.rest_get(url, {'bbox':'1,2,3,4', 'datasets':'NED'})
+        assert(r1 == r2)
+        assert(len(httpd.requests) == 1)
+        workflow.sources.catalog.rest_get(url, {'datasets':'NED', 'bbox':'1,2,3,5'})
+        assert(len(httpd.requests) == 2)
+
+        # invalid responses are not kept
+        validate = lambda r: r['total'] > 0
+        assert(workflow.sources.catalog.rest_get(url, {'datasets':'empty'}, validate)['total'] == 0)
+        workflow.sources.catalog.rest_get(url, {'datasets':'empty'}, validate)
+        assert(len(httpd.requests) == 4)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_ned_tiles_cached(data_dir, monkeypatch):
+    ned = workflow.sources.manager_ned.FileManagerNED()
+    requests = []
+    def request(bounds):
+        requests.append(bounds)
+        return {'total':1, 'items':[{'downloadURL':'http://x/n36w084.zip',
+                                     'boundingBox':{'maxY':36., 'minX':-84.}}]}
+    monkeypatch.setattr(ned, 'request', request)
+
+    tiles = [(35, -84), (35, -85)]
+    items = ned._tile_items([-85, 35, -83, 36], tiles)
+    assert(len(items) == 1 and len(requests) == 1)
+
+    # both tiles are now known, including that one has no product
+    items = ned._tile_items([-84.5, 35.5, -83.5, 35.9], tiles)
+    assert(items == [{'downloadURL':'http://x/n36w084.zip', 'boundingBox':{'maxY':36., 'minX':-84.}}])
+    assert(len(requests) == 1)
+
+    # a new tile needs a request
+    ned._tile_items([-84, 36, -83, 37], [(36, -84)])
+    assert(len(requests) == 2)
@@ -0,0 +1,149 @@
+import pytest
+
+import os
+import hashlib
+import threading
+import http.server
+import numpy as np
+
+import workflow.sources.download
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves server.files, honoring Range requests.
+
+    Paths in server.flaky send only the first half of their first
+    response before dropping the connection.
+    """
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.server.requests.append((path, self.headers.get('Range')))
+        if path not in self.server.files:
+            self.send_error(404)
+            return
+        data = self.server.files[path]
+
+        start = 0
+        if self.headers.get('Range') is not None:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(data)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data)-1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+
+        if path in self.server.flaky:
+            self.server.flaky.remove(path)
+            self.wfile.write(data[start:start + (len(data)-start)//2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(workflow.sources.download, 'backoff', 0.)
+    monkeypatch.setattr(workflow.sources.download, 'chunk_size', 2**12)
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    np.random.seed(0)
+    httpd.files = dict(('/file{}.zip'.format(i), np.random.bytes(10**5 + i)) for i in range(5))
+    httpd.flaky = set()
+    httpd.requests = []
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever, kwargs=dict(poll_interval=0.05), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _read(filename):
+    with open(filename, 'rb') as fid:
+        return fid.read()
+
+
+def test_download(server, tmp_path):
+    location = str(tmp_path / 'file0.zip')
+    data = server.files['/file0.zip']
+    md5 = hashlib.md5(data).hexdigest()
+    assert(workflow.sources.download.download(server.url+'/file0.zip', location, checksum=md5) == location)
+    assert(_read(location) == data)
+    assert(not os.path.exists(location + '.part'))
+
+    # present and valid, not downloaded again
+    workflow.sources.download.download(server.url+'/file0.zip', location, checksum='md5:'+md5)
+    assert(len(server.requests) == 1)
+
+
+def test_download_resumes(server, tmp_path):
+    location = str(tmp_path / 'file1.zip')
+    data = server.files['/file1.zip']
+    server.flaky.add('/file1.zip')
+    workflow.sources.download.download(server.url+'/file1.zip', location)
+    assert(_read(location) == data)
+
+    # the second attempt asked only for the rest
+    assert(len(server.requests) == 2)
+    assert(server.requests[0][1] is None)
+    start = int(server.requests[1][1].split('=')[1].rstrip('-'))
+    assert(0 < start <= len(data)//2)
+
+
+def test_download_resumes_part(server, tmp_path):
+    location = str(tmp_path / 'file2.zip')
+    data = server.files['/file2.zip']
+    with open(location + '.part', 'wb') as fid:
+        fid.write(data[0:1000])
+    workflow.sources.download.download(server.url+'/file2.zip', location, size=len(data))
+    assert(_read(location) == data)
+    assert(server.requests == [('/file2.zip', 'bytes=1000-')])
+
+    # force starts over
+    workflow.sources.download.download(server.url+'/file2.zip', location, force=True)
+    assert(_read(location) == data)
+    assert(server.requests[-1] == ('/file2.zip', None))
+
+
+def test_download_invalid(server, tmp_path):
+    location = str(tmp_path / 'file3.zip')
+    with pytest.raises(workflow.sources.download.DownloadError):
+        workflow.sources.download.download(server.url+'/file3.zip', location, checksum='sha256:'+'0'*64)
+    assert(not os.path.exists(location))
+    assert(not os.path.exists(location + '.part'))
+    assert(len(server.requests) == workflow.sources.download.retries)
+
+    # missing files are not retried
+    with pytest.raises(workflow.sources.download.DownloadError):
+        workflow.sources.download.download(server.url+'/missing.zip', location)
+    assert(len(server.requests) == workflow.sources.download.retries + 1)
+
+
+def test_download_all(server, tmp_path):
+    paths = sorted(server.files.keys())
+    server.flaky.add(paths[2])
+    downloads = [(server.url+p, str(tmp_path / p[1:])) for p in paths]
+    downloads[0] = dict(url=downloads[0][0], location=downloads[0][1],
+                        checksum='sha1:'+hashlib.sha1(server.files[paths[0]]).hexdigest())
+
+    progress = []
+    def record(url, nbytes, total):
+        progress.append((url, nbytes, total))
+
+    locations = workflow.sources.download.download_all(downloads, progress=record, nthreads=3)
+    assert(locations == [str(tmp_path / p[1:]) for p in paths])
+    for p, location in zip(paths, locations):
+        assert(_read(location) == server.files[p])
+
+        # reported per file, up to its full size
+        reports = [r for r in progress if r[0] == server.url+p]
+        assert(reports[-1][1] == reports[-1][2] == len(server.files[p]))
@@ -52,3 +52,60 @@ def test_ned4():
     assert((3581, 3723) == dem.shape)
 
     
+
+
+@pytest.fixture
+def ned_tiles(tmp_path, monkeypatch):
+    """Coarse, NED-named tiles of a smooth surface in a temporary data dir.
+
+    Three of the 2x2 degrees around (-84, 35) have tiles, so that
+    anything asking for the fourth would try to download it.
+    """
+    import rasterio
+    import rasterio.transform
+    monkeypatch.setitem(workflow.conf.rcParams, 'data dir', str(tmp_path))
+    ned = workflow.sources.manager_ned.FileManagerNED()
+    n, overlap = 100, 6
+    dx = 1. / n
+    for south, west in [(35, -84), (35, -83), (36, -84)]:
+        filename = ned.names.file_name(south+1, -west)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        transform = rasterio.transform.from_origin(west - overlap*dx, south + 1 + overlap*dx, dx, dx)
+        x = west + dx*(np.arange(n+2*overlap) - overlap + 0.5)
+        y = south + 1 - dx*(np.arange(n+2*overlap) - overlap + 0.5)
+        data = (200 + 100*np.sin(3*x)[None,:] + 50*np.cos(2*y)[:,None]).astype('float32')
+        with rasterio.open(filename, 'w', driver='HFA', height=data.shape[0], width=data.shape[1],
+                           count=1, dtype='float32', crs=workflow.conf.latlon_crs(),
+                           transform=transform) as fid:
+            fid.write(data, 1)
+    return ned
+
+
+def test_tile_indices():
+    points = np.array([(-83.5, 35.5), (-83.995, 35.5), (-82.2, 36.999)])
+    assert(workflow.sources.manager_ned.FileManagerNED.tile_indices(points) == [(35, -84), (36, -83)])
+    assert(workflow.sources.manager_ned.FileManagerNED.tile_indices(points, 0.01) ==
+           [(35, -85), (35, -84), (36, -83), (37, -83)])
+
+
+def test_elevate_from_source(ned_tiles):
+    # an L of points, across both seams but not in the north-east tile
+    np.random.seed(0)
+    points = np.concatenate([np.random.random((300,2)) * [1.9, 0.9] + [-83.95, 35.05],
+                             np.random.random((300,2)) * [0.9, 0.9] + [-83.95, 36.05],
+                             [(-83.0, 35.5), (-83.5, 36.0), (-83.02, 35.98)]])
+    crs = workflow.conf.latlon_crs()
+    elev = workflow.elevate_from_source(points, crs, ned_tiles)
+    assert(elev.shape == (len(points), 3))
+    assert(not np.isnan(elev[:,2]).any())
+
+    # the same as a DEM merged from the tiles on the same grid
+    import rasterio
+    import rasterio.merge
+    profile, mosaic = ned_tiles.get_raster_on_points(points, crs)
+    mosaic.close()
+    assert(len(mosaic.filenames) == 3)
+    dem, transform = rasterio.merge.merge([rasterio.open(f) for f in mosaic.filenames],
+                                          bounds=mosaic.bounds, nodata=np.nan)
+    profile['transform'] = transform
+    assert(np.array_equal(elev, workflow.elevate(points, crs, dem[0], profile)))
@@ -0,0 +1,88 @@
+import pytest
+
+import numpy as np
+import rasterio
+import rasterio.merge
+import rasterio.transform
+
+import workflow
+import workflow.conf
+import workflow.interpolate
+import workflow.sources.raster_mosaic
+
+
+@pytest.fixture
+def tiles(tmp_path):
+    """A 2x2 grid of overlapping tiles of a smooth surface, with some negative, invalid pixels."""
+    np.random.seed(0)
+    n, overlap, dx = 50, 3, 0.01
+    filenames = []
+    for ti in range(2):
+        for tj in range(2):
+            west = tj*n*dx - overlap*dx
+            north = 1. - ti*n*dx + overlap*dx
+            transform = rasterio.transform.from_origin(west, north, dx, dx)
+            x = west + dx*(np.arange(n+2*overlap) + 0.5)
+            y = north - dx*(np.arange(n+2*overlap) + 0.5)
+            data = (np.sin(3*x)[None,:] + np.cos(2*y)[:,None]).astype('float32')
+            data[np.random.random(data.shape) < 0.01] = -9999.
+            filename = str(tmp_path / 'tile_{}_{}.tif'.format(ti, tj))
+            with rasterio.open(filename, 'w', driver='GTiff', height=data.shape[0], width=data.shape[1],
+                               count=1, dtype='float32', crs=workflow.conf.latlon_crs(),
+                               transform=transform) as fid:
+                fid.write(data, 1)
+            filenames.append(filename)
+    return filenames
+
+
+def test_mosaic_read(tiles):
+    bounds = (0.053, 0.052, 0.951, 0.947)
+    with workflow.sources.raster_mosaic.RasterMosaic(tiles, bounds, min_valid=-1.e-10, block_size=16) as mosaic:
+        # expanded to the tiles' grid
+        assert(np.allclose(mosaic.bounds, (0.05, 0.05, 0.96, 0.95)))
+        assert(mosaic.shape == (90, 91))
+
+        datasets = [rasterio.open(f) for f in tiles]
+        dest, transform = rasterio.merge.merge(datasets, bounds=mosaic.bounds, nodata=np.nan)
+        dest = np.where(dest < -1.e-10, np.nan, dest)[0]
+        assert(transform.almost_equals(mosaic.transform))
+
+        whole = mosaic.read()
+        assert(np.array_equal(whole, dest, equal_nan=True))
+        assert(np.isnan(whole).any())
+
+        # windows, from blocks
+        assert(np.array_equal(mosaic.window(10, 40, 20, 75), dest[10:40, 20:75], equal_nan=True))
+        assert(np.array_equal(mosaic.window(-5, 100, 80, 100), dest[:, 80:], equal_nan=True))
+
+        rows = np.array([0, 89, 45, 45, 3])
+        cols = np.array([0, 90, 44, 45, 3])
+        assert(np.array_equal(mosaic.sample(rows, cols), dest[rows, cols], equal_nan=True))
+        with pytest.raises(IndexError):
+            mosaic.sample([90,], [0,])
+
+
+def test_mosaic_values(tiles):
+    with workflow.sources.raster_mosaic.RasterMosaic(tiles, min_valid=-1.e-10, block_size=8) as mosaic:
+        dem = mosaic.read()
+        np.random.seed(1)
+        points = np.random.random((400, 2)) * 0.9 + 0.05
+        points[0] = mosaic.bounds[0:2]
+        points[1] = mosaic.bounds[2:4]
+
+        for algorithm in ['nearest', 'piecewise bilinear', 'piecewise bicubic']:
+            vals = workflow.values_from_raster(points[2:] if algorithm == 'nearest' else points,
+                                               mosaic.profile['crs'], dem, mosaic.profile, algorithm)
+            vals_lazy = workflow.values_from_raster(points[2:] if algorithm == 'nearest' else points,
+                                                    mosaic.profile['crs'], mosaic, mosaic.profile, algorithm)
+            assert(np.array_equal(vals, vals_lazy, equal_nan=True))
+
+
+def test_mosaic_reads_only_needed_blocks(tiles):
+    with workflow.sources.raster_mosaic.RasterMosaic(tiles, block_size=10) as mosaic:
+        points = np.array([(0.205, 0.805), (0.215, 0.795)])
+        vals = workflow.interpolate.interpolate_windows(points, mosaic.window, mosaic.shape, mosaic.transform,
+                                                        block_size=mosaic.block_size)
+        assert(not np.isnan(vals).any())
+        # only the block containing the points and their stencils
+        assert(mosaic._block.cache_info().currsize == 1)
@@ -2,7 +2,6 @@
 
 import sys, os
 import logging
-import requests
 import zipfile
 import shutil
 import numpy as np
@@ -10,6 +9,7 @@ import shapely
 import math
 
 import workflow.utils
+import workflow.sources.download
 
 def huc_str(huc):
     """Converts a huc int or string to a standard-format huc string."""
@@ -25,19 +25,13 @@ def huc_str(huc):
         raise RuntimeError("Cannot convert type %r to huc"%type(huc))
     return huc
 
-def download(url, location, force=False):
-    """Download a file from a URL to a location.  If force, clobber whatever is there."""
-    if os.path.isfile(location) and force:
-        os.remove(location)
-
-    if not os.path.isfile(location):
-        logging.info('Downloading: "%s"'%url)
-        logging.info('         to: "%s"'%location)
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(location, 'wb') as f:
-                shutil.copyfileobj(r.raw, f)
+def download(url, location, force=False, **kwargs):
+    """Download a file from a URL to a location.  If force, clobber whatever is there.
 
+    See workflow.sources.download.download() for further options,
+    including expected sizes and checksums.
+    """
+    workflow.sources.download.download(url, location, force, **kwargs)
     return os.path.isfile(location)
 
 def unzip(filename, to_location):
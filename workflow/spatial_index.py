@@ -0,0 +1,149 @@
+"""Bounding-box spatial indices over collections of shapes.
+
+These wrap shapely's STRtree to answer "which shapes have a bounding
+box overlapping this one?" in roughly logarithmic time, returning
+integer positions (or handles) rather than geometries so that callers
+can map results back onto their own data structures.  They work with
+both the 1.x (geometry-returning) and 2.x (index-returning) STRtree
+APIs.
+"""
+
+import numpy as np
+import shapely.geometry
+import shapely.strtree
+
+
+def expand_bounds(bounds, tol=0.):
+    """Expand a (xmin, ymin, xmax, ymax) bounding box by tol on all sides."""
+    return (bounds[0]-tol, bounds[1]-tol, bounds[2]+tol, bounds[3]+tol)
+
+
+class BoundsIndex:
+    """A static index over a list of bounding boxes.
+
+    Bounding boxes are (xmin, ymin, xmax, ymax) tuples, e.g. the
+    `bounds` of a shapely object.  Queries return the positions, in the
+    original list, of all boxes overlapping the query box.  Empty
+    boxes, the bounds of empty geometries, are never returned.
+    """
+    def __init__(self, bounds_list):
+        bounds_list = list(bounds_list)
+        self._size = len(bounds_list)
+        self._boxes = []
+        self._positions = []
+        for i,b in enumerate(bounds_list):
+            if len(b) > 0:
+                self._boxes.append(shapely.geometry.box(*b))
+                self._positions.append(i)
+        self._box_positions = dict((id(b),i) for (i,b) in zip(self._positions, self._boxes))
+        self._positions = np.array(self._positions, dtype='i')
+        if len(self._boxes) > 0:
+            self._tree = shapely.strtree.STRtree(self._boxes)
+        else:
+            self._tree = None
+
+    def __len__(self):
+        return self._size
+
+    def query(self, bounds, tol=0.):
+        """Sorted positions of all boxes overlapping bounds, expanded by tol."""
+        if self._tree is None:
+            return np.zeros((0,), 'i')
+        found = self._tree.query(shapely.geometry.box(*expand_bounds(bounds, tol)))
+        if len(found) == 0:
+            return np.zeros((0,), 'i')
+        if isinstance(found[0], shapely.geometry.base.BaseGeometry):
+            # shapely 1.x returns the geometries themselves
+            found = np.array([self._box_positions[id(b)] for b in found], dtype='i')
+        else:
+            found = self._positions[np.asarray(found)]
+        return np.sort(found)
+
+
+class CollectionIndex:
+    """A spatial index over a HandledCollection, kept in sync with it.
+
+    The index registers itself as an observer of the collection, so
+    entries that are replaced, added, or removed after the index was
+    built are tracked as stale.  Stale entries are checked directly, as
+    an array of bounding boxes, on each query, and the tree is rebuilt
+    once more than rebuild_factor * sqrt(n) of them accumulate.  This
+    keeps the cost of interleaved changes and queries sub-quadratic.
+
+    Queries return handles into the collection.
+    """
+    def __init__(self, collection, rebuild_factor=32, min_rebuild=64):
+        self._collection = collection
+        self._rebuild_factor = rebuild_factor
+        self._min_rebuild = min_rebuild
+        self._handles = []
+        self._bounds = dict()
+        self._index = None
+        self._clear_stale()
+        collection.observe(self._changed)
+
+    def _clear_stale(self):
+        self._stale = dict() # handle --> row in _stale_bounds
+        self._stale_handles = []
+        self._stale_bounds = np.zeros((self._min_rebuild,4),'d')
+        self._pending = set() # stale handles whose bounds are not yet computed
+
+    def _changed(self, handle):
+        if handle not in self._stale:
+            self._stale[handle] = len(self._stale_handles)
+            self._stale_handles.append(handle)
+        self._pending.add(handle)
+
+    def _needs_rebuild(self):
+        return self._index is None or \
+            len(self._stale) > max(self._min_rebuild, self._rebuild_factor * np.sqrt(len(self._handles)))
+
+    def _update_stale_bounds(self):
+        """Compute bounds of entries changed since the last query."""
+        if len(self._stale_handles) > len(self._stale_bounds):
+            new_size = max(len(self._stale_handles), 2*len(self._stale_bounds))
+            self._stale_bounds = np.resize(self._stale_bounds, (new_size,4))
+        for h in self._pending:
+            try:
+                b = self._collection[h].bounds
+            except KeyError:
+                # removed from the collection
+                b = ()
+            if len(b) == 0:
+                # NaN bounds overlap nothing
+                b = (np.nan, np.nan, np.nan, np.nan)
+            self._stale_bounds[self._stale[h]] = b
+        self._pending = set()
+
+    def rebuild(self):
+        """Rebuild the index from the current state of the collection."""
+        # bounds of unchanged entries are kept from the last build
+        self._handles = list(self._collection.handles())
+        old_bounds = self._bounds
+        self._bounds = dict()
+        for h in self._handles:
+            if h in old_bounds and h not in self._stale:
+                self._bounds[h] = old_bounds[h]
+            else:
+                self._bounds[h] = self._collection[h].bounds
+        self._index = BoundsIndex([self._bounds[h] for h in self._handles])
+        self._clear_stale()
+
+    def query(self, bounds, tol=0.):
+        """Handles of all entries whose bounds overlap bounds, expanded by tol.
+
+        Handles are returned in increasing order, which is also the
+        iteration order of the collection.
+        """
+        if self._needs_rebuild():
+            self.rebuild()
+        found = [self._handles[i] for i in self._index.query(bounds, tol)]
+        if len(self._stale) > 0:
+            self._update_stale_bounds()
+            found = [h for h in found if h not in self._stale]
+            sb = self._stale_bounds[0:len(self._stale_handles)]
+            overlap = (sb[:,0] <= bounds[2] + tol) & (bounds[0] <= sb[:,2] + tol) & \
+                      (sb[:,1] <= bounds[3] + tol) & (bounds[1] <= sb[:,3] + tol)
+            found.extend(self._stale_handles[i] for i in np.nonzero(overlap)[0])
+            found.sort()
+        return found
@@ -4,13 +4,19 @@ import shapely.geometry
 import shapely.ops
 
 import workflow.utils
+import workflow.spatial_index
 
 class HandledCollection:
-    """A collection of of objects and handles for those objects."""
+    """A collection of of objects and handles for those objects.
+
+    Observers, registered through observe(), are called with the handle
+    of any object that is set, added, or removed.
+    """
     def __init__(self, objs=None):
         """Create"""
         self._store = dict()
         self._key = 0
+        self._observers = []
 
         if objs is not None:
             self.add_many(objs)
@@ -22,12 +28,14 @@ class HandledCollection:
     def __setitem__(self, key, val):
         """Set an object"""
         self._store[key] = val
+        self._notify(key)
     
     def add(self, value):
         """Adds a object, returning a handle to that object"""
         self._store[self._key] = value
         ret = self._key
         self._key += 1
+        self._notify(ret)
         return ret
 
     def add_many(self, values):
@@ -36,7 +44,17 @@ class HandledCollection:
     
     def pop(self, key):
         """Removes a handle and its object."""
-        return self._store.pop(key)
+        val = self._store.pop(key)
+        self._notify(key)
+        return val
+
+    def observe(self, callback):
+        """Register callback(handle), called whenever an object changes."""
+        self._observers.append(callback)
+
+    def _notify(self, key):
+        for callback in self._observers:
+            callback(key)
 
     def __iter__(self):
         """Generator for the collection."""
@@ -87,7 +105,7 @@ class SplitHUCs:
         self.intersections = HandledCollection() # stores handles into segments
 
         # initialize
-        uniques, intersections = intersect_and_split(shapes)
+        uniques, intersections = intersect_and_split_sparse(shapes)
 
         boundary_gon = [HandledCollection() for i in range(len(shapes))]
         for i,u in enumerate(uniques):
@@ -105,24 +123,20 @@ class SplitHUCs:
                 raise RuntimeError("Uniques from intersect_and_split is not None, LineString, or MultiLineString?")
 
         intersection_gon = [HandledCollection() for i in range(len(shapes))]
-        for i in range(len(shapes)):
-            for j in range(len(shapes)):
-                inter = intersections[i][j]
-                if inter is None:
-                    pass
-                elif type(inter) is shapely.geometry.LineString:
-                    #print("Adding linestring intersection")
-                    handle = self.segments.add(inter)
-                    ihandle = self.intersections.add(HandledCollection([handle,]))
-                    intersection_gon[i].add(ihandle)
-                    intersection_gon[j].add(ihandle)
-                elif type(inter) is shapely.geometry.MultiLineString:
-                    handles = self.segments.add_many(list(inter))
-                    ihandles = self.intersections.add_many([HandledCollection([h,]) for h in handles])
-                    intersection_gon[i].add_many(ihandles)
-                    intersection_gon[j].add_many(ihandles)
-                else:
-                    raise RuntimeError("Intersections from intersect_and_split is not None, LineString, or MultiLineString?")
+        for (i,j), inter in intersections.items():
+            if type(inter) is shapely.geometry.LineString:
+                #print("Adding linestring intersection")
+                handle = self.segments.add(inter)
+                ihandle = self.intersections.add(HandledCollection([handle,]))
+                intersection_gon[i].add(ihandle)
+                intersection_gon[j].add(ihandle)
+            elif type(inter) is shapely.geometry.MultiLineString:
+                handles = self.segments.add_many(list(inter))
+                ihandles = self.intersections.add_many([HandledCollection([h,]) for h in handles])
+                intersection_gon[i].add_many(ihandles)
+                intersection_gon[j].add_many(ihandles)
+            else:
+                raise RuntimeError("Intersections from intersect_and_split is not None, LineString, or MultiLineString?")
 
         # the list of shapes, each entry in the list is a tuple
         self.gons = [(u,i) for u,i in zip(boundary_gon, intersection_gon)]
@@ -132,9 +146,20 @@ class SplitHUCs:
         for s in shapes:
             try:
                 self.properties.append(s.properties)
-            except TypeError:
+            except (TypeError, AttributeError):
                 self.properties.append(None)
-        
+
+        self._segment_index = None
+
+    def segment_index(self):
+        """A spatial index over segments, kept in sync as they change.
+
+        Returns a workflow.spatial_index.CollectionIndex, whose query()
+        gives handles of segments with bounding boxes near a region.
+        """
+        if self._segment_index is None:
+            self._segment_index = workflow.spatial_index.CollectionIndex(self.segments)
+        return self._segment_index
 
     def polygon(self, i):
         """Construct polygon i and return a copy."""
@@ -197,33 +222,73 @@ def intersect_and_split(list_of_shapes):
     intersections       | A NxN list of lists of either None, LineString, 
                         |  or MultiLineString, describing the interior
                         |  boundary.
+
+    Note this allocates the NxN table; see intersect_and_split_sparse()
+    for a version whose memory scales with the number of neighbors.
     """
+    uniques, sparse = intersect_and_split_sparse(list_of_shapes)
     intersections = [[None for i in range(len(list_of_shapes))] for j in range(len(list_of_shapes))]
+    for (i,j), inter in sparse.items():
+        intersections[i][j] = inter
+    return uniques, intersections
+
+def _shared_boundary(s1, s2):
+    """The boundary shared by two intersecting shapes, or None if they
+    only touch at a point."""
+    inter = s1.intersection(s2)
+    if type(inter) is shapely.geometry.collection.GeometryCollection:
+        # likely some overlap, we got a polygon...
+        s2 = s2.difference(s1)
+        inter = s1.intersection(s2)
+
+    if type(inter) is shapely.geometry.MultiLineString:
+        inter = shapely.ops.linemerge(inter)
+    elif type(inter) is shapely.geometry.LineString:
+        pass
+    elif type(inter) is shapely.geometry.Point:
+        return None
+    else:
+        raise RuntimeError("Invalid type of intersection: %r"%type(inter))
+    return inter
+
+def intersect_and_split_sparse(list_of_shapes):
+    """Given a list of shapes which share boundaries (i.e. they partition
+    some space), return a compilation of their segments.
+
+    Candidate neighbors are found through a bounding-box spatial index,
+    and each shared boundary is computed once, so this scales with the
+    number of neighboring pairs rather than N^2.
+
+    Given a list of shapes of length N, returns:
+
+    uniques             | An N-length-list of either None, LineString,
+                        |  or MultiLineString, describing the exterior 
+                        |  boundary
+    intersections       | A dictionary mapping (i,j), with i > j, to a
+                        |  LineString or MultiLineString describing the
+                        |  interior boundary between shapes i and j.
+                        |  Keys are sorted.
+    """
     uniques = [shapely.geometry.LineString(list(sh.exterior.coords)) for sh in list_of_shapes]
+    index = workflow.spatial_index.BoundsIndex([sh.bounds for sh in list_of_shapes])
 
+    # all shared boundaries, keyed by (i,j) with i > j
+    intersections = dict()
+    neighbors = [list() for i in range(len(list_of_shapes))]
     for i, s1 in enumerate(list_of_shapes):
-        for j, s2 in enumerate(list_of_shapes):
-            if i != j and s1.intersects(s2):
-                inter = s1.intersection(s2)
-                if type(inter) is shapely.geometry.collection.GeometryCollection:
-                    # likely some overlap, we got a polygon...
-                    s2 = s2.difference(s1)
-                    inter = s1.intersection(s2)
-                
-                if type(inter) is shapely.geometry.MultiLineString:
-                    inter = shapely.ops.linemerge(inter)
-                elif type(inter) is shapely.geometry.LineString:
-                    pass
-                elif type(inter) is shapely.geometry.Point:
-                    continue
-                else:
-                    raise RuntimeError("Invalid type of intersection: %r"%type(inter))
-                
-                uniques[i] = uniques[i].difference(inter)
-
-                # only save once!
-                if i > j:
-                    intersections[i][j] = inter
+        for j in index.query(s1.bounds):
+            j = int(j)
+            if j < i and s1.intersects(list_of_shapes[j]):
+                inter = _shared_boundary(s1, list_of_shapes[j])
+                if inter is not None:
+                    intersections[(i,j)] = inter
+                    neighbors[i].append(j)
+                    neighbors[j].append(i)
+
+    # remove shared boundaries from the uniques, in order of neighbor
+    for i in range(len(list_of_shapes)):
+        for j in sorted(neighbors[i]):
+            uniques[i] = uniques[i].difference(intersections[(max(i,j), min(i,j))])
 
     # merge uniques, as we have a bunch of segments.
     for i,u in enumerate(uniques):
@@ -232,6 +297,6 @@ def intersect_and_split(list_of_shapes):
 
     uniques_r = [None,]*len(uniques)
     for i,u in enumerate(uniques):
-        if type(u) is not shapely.geometry.GeometryCollection:
+        if type(u) is not shapely.geometry.GeometryCollection and not u.is_empty:
             uniques_r[i] = u
     return uniques_r, intersections
@@ -25,6 +25,13 @@ def run_test_1D(elev_in, elev_out, alg):
         workflow.condition.condition2(points, 0)
     elif alg == 3:
         workflow.condition.condition3(points, 0)
+    elif alg == 4:
+        conn = [[i,i+1] for i in range(len(elev_in)-1)]
+        adjacency = workflow.condition.node_adjacency(conn, len(elev_in))
+        elev = np.array([points[i].coords[2] for i in range(len(points))], 'd')
+        workflow.condition.condition4(elev, adjacency, 0)
+        for i in range(len(points)):
+            points[i].coords[2] = elev[i]
 
     print("GOT COORDS:")
     print(([points[i].coords[2] for i in range(len(points))]))
@@ -36,32 +43,69 @@ def test_null():
     run_test_1D([0,1,2,3,4,5], [0,1,2,3,4,5], 1)
     run_test_1D([0,1,2,3,4,5], [0,1,2,3,4,5], 2)
     run_test_1D([0,1,2,3,4,5], [0,1,2,3,4,5], 3)
+    run_test_1D([0,1,2,3,4,5], [0,1,2,3,4,5], 4)
 
 def test_one_pit():
     run_test_1D([0,1,3,2,4,5], [0,1,3,3,4,5], 1)
     run_test_1D([0,1,3,2,4,5], [0,1,3,3,4,5], 2)
     run_test_1D([0,1,3,2,4,5], [0,1,3,3,4,5], 3)
+    run_test_1D([0,1,3,2,4,5], [0,1,3,3,4,5], 4)
 
 def test_two_pit():
     run_test_1D([0,1,3,2,1,4], [0,1,3,3,3,4], 1)
     run_test_1D([0,1,3,2,1,4], [0,1,3,3,3,4], 2)
     run_test_1D([0,1,3,2,1,4], [0,1,3,3,3,4], 3)
+    run_test_1D([0,1,3,2,1,4], [0,1,3,3,3,4], 4)
 
 def test_two_pit_backwards():
     run_test_1D([0,1,3,1,2,4], [0,1,3,3,3,4], 1)
     run_test_1D([0,1,3,1,2,4], [0,1,3,3,3,4], 2)
     run_test_1D([0,1,3,1,2,4], [0,1,3,3,3,4], 3)
+    run_test_1D([0,1,3,1,2,4], [0,1,3,3,3,4], 4)
 
 def test_double_pit():
     run_test_1D([0,1,2,1,3,1,3,5], [0,1,2,2,3,3,3,5], 1)
     run_test_1D([0,1,2,1,3,1,3,5], [0,1,2,2,3,3,3,5], 2)
     run_test_1D([0,1,2,1,3,1,3,5], [0,1,2,2,3,3,3,5], 3)
+    run_test_1D([0,1,2,1,3,1,3,5], [0,1,2,2,3,3,3,5], 4)
 
 def test_bad_outlet_pit():
     run_test_1D([0,1,3,-1,4,5], [0,1,3,3,4,5], 1)
     run_test_1D([0,1,3,-1,4,5], [0,1,3,3,4,5], 2)
     run_test_1D([0,1,3,-1,4,5], [0,1,3,3,4,5], 3)
-    
+    run_test_1D([0,1,3,-1,4,5], [0,1,3,3,4,5], 4)
 
 
-    
+class _Mesh:
+    """Just enough of a Mesh2D for condition()"""
+    def __init__(self, coords, conn):
+        self.coords = coords
+        self.conn = conn
+
+    def num_nodes(self):
+        return len(self.coords)
+
+
+def test_adjacency():
+    conn = [[0,1,2], [1,3,2], [2,3,4,5]]
+    indptr, indices = workflow.condition.node_adjacency(conn, 6)
+    points = workflow.condition.points_from_mesh(_Mesh(np.zeros((6,3)), conn))
+    for i in range(6):
+        assert(list(indices[indptr[i]:indptr[i+1]]) == sorted(points[i].neighbors))
+
+
+def test_random_mesh_alg4_same_as_alg3():
+    import scipy.spatial
+    np.random.seed(0)
+    xy = np.random.random((400,2))
+    conn = scipy.spatial.Delaunay(xy).simplices
+    coords = np.zeros((len(xy),3),'d')
+    coords[:,0:2] = xy
+    coords[:,2] = np.random.random((len(xy),))
+
+    m3 = _Mesh(coords.copy(), conn.tolist())
+    workflow.condition.condition(m3, 0, algorithm=3)
+    m4 = _Mesh(coords.copy(), conn)
+    workflow.condition.condition(m4, 0, algorithm=4)
+    assert(np.array_equal(m3.coords, m4.coords))
+    assert((m4.coords[:,2] >= coords[:,2]).all())
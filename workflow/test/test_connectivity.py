@@ -0,0 +1,122 @@
+import pytest
+import numpy as np
+
+import workflow.connectivity
+
+def test_csr_from_lists():
+    lists = [[0,1,2], [2,1,3,4], [5,]]
+    csr = workflow.connectivity.CSR.from_lists(lists)
+    assert(len(csr) == 3)
+    assert(list(csr.offsets) == [0,3,7,8])
+    assert(list(csr.lengths()) == [3,4,1])
+    assert(list(csr.row_ids()) == [0,0,0,1,1,1,1,2])
+    assert(csr.tolist() == lists)
+    assert(csr[1] == [2,1,3,4])
+    assert(csr[-1] == [5,])
+    assert(not csr.is_uniform())
+    with pytest.raises(ValueError):
+        csr.to_array()
+
+def test_csr_take_map():
+    csr = workflow.connectivity.CSR.from_lists([[0,1,2], [2,1,3,4], [5,]])
+    assert(csr.take([2,0,0]).tolist() == [[5,], [0,1,2], [0,1,2]])
+    assert(csr.take([]).tolist() == [])
+    assert(csr.map(np.arange(6)*10).tolist() == [[0,10,20], [20,10,30,40], [50,]])
+
+def test_csr_array():
+    array = np.array([[0,1,2], [2,3,0]])
+    csr = workflow.connectivity.CSR.from_any(array)
+    assert(csr.is_uniform())
+    assert(np.array_equal(csr.to_array(), array))
+    both = workflow.connectivity.CSR.concatenate([csr, workflow.connectivity.CSR.from_lists([[4,5,6,7]])])
+    assert(both.tolist() == [[0,1,2], [2,3,0], [4,5,6,7]])
+
+def test_csr_duplicates():
+    assert(not workflow.connectivity.CSR.from_lists([[0,1,2], [2,1,3,4], [5,]]).has_duplicates())
+    assert(workflow.connectivity.CSR.from_lists([[0,1,2], [2,1,3,1], [5,]]).has_duplicates())
+    assert(workflow.connectivity.CSR.from_array(np.array([[0,1,2], [2,3,2]])).has_duplicates())
+
+def _grid_with_hole():
+    """A 4x4 grid of quads, 5x5 nodes, with the middle 2x2 cells removed."""
+    cells = []
+    for j in range(4):
+        for i in range(4):
+            if not (1 <= i <= 2 and 1 <= j <= 2):
+                n = i + 5*j
+                cells.append([n, n+1, n+6, n+5])
+    return workflow.connectivity.CSR.from_lists(cells)
+
+def test_edge_topology():
+    conn = workflow.connectivity.CSR.from_lists([[0,1,2], [2,1,3]])
+    topo = workflow.connectivity.EdgeTopology(conn, 4)
+    assert(len(topo) == 5)
+    assert(topo.edges.tolist() == [[0,1], [1,2], [0,2], [1,3], [2,3]])
+    assert(topo.counts.tolist() == [1,2,1,1,1])
+    assert(topo.edge_cells.tolist() == [[0,], [0,1], [0,], [1,], [1,]])
+    assert(topo.boundary.tolist() == [0,2,3,4])
+    assert(topo.boundary_nodes().tolist() == [0,1,2,3])
+
+    loops = topo.boundary_loops()
+    assert(len(loops) == 1)
+    assert(loops[0].tolist() == [[0,1], [1,3], [3,2], [2,0]])
+
+def test_boundary_loops_hole():
+    topo = workflow.connectivity.EdgeTopology(_grid_with_hole(), 25)
+    loops = topo.boundary_loops()
+    assert(len(loops) == 2)
+    outer, hole = loops
+    assert(outer[:,0].tolist() == [0,1,2,3,4,9,14,19,24,23,22,21,20,15,10,5])
+    assert(hole[:,0].tolist() == [6,11,16,17,18,13,8,7])
+    for loop in loops:
+        assert(np.all(loop[1:,0] == loop[:-1,1]))
+        assert(loop[-1,1] == loop[0,0])
+
+def test_signed_areas():
+    coords = np.array([[0,0], [1,0], [1,1], [0,1.], [2,0], [2,1]])
+    tris = np.array([[0,1,2], [0,2,1]])
+    assert(np.allclose(workflow.connectivity.signed_areas(coords, tris), [0.5, -0.5]))
+    quads = np.array([[1,4,5,2], [0,3,2,1]])
+    assert(np.allclose(workflow.connectivity.signed_areas(coords, quads), [1, -1]))
+    mixed = [[0,2,1], [1,4,5,2]]
+    assert(np.allclose(workflow.connectivity.signed_areas(coords, mixed), [-0.5, 1]))
+    csr = workflow.connectivity.CSR.from_lists(mixed)
+    assert(np.allclose(workflow.connectivity.signed_areas(coords, csr), [-0.5, 1]))
+
+def test_orient():
+    coords = np.array([[0,0], [1,0], [1,1], [0,1.], [2,0], [2,1]])
+    tris = np.array([[0,1,2], [0,2,1]])
+    assert(workflow.connectivity.orient(coords, tris).tolist() == [1,])
+    assert(tris.tolist() == [[0,1,2], [1,2,0]])
+
+    csr = workflow.connectivity.CSR.from_lists([[0,3,2,1], [2,4,1], [1,4,5,2]])
+    assert(workflow.connectivity.orient(coords, csr).tolist() == [0,1])
+    assert(csr.tolist() == [[1,2,3,0], [1,4,2], [1,4,5,2]])
+    assert(np.all(workflow.connectivity.signed_areas(coords, csr) > 0))
+
+def _orient_loop(points, gons):
+    """The original per-cell orientation check of the VTK readers."""
+    for gon in gons:
+        cross = []
+        for i in range(len(gon)):
+            ip = (i+1) % len(gon)
+            ipp = (i+2) % len(gon)
+            cross.append(np.cross(points[gon[ipp]] - points[gon[ip]], points[gon[i]] - points[gon[ip]]))
+        if (np.array([c[2] for c in cross]).mean() < 0):
+            gon.reverse()
+
+def test_orient_same_as_loop():
+    import scipy.spatial
+    np.random.seed(0)
+    points = np.zeros((100,3),'d')
+    points[:,0:2] = np.random.random((100,2))
+    tris = scipy.spatial.Delaunay(points[:,0:2]).simplices
+    flip = np.random.random((len(tris),)) < 0.5
+    tris[flip] = tris[flip,::-1]
+
+    gons = tris.tolist()
+    _orient_loop(points, gons)
+    csr = workflow.connectivity.CSR.from_array(tris.copy())
+    assert(np.flatnonzero(flip).tolist() == workflow.connectivity.orient(points, tris).tolist())
+    assert(tris.tolist() == gons)
+    workflow.connectivity.orient(points, csr)
+    assert(csr.tolist() == gons)
@@ -5,6 +5,7 @@ import numpy as np
 
 import workflow
 import workflow.conf
+import workflow.interpolate
 
 @pytest.fixture
 def dem_and_points():
@@ -47,3 +48,46 @@ def test_interp(dem_and_points):
     vals = workflow.values_from_raster(xy, dem_profile['crs'], dem, dem_profile,'piecewise bilinear')
     assert(np.allclose(np.array([1,1,3.5,3.5,3.5,10,10,2,1]), vals, 1.e-4))
     
+
+
+def test_interp_chunked(dem_and_points):
+    dem, dem_profile, xy = dem_and_points
+    vals = workflow.interpolate.interpolate(xy, dem, dem_profile['transform'])
+    vals_chunked = workflow.interpolate.interpolate(xy, dem, dem_profile['transform'], chunk_size=2)
+    assert(np.array_equal(vals, vals_chunked))
+
+
+def test_interp_nodata(dem_and_points):
+    dem, dem_profile, xy = dem_and_points
+    dem[1,1] = np.nan
+    vals = workflow.values_from_raster(xy, dem_profile['crs'], dem, dem_profile,'piecewise bilinear')
+    assert(not np.isnan(vals).any())
+    assert(np.allclose(np.array([1,1,1.3333333,1.3333333,1.3333333,1.5,1.5,2,1]), vals, 1.e-4))
+
+    # only the 1s are valid now
+    dem_profile['nodata'] = 2
+    vals = workflow.values_from_raster(xy, dem_profile['crs'], dem, dem_profile,'piecewise bilinear')
+    assert(np.allclose(np.ones((len(xy),)), vals, 1.e-4))
+
+    # no valid pixels
+    dem[:] = 2
+    vals = workflow.values_from_raster(xy, dem_profile['crs'], dem, dem_profile,'piecewise bilinear')
+    assert(np.isnan(vals).all())
+
+
+def test_interp_bicubic():
+    # bicubic reproduces a linear ramp exactly away from the edges
+    dem = np.add.outer(np.arange(8.), 2*np.arange(8.))
+    transform = rasterio.transform.Affine(1,0,0,0,1,0)
+    xy = np.array([(3.2, 3.7), (4.5, 2.5), (5.9, 4.1)])
+    vals = workflow.interpolate.interpolate(xy, dem, transform, 'piecewise bicubic')
+    assert(np.allclose((xy[:,1] - 0.5) + 2*(xy[:,0] - 0.5), vals))
+
+
+def test_rowcol():
+    transform = rasterio.transform.Affine(0.3, 0, -2., 0, -0.7, 5.)
+    np.random.seed(0)
+    xy = np.random.random((100,2)) * 10 - 3
+    rows, cols = workflow.interpolate.rowcol(xy, transform)
+    rows_r, cols_r = rasterio.transform.rowcol(transform, xy[:,0], xy[:,1])
+    assert(rows.tolist() == rows_r and cols.tolist() == cols_r)
@@ -0,0 +1,268 @@
+import pytest
+import numpy as np
+
+import workflow.extrude
+import workflow.connectivity
+
+def two_triangles():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.]])
+    return workflow.extrude.Mesh2D(coords, [[0,1,2], [0,2,3]])
+
+def test_extrude_topology():
+    m2 = two_triangles()
+    m3 = workflow.extrude.Mesh3D.extruded_Mesh2D(m2, 'constant', [1.0, 2.0], [1,1], [101,102])
+    assert(m3.num_nodes() == 12)
+    assert(m3.num_cells() == 4)
+    assert(m3.num_faces() == 16)
+    assert(np.allclose(m3.coords[:,2].reshape(4,3), [0,-1,-3]))
+
+    # horizontal faces, column by column, then vertical faces, edge by edge
+    assert(m3.face_to_node_conn.tolist() == 
+           [[0, 3, 6], [1, 4, 7], [2, 5, 8], [0, 6, 9], [1, 7, 10], [2, 8, 11],
+            [0, 3, 4, 1], [1, 4, 5, 2], [3, 6, 7, 4], [4, 7, 8, 5], [0, 6, 7, 1],
+            [1, 7, 8, 2], [6, 9, 10, 7], [7, 10, 11, 8], [0, 9, 10, 1], [1, 10, 11, 2]])
+
+    # each cell is top, bottom, then sides
+    assert(m3.elem_to_face_conn.tolist() ==
+           [[0, 1, 6, 8, 10], [1, 2, 7, 9, 11], [3, 4, 10, 12, 14], [4, 5, 11, 13, 15]])
+    assert(list(m3.material_ids) == [101, 102, 101, 102])
+    assert(m3.material_id_list == [101, 102])
+
+    bottom, surface, sides = m3.side_sets
+    assert(list(bottom.elem_list) == [1,3])
+    assert(list(bottom.side_list) == [1,1])
+    assert(list(surface.elem_list) == [0,2])
+    assert(list(surface.side_list) == [0,0])
+    assert(list(sides.elem_list) == [0, 1, 0, 1, 2, 3, 2, 3])
+    assert(list(sides.side_list) == [2, 2, 3, 3, 3, 3, 4, 4])
+
+def _extrude_lists(mesh2D, ncells_per_layer, mat_ids):
+    """The original list-based construction of the extruded topology."""
+    ncells_tall = sum(ncells_per_layer)
+    ncells_total = ncells_tall * mesh2D.num_cells()
+
+    def col_to_id(column, z_cell):
+        return z_cell + column * ncells_tall
+
+    def node_to_id(node, z_node):
+        return z_node + node * (ncells_tall+1)
+
+    def edge_to_id(edge, z_cell):
+        return (ncells_tall + 1) * mesh2D.num_cells() + z_cell + edge * ncells_tall
+
+    bottom = []
+    surface = []
+    faces = []
+    cells = [list() for c in range(ncells_total)]
+
+    for col in range(mesh2D.num_cells()):
+        nodes_2 = mesh2D.conn[col]
+        surface.append(col_to_id(col,0))
+        for z_face in range(ncells_tall + 1):
+            i_f = len(faces)
+            f = [node_to_id(n, z_face) for n in nodes_2]
+            if z_face != ncells_tall:
+                cells[col_to_id(col, z_face)].append(i_f)
+            if z_face != 0:
+                cells[col_to_id(col, z_face-1)].append(i_f)
+            faces.append(f)
+        bottom.append(col_to_id(col,ncells_tall-1))
+
+    added = dict()
+    vertical_side_cells = []
+    vertical_side_indices = []
+    for col in range(mesh2D.num_cells()):
+        nodes_2 = mesh2D.conn[col]
+        for i in range(len(nodes_2)):
+            edge = mesh2D.edge_hash(nodes_2[i], nodes_2[(i+1)%len(nodes_2)])
+            try:
+                i_e = added[edge]
+            except KeyError:
+                i_e = len(added.keys())
+                added[edge] = i_e
+                for z_face in range(ncells_tall):
+                    i_f = len(faces)
+                    f = [node_to_id(edge[0], z_face),
+                         node_to_id(edge[1], z_face),
+                         node_to_id(edge[1], z_face+1),
+                         node_to_id(edge[0], z_face+1)]
+                    faces.append(f)
+                    face_cell = col_to_id(col, z_face)
+                    cells[face_cell].append(i_f)
+                    if mesh2D.edge_counts()[edge] == 1:
+                        vertical_side_cells.append(face_cell)
+                        vertical_side_indices.append(len(cells[face_cell])-1)
+            else:
+                for z_face in range(ncells_tall):
+                    i_f = edge_to_id(i_e, z_face)
+                    cells[col_to_id(col, z_face)].append(i_f)
+
+    material_ids = np.zeros((len(cells),),'i')
+    for col in range(mesh2D.num_cells()):
+        z_cell = 0
+        for ilay in range(len(ncells_per_layer)):
+            ncells = ncells_per_layer[ilay]
+            for i in range(z_cell, z_cell+ncells):
+                material_ids[col_to_id(col, i)] = mat_ids[ilay]
+            z_cell = z_cell + ncells
+
+    side_sets = [(bottom, [1,]*len(bottom)),
+                 (surface, [0,]*len(surface)),
+                 (vertical_side_cells, vertical_side_indices)]
+    return faces, cells, material_ids, side_sets
+
+def _same(m3, lists):
+    faces, cells, material_ids, side_sets = lists
+    if m3.face_to_node_conn.tolist() != faces or m3.elem_to_face_conn.tolist() != cells:
+        return False
+    if not np.array_equal(m3.material_ids, material_ids):
+        return False
+    for ss, (elems, sides) in zip(m3.side_sets, side_sets):
+        if list(ss.elem_list) != elems or list(ss.side_list) != sides:
+            return False
+    return True
+
+def test_extrude_same_as_lists():
+    # against the original list-of-lists construction
+    import scipy.spatial
+    np.random.seed(0)
+    xy = np.random.random((50,2))
+    coords = np.zeros((len(xy),3),'d')
+    coords[:,0:2] = xy
+    m2 = workflow.extrude.Mesh2D(coords, scipy.spatial.Delaunay(xy).simplices.tolist())
+    m3 = workflow.extrude.Mesh3D.extruded_Mesh2D(m2, ['constant', 'constant'], [2.0, 40.0],
+                                                 [2, 3], [1001, 1002])
+    assert(_same(m3, _extrude_lists(m2, [2, 3], [1001, 1002])))
+
+def test_extrude_node_thickness():
+    m2 = two_triangles()
+    thickness = np.array([1., 2., 3., 4.])
+    m3 = workflow.extrude.Mesh3D.extruded_Mesh2D(m2, ['node',], [thickness,], 4, 1)
+    z = m3.coords[:,2].reshape(4,5)
+    for n in range(4):
+        assert(np.allclose(z[n], np.linspace(0, -thickness[n], 5)))
+    assert(list(m3.material_ids) == [1,]*8)
+
+def test_mesh3D_lists_or_csr():
+    m2 = two_triangles()
+    m3 = workflow.extrude.Mesh3D.extruded_Mesh2D(m2, 'constant', 1.0, 2, 1)
+    m3l = workflow.extrude.Mesh3D(m3.coords, m3.face_to_node_conn.tolist(), m3.elem_to_face_conn.tolist(),
+                                  side_sets=m3.side_sets, material_ids=m3.material_ids)
+    assert(m3l.num_faces() == m3.num_faces())
+    assert(m3l.num_cells() == m3.num_cells())
+
+def test_mesh2D_array_conn():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.]])
+    # second triangle is clockwise
+    conn = np.array([[0,1,2], [0,3,2]])
+    m2 = workflow.extrude.Mesh2D(coords, conn)
+    assert(m2.conn is conn)
+    assert(np.array_equal(m2.conn, [[0,1,2], [2,3,0]]))
+    assert(m2.num_cells() == 2)
+    assert(m2.num_edges() == 5)
+    assert(m2.edge_counts()[(0,2)] == 2)
+    assert(np.allclose(m2.centroids(), [[2./3, 1./3, 0], [1./3, 2./3, 0]]))
+
+def test_mesh2D_lists_or_array_conn():
+    import scipy.spatial
+    np.random.seed(0)
+    xy = np.random.random((50,2))
+    coords = np.zeros((len(xy),3),'d')
+    coords[:,0:2] = xy
+    tris = scipy.spatial.Delaunay(xy).simplices
+    # reverse half of the triangles, to be reoriented
+    tris[::2] = tris[::2,::-1]
+    m_lists = workflow.extrude.Mesh2D(coords, tris.tolist())
+    m_array = workflow.extrude.Mesh2D(coords, tris.astype(np.int32))
+    assert(np.array_equal(np.array(m_lists.conn), m_array.conn))
+    assert(m_lists.edge_counts() == m_array.edge_counts())
+
+def test_mesh2D_csr_conn():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.], [2,0,0], [2,1,0]])
+    # a clockwise quad and a counter-clockwise triangle
+    conn = workflow.connectivity.CSR.from_lists([[1,2,5,4], [0,1,2]])
+    m2 = workflow.extrude.Mesh2D(coords, conn)
+    assert(m2.conn is conn)
+    assert(m2.conn.tolist() == [[4,5,2,1], [0,1,2]])
+    assert(m2.num_edges() == 6)
+    assert(np.allclose(m2.centroids()[0], [1.5, 0.5, 0]))
+
+    # lists are still reversed in place
+    lists = [[1,2,5,4], [0,1,2]]
+    m2 = workflow.extrude.Mesh2D(coords, lists)
+    assert(m2.conn is lists)
+    assert(lists == [[4,5,2,1], [0,1,2]])
+
+def test_mesh2D_invalid_conn():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.]])
+    with pytest.raises(AssertionError):
+        workflow.extrude.Mesh2D(coords, np.array([[0,1,4]]))
+    with pytest.raises(AssertionError):
+        workflow.extrude.Mesh2D(coords, workflow.connectivity.CSR.from_lists([[0,1,1]]))
+
+def test_mesh2D_boundary():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.], [2,0,0], [2,1,0]])
+    # the quad is clockwise, and is reversed
+    m2 = workflow.extrude.Mesh2D(coords, [[1,2,5,4], [0,1,2], [0,2,3]])
+    assert(m2.boundary_edges() == [(0,1), (1,4), (4,5), (5,2), (2,3), (3,0)])
+    assert(m2.boundary_nodes() == [0,1,4,5,2,3])
+    assert(m2.edge_topology() is m2.edge_topology())
+
+    # a hole is its own loop, and not the boundary
+    coords = np.array([[i,j,0.] for j in range(4) for i in range(4)])
+    conn = [[i+4*j, i+1+4*j, i+5+4*j, i+4+4*j] for j in range(3) for i in range(3) if (i,j) != (1,1)]
+    m2 = workflow.extrude.Mesh2D(coords, np.array(conn))
+    assert(len(m2.boundary_loops()) == 2)
+    assert(m2.boundary_nodes() == [0,1,2,3,7,11,15,14,13,12,8,4])
+    assert(m2.boundary_loops()[1][:,0].tolist() == [5,9,10,6])
+
+def test_mesh2D_boundary_strip():
+    # a triangulated strip, whose boundary is most of its edges
+    nx, ny = 20, 2
+    x, y = np.meshgrid(np.arange(nx+1, dtype='d'), np.arange(ny+1, dtype='d'))
+    coords = np.stack([x.ravel(), y.ravel(), np.zeros(((nx+1)*(ny+1),))], axis=1)
+    corner = (np.arange(nx)[None,:] + (nx+1)*np.arange(ny)[:,None]).ravel()
+    tris = np.concatenate([np.stack([corner, corner+1, corner+nx+2], axis=1),
+                           np.stack([corner, corner+nx+2, corner+nx+1], axis=1)])
+    m2 = workflow.extrude.Mesh2D(coords, tris)
+    loops = m2.boundary_loops()
+    assert(len(loops) == 1)
+    bottom = list(range(nx+1))
+    right = [nx + (nx+1)*j for j in range(1, ny+1)]
+    top = [(nx+1)*ny + i for i in range(nx-1, -1, -1)]
+    left = [(nx+1)*j for j in range(ny-1, 0, -1)]
+    assert(loops[0][:,0].tolist() == bottom + right + top + left)
+    assert(m2.boundary_nodes() == bottom + right + top + left)
+
+def test_mesh2D_boundary_direction():
+    # counter-clockwise from the lowest-numbered boundary node
+    import scipy.spatial
+    np.random.seed(0)
+    coords = np.zeros((60,3),'d')
+    coords[:,0:2] = np.random.random((60,2))
+    tris = scipy.spatial.Delaunay(coords[:,0:2]).simplices
+    tris[::2] = tris[::2,::-1]
+    m2 = workflow.extrude.Mesh2D(coords, tris)
+    edges = m2.boundary_edges()
+    nodes = m2.boundary_nodes()
+    assert(nodes[0] == min(nodes))
+    assert(all(e[1] == f[0] for (e, f) in zip(edges, edges[1:] + edges[0:1])))
+    assert(sorted(tuple(sorted(e)) for e in edges) == sorted(e for (e, c) in m2.edge_counts().items() if c == 1))
+    xy = coords[nodes,0:2]
+    assert(np.sum(xy[:,0]*np.roll(xy[:,1], -1) - np.roll(xy[:,0], -1)*xy[:,1]) > 0)
+
+def test_read_VTK_orientation(tmp_path):
+    from workflow_tpls import vtk_io
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.]])
+    filename = str(tmp_path / 'tris.vtk')
+    vtk_io.write(filename, coords, {'triangle':np.array([[0,1,2], [0,2,3], [0,3,2]])})
+    m2 = workflow.extrude.Mesh2D.read_VTK(filename)
+    assert(np.array_equal(m2.conn, [[0,1,2], [0,2,3], [2,3,0]]))
+
+    filename = str(tmp_path / 'polys.vtk')
+    with open(filename, 'w') as fid:
+        fid.write('# vtk DataFile Version 4.2\nmixed\nASCII\nDATASET POLYDATA\n')
+        fid.write('POINTS 6 double\n0 0 0\n1 0 0\n1 1 0\n0 1 0\n2 0 0\n2 1 0\n')
+        fid.write('POLYGONS 2 9\n3 0 2 1\n4 1 4 5 2\n')
+    m2 = workflow.extrude.Mesh2D.read_VTK_Unstructured(filename)
+    assert(m2.conn.tolist() == [[1,2,0], [1,4,5,2]])
@@ -0,0 +1,69 @@
+import pytest
+import copy
+import shapely.geometry
+
+import workflow.conf
+import workflow.utils
+import workflow.warp
+import workflow.flat_geometry
+
+
+@pytest.fixture
+def features():
+    return [{'geometry':{'type':'Point', 'coordinates':(-83.12345, 35.)}, 'properties':{'id':0}},
+            {'geometry':{'type':'LineString', 'coordinates':[(-83., 35.), (-84., 36.)]}, 'properties':{'id':1}},
+            {'geometry':{'type':'Polygon', 'coordinates':[[(-83., 35.), (-84., 35.), (-84., 36.), (-83., 35.)],
+                                                          [(-83.8, 35.1), (-83.9, 35.1), (-83.9, 35.2), (-83.8, 35.1)]]},
+             'properties':{'id':2}},
+            {'geometry':{'type':'MultiPolygon', 'coordinates':[[[(-83., 35.), (-84., 35.), (-84., 36.), (-83., 35.)]],
+                                                               [[(-85., 35.), (-86., 35.), (-86., 36.), (-85., 35.)]]]},
+             'properties':{'id':3}},
+            {'geometry':{'type':'MultiLineString', 'coordinates':[[(-83., 35.), (-84., 36.)]]}, 'properties':{'id':4}},
+            {'geometry':{'type':'MultiPoint', 'coordinates':[(-83., 35.), (-84., 36.)]}, 'properties':{'id':5}}]
+
+def test_offsets(features):
+    flat = workflow.flat_geometry.FlatGeometry.from_features(features)
+    assert(len(flat) == 6)
+    assert(flat.coords.shape == (1+2+8+8+2+2, 2))
+    assert(flat.geom_offsets.tolist() == [0, 1, 2, 3, 5, 6, 8])
+    assert(flat.part_offsets.tolist() == [0, 1, 2, 4, 5, 6, 7, 8, 9])
+    assert(flat.ring_offsets.tolist() == [0, 1, 3, 7, 11, 15, 19, 21, 22, 23])
+
+def test_to_shapely(features):
+    flat = workflow.flat_geometry.FlatGeometry.from_features(features)
+    shps = flat.to_shapely()
+    for f, shp in zip(features, shps):
+        expected = workflow.utils.shply(f)
+        assert(type(shp) is type(expected))
+        assert(shp.equals(expected))
+        assert(shp.properties == f['properties'])
+
+    # a single line of a MultiLineString is collapsed, unless asked not to
+    assert(type(shps[4]) is shapely.geometry.LineString)
+    assert(type(flat.shape(4, collapse=False)) is shapely.geometry.MultiLineString)
+
+def test_warp_round(features):
+    old, new = workflow.conf.latlon_crs(), workflow.conf.default_crs()
+    legacy = copy.deepcopy(features[1:4])
+    workflow.warp.warp_shapes(legacy, old, new)
+    workflow.utils.round(legacy, 2)
+    legacy = [workflow.utils.shply(f) for f in legacy]
+
+    flat = workflow.flat_geometry.FlatGeometry.from_features(features[1:4])
+    shps = flat.warp(old, new).round(2).to_shapely()
+    for s1, s2 in zip(legacy, shps):
+        assert(s1.equals_exact(s2, 0.))
+
+def test_3d():
+    features = [{'type':'LineString', 'coordinates':[(0., 0., 1.), (1., 1., 2.)]}]
+    shp = workflow.flat_geometry.FlatGeometry.from_features(features).to_shapely()[0]
+    assert(shp.has_z)
+    assert(shp.properties is None)
+
+    # mixed dimensions keep only x and y
+    features.append({'type':'LineString', 'coordinates':[(0., 0.), (1., 1.)]})
+    flat = workflow.flat_geometry.FlatGeometry.from_features(features)
+    assert(flat.coords.shape == (4,2))
+
+    with pytest.raises(ValueError):
+        workflow.flat_geometry.FlatGeometry.from_features([{'type':'GeometryCollection', 'geometries':[]}])
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import shapely.geometry
 import workflow.split_hucs
 
@@ -172,3 +173,69 @@ def test_hucs_triple():
     spine3 = hucs.segments[intersections[2]]
     assert(workflow.utils.close(spine3, shapely.geometry.LineString([(10,5), (20,5)])))
     
+
+def test_segment_index(two_boxes):
+    tb = workflow.split_hucs.SplitHUCs(two_boxes)
+    index = tb.segment_index()
+    assert(index.query((15,0,15,0)) == [1,])
+    assert(index.query((10,0,10,0)) == [0,1,2])
+    assert(index.query((25,0,25,0)) == [])
+    assert(index.query((25,0,25,0), 5.) == [1,])
+
+    # the index follows changes to the segments
+    tb.segments[1] = shapely.geometry.LineString([(100,100), (101,101)])
+    assert(index.query((15,0,15,0)) == [])
+    assert(index.query((100.5,100.5,100.5,100.5)) == [1,])
+
+    h = tb.segments.add(shapely.geometry.LineString([(50,50), (51,51)]))
+    assert(index.query((50,50,50,50)) == [h,])
+
+    tb.segments.pop(0)
+    assert(index.query((5,0,5,0)) == [])
+
+    # and is the same after a rebuild
+    index.rebuild()
+    assert(index.query((5,0,5,0)) == [])
+    assert(index.query((10,0,10,0)) == [2,])
+    assert(index.query((50,50,50,50)) == [h,])
+
+def test_intersect_and_split_sparse(three_boxes):
+    uniques, intersections = workflow.split_hucs.intersect_and_split_sparse(three_boxes)
+    assert(len(uniques) == 3)
+    assert(list(intersections.keys()) == [(1,0), (2,1)])
+    assert(intersections[(1,0)].equals(shapely.geometry.LineString([(10,-5), (10,5)])))
+    assert(intersections[(2,1)].equals(shapely.geometry.LineString([(20,-5), (20,5)])))
+
+    # same as the dense version
+    uniques_d, intersections_d = workflow.split_hucs.intersect_and_split(three_boxes)
+    for u, ud in zip(uniques, uniques_d):
+        assert(u.equals(ud))
+    for i in range(3):
+        for j in range(3):
+            if (i,j) in intersections:
+                assert(intersections[(i,j)].equals(intersections_d[i][j]))
+            else:
+                assert(intersections_d[i][j] is None)
+
+def test_intersect_and_split_sparse_grid():
+    # a grid of perturbed quadrilaterals, touching at corners as well as edges
+    n = 4
+    np.random.seed(0)
+    x = np.arange(n+1)*10. + 2*(np.random.random((n+1,n+1))-0.5)
+    y = np.arange(n+1)[:,None]*10. + 2*(np.random.random((n+1,n+1))-0.5)
+    shapes = [shapely.geometry.Polygon([(x[j,i], y[j,i]), (x[j,i+1], y[j,i+1]),
+                                        (x[j+1,i+1], y[j+1,i+1]), (x[j+1,i], y[j+1,i])])
+              for j in range(n) for i in range(n)]
+
+    uniques, intersections = workflow.split_hucs.intersect_and_split_sparse(shapes)
+    uniques_d, intersections_d = workflow.split_hucs.intersect_and_split(shapes)
+    for u, ud in zip(uniques, uniques_d):
+        assert((u is None) == (ud is None))
+        assert(u is None or u.equals(ud))
+    for i in range(len(shapes)):
+        for j in range(len(shapes)):
+            if (i,j) in intersections:
+                assert(intersections[(i,j)].equals(intersections_d[i][j]))
+            else:
+                assert(intersections_d[i][j] is None)
+    assert(len(intersections) == 2*n*(n-1))
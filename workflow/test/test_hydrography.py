@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import shapely.geometry
 
 from workflow.test.shapes import *
@@ -7,6 +8,7 @@ import workflow.utils
 import workflow.split_hucs
 import workflow.hydrography
 import workflow.tree
+import workflow.river_network
 import workflow.plot
 
 def test_null_cleanup(rivers):
@@ -431,3 +433,130 @@ def test_snap8():
     check2b(hucs,rivers)
 
     
+
+def test_snap_index_same_as_brute():
+    """Snapping with the segment spatial index matches the exhaustive search."""
+    def grid():
+        boxes = [shapely.geometry.box(10*i, 10*j, 10*(i+1), 10*(j+1)) for i in range(3) for j in range(3)]
+        reaches = []
+        for i in range(3):
+            for j in range(3):
+                # one ending near the eastern edge, one crossing the northern edge
+                reaches.append(shapely.geometry.LineString([(10*i+5, 10*j+5), (10*i+9.95, 10*j+6)]))
+                reaches.append(shapely.geometry.LineString([(10*i+2, 10*j+7), (10*i+3, 10*j+12)]))
+        return workflow.split_hucs.SplitHUCs(boxes), [workflow.tree.Tree(r) for r in reaches]
+
+    results = []
+    for use_index in [True, False]:
+        hucs, rivers = grid()
+        workflow.hydrography.snap_river_endpoints(hucs, rivers, 0.1, use_index=use_index)
+        workflow.hydrography.snap_crossings(hucs, rivers, 0.1, use_index=use_index)
+        results.append(([list(s.coords) for s in hucs.segments],
+                         [list(r.coords) for tree in rivers for r in tree.dfs()]))
+        for poly in hucs.polygons():
+            assert(poly.is_valid)
+
+    assert(results[0] == results[1])
+    # every river was snapped or cut
+    assert(len(results[0][0]) > 9*4)
+
+
+def test_remove_leaves(rivers):
+    """Parallel and short leaves are removed as by prune, all at once."""
+    spurious = shapely.geometry.LineString([(7.05,1.95), (6,1.02), (5,0)])
+    forest = workflow.hydrography.make_global_tree(list(rivers)+[spurious,])
+    assert(len(forest[0]) == 6)
+    network = workflow.river_network.RiverNetwork.from_trees(forest)
+    parallel = np.flatnonzero(workflow.hydrography.find_parallel(network, 0.1))
+    assert(len(parallel) == 1)
+    assert(workflow.utils.close(network.segment(parallel[0]), spurious))
+
+    assert(workflow.hydrography.remove_leaves(forest, parallel_tol=0.1) == 1)
+    assert(workflow.tree.is_consistent(forest))
+    assert_close(workflow.tree.forest_to_list(forest), rivers)
+    assert(workflow.hydrography.remove_leaves(forest, parallel_tol=0.01) == 0)
+
+    pruned = workflow.hydrography.make_global_tree(rivers)
+    workflow.hydrography.prune(pruned[0], 3.5)
+    assert(workflow.hydrography.remove_leaves(forest, prune_tol=3.5) == 2)
+    assert_close(workflow.tree.forest_to_list(forest), workflow.tree.forest_to_list(pruned))
+    assert(forest[0].count() == 3)
+
+
+def test_cleanup_parallel(rivers):
+    spurious = shapely.geometry.LineString([(7.05,1.95), (5,0)])
+    forest = workflow.hydrography.make_global_tree(list(rivers)+[spurious,])
+    workflow.hydrography.cleanup(forest, None, None, None, parallel_tol=0.1)
+    assert_close(workflow.tree.forest_to_list(forest), rivers)
+
+
+def test_remove_leaves_segmentless_root():
+    """Reaches under the segmentless roots of make_trees are pruned, as by prune."""
+    reaches = [shapely.geometry.LineString([(100,0), (0,0)]),
+               shapely.geometry.LineString([(0,10), (0,13)])]
+    old = workflow.tree.make_trees(reaches)
+    for tree in old:
+        workflow.hydrography.prune(tree, 10)
+    new = workflow.tree.make_trees(reaches)
+    workflow.hydrography.cleanup(new, None, prune_tol=10, merge_tol=None)
+    assert([len(t) for t in old] == [1, 0])
+    assert([len(t) for t in new] == [1, 0])
+
+
+def test_is_within():
+    a = np.array([(0.,0.05), (1000.,0.05)])
+    b = np.array([(-1.,0.), (500.,0.), (1001.,0.)])
+    for chunk_size in [1, 7, 2**16]:
+        assert(workflow.hydrography._is_within(a, b, 0.1, chunk_size))
+        assert(not workflow.hydrography._is_within(a, b, 0.01, chunk_size))
+    # bowed in the middle, between vertices of a
+    b = np.array([(0.,0.05), (500.,1.), (1000.,0.05)])
+    assert(not workflow.hydrography._is_within(a, b, 0.1, 2**10))
+
+
+def _random_forest_with_spurious_leaves(n_reaches, n_spurious):
+    """A random forest, with spurious leaves along part of some reaches."""
+    np.random.seed(0)
+    starts = np.zeros((n_reaches, 2))
+    starts[0:2, 0] = 1000. * np.arange(2)
+    nodes = []
+    for i in range(n_reaches):
+        p = np.random.randint(max(i-50, 0), i) if i >= 2 else -1
+        end = starts[p] if p >= 0 else starts[i] - (0., 1.)
+        if p >= 0:
+            starts[i] = end + np.random.random(2) * 20 - (10., -10.)
+        mid = (starts[i] + end) / 2 + np.random.randn(2)
+        nodes.append(workflow.tree.Tree(shapely.geometry.LineString([starts[i], mid, end])))
+        if p >= 0:
+            nodes[p].addChild(nodes[i])
+
+    for i in np.random.choice(np.arange(2, n_reaches), n_spurious, replace=False):
+        c = np.array(nodes[i].segment.coords)
+        coords = np.array([c[0] + (c[1] - c[0]) * np.random.random(), c[1], c[2]]) + np.random.randn(3, 2) * 0.02
+        coords[-1] = c[-1]
+        nodes[i].parent.addChild(workflow.tree.Tree(shapely.geometry.LineString(coords)))
+    return nodes[0:2]
+
+
+def test_remove_leaves_random_forest():
+    forest = _random_forest_with_spurious_leaves(150, 15)
+    network = workflow.river_network.RiverNetwork.from_trees(forest)
+
+    # find_parallel against all pairs of reaches
+    lengths = network.lengths()
+    xy = network.coords[:,0:2]
+    expected = np.zeros((len(network),), bool)
+    for i in np.flatnonzero(network.is_leaf() & (network.parent >= 0)):
+        a = xy[network.coord_offsets[i]:network.coord_offsets[i+1]]
+        expected[i] = any(workflow.hydrography._is_within(a, xy[network.coord_offsets[j]:network.coord_offsets[j+1]], 0.1)
+                          for j in range(len(network))
+                          if j != i and (lengths[j] > lengths[i] or (lengths[j] == lengths[i] and j < i)))
+    assert(np.count_nonzero(expected) > 0)
+    assert(np.array_equal(workflow.hydrography.find_parallel(network, 0.1), expected))
+
+    # remove_leaves against prune
+    pruned = _random_forest_with_spurious_leaves(150, 15)
+    for tree in pruned:
+        workflow.hydrography.prune(tree, 10.)
+    assert(workflow.hydrography.remove_leaves(forest, prune_tol=10.) > 0)
+    assert([tuple(s.coords) for t in forest for s in t.dfs()] == [tuple(s.coords) for t in pruned for s in t.dfs()])
@@ -0,0 +1,58 @@
+import numpy as np
+import shapely.geometry
+
+import workflow.tree
+import workflow.utils
+import workflow.mesh_quality
+
+def test_triangle_quality():
+    points = np.array([[0,0], [1,0], [0.5,np.sqrt(3)/2], [0,1], [2,0]])
+    tris = np.array([[0,1,2], [0,4,3], [0,3,1]])
+    quality = workflow.mesh_quality.triangle_quality(points, tris)
+
+    areas = [workflow.utils.triangle_area(points[t]) for t in tris]
+    assert(np.allclose(quality['area'], areas))
+    assert(np.allclose(quality['edge_lengths'][0], 1))
+    assert(np.allclose(quality['edge_lengths'][1], [np.sqrt(5), 1, 2]))
+    assert(np.allclose(quality['min_angle'], [60, np.degrees(np.arctan(0.5)), 45]))
+    assert(np.allclose(quality['max_angle'], [60, 90, 90]))
+    assert(np.isclose(quality['aspect_ratio'][0], 1))
+    assert(np.all(quality['aspect_ratio'][1:] > 1))
+    assert(np.allclose(quality['centroid'][1], [2./3, 1./3]))
+    assert('river_distance' not in quality)
+
+def test_river_distance_and_refinement():
+    points = np.array([[0,0], [10,0], [10,10], [0,10], [100,0], [100,10.]])
+    tris = np.array([[0,1,2], [0,2,3], [1,4,5], [1,5,2]])
+    rivers = [workflow.tree.Tree(shapely.geometry.LineString([(0,-5), (0,20)]))]
+    quality = workflow.mesh_quality.triangle_quality(points, tris, rivers, tol=0.1)
+    multiline = workflow.tree.forest_to_list(rivers)
+    exact = [shapely.geometry.Point(c).distance(multiline) for c in quality['centroid']]
+    assert(np.allclose(quality['river_distance'], exact, atol=0.05))
+
+    refine = workflow.mesh_quality.needs_refinement(quality, refine_distance=[5, 10, 50, 1000])
+    assert(refine.tolist() == [True, True, False, False])
+    refine = workflow.mesh_quality.needs_refinement(quality, refine_max_area=100)
+    assert(refine.tolist() == [False, False, True, True])
+    refine = workflow.mesh_quality.needs_refinement(quality, refine_max_edge_length=50)
+    assert(refine.tolist() == [False, False, True, True])
+
+    summary = workflow.mesh_quality.report(quality)
+    assert(summary['area']['max'] == 450)
+    assert(summary['edge_lengths']['min'] == 10)
+
+def test_river_distance_random():
+    # against per-triangle shapely distances around a meandering river
+    import scipy.spatial
+    np.random.seed(0)
+    points = np.random.random((300,2)) * 1000
+    tris = scipy.spatial.Delaunay(points).simplices
+    x = np.linspace(50, 950, 200)
+    rivers = [workflow.tree.Tree(shapely.geometry.LineString(np.stack([x, 500 + 300*np.sin(x/1000*6*np.pi)], axis=1)))]
+    quality = workflow.mesh_quality.triangle_quality(points, tris, rivers, tol=10)
+
+    multiline = workflow.tree.forest_to_list(rivers)
+    areas = [workflow.utils.triangle_area(points[t]) for t in tris]
+    exact = [shapely.geometry.Point(np.mean(points[t], axis=0)).distance(multiline) for t in tris]
+    assert(np.allclose(quality['area'], areas))
+    assert(np.all(np.abs(quality['river_distance'] - exact) <= 10))
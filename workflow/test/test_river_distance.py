@@ -0,0 +1,42 @@
+import pytest
+import numpy as np
+import shapely.geometry
+
+import workflow.tree
+import workflow.river_distance
+
+@pytest.fixture
+def rivers():
+    trunk = shapely.geometry.LineString([(0,0), (100,0)])
+    branch = shapely.geometry.LineString([(50,40), (50,0)])
+    tree = workflow.tree.Tree(trunk)
+    tree.addChild(branch)
+    return [tree,]
+
+def test_densify():
+    lines = [shapely.geometry.LineString([(0,0), (10,0), (10,1)])]
+    points = workflow.river_distance.densify(lines, 3.)
+    assert(np.allclose(points, [[0,0], [2.5,0], [5,0], [7.5,0], [10,0], [10,1]]))
+
+def test_distance_accuracy(rivers):
+    multiline = workflow.tree.forest_to_list(rivers)
+    np.random.seed(0)
+    points = np.random.random((200,2)) * [120, 60] - [10, 10]
+    exact = np.array([shapely.geometry.Point(p).distance(multiline) for p in points])
+
+    tol = 2.
+    distance = workflow.river_distance.RiverDistance(rivers, tol)
+    approx = distance.distances(points)
+    assert(np.all(approx >= exact - 1.e-10))
+    assert(np.all(approx <= exact + tol/2))
+
+    memoized = np.array([distance(x,y) for (x,y) in points])
+    assert(np.all(np.abs(memoized - exact) <= tol))
+    assert(distance(*points[0]) == memoized[0])
+
+def test_distance_no_rivers():
+    distance = workflow.river_distance.RiverDistance([], 1.)
+    assert(distance(1.,2.) == np.inf)
+    assert(np.all(distance.distances(np.zeros((3,2))) == np.inf))
+    with pytest.raises(ValueError):
+        workflow.river_distance.RiverDistance([], 0.)
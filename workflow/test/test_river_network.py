@@ -0,0 +1,179 @@
+import pytest
+import numpy as np
+import shapely.geometry
+
+from workflow.test.shapes import *
+
+import workflow.tree
+import workflow.hydrography
+import workflow.river_network
+
+
+def _random_forest(n_reaches, n_outlets=3):
+    """A random forest of Trees, each reach flowing into the start of its parent."""
+    np.random.seed(0)
+    parent = [-1,]*n_outlets
+    tips = list(range(n_outlets))
+    while len(parent) < n_reaches:
+        p = tips.pop(np.random.randint(len(tips)))
+        for b in range(2 if np.random.random() < 0.45 else 1):
+            tips.append(len(parent))
+            parent.append(p)
+    parent = parent[0:n_reaches]
+
+    starts = np.zeros((n_reaches, 2))
+    starts[0:n_outlets, 0] = 1000. * np.arange(n_outlets)
+    nodes = []
+    for i, p in enumerate(parent):
+        end = starts[p] if p >= 0 else starts[i] - (0., 1.)
+        if p >= 0:
+            starts[i] = end + np.random.random(2) * 20 - (10., -10.)
+        nodes.append(workflow.tree.Tree(shapely.geometry.LineString([starts[i], (starts[i] + end) / 2 + np.random.randn(2), end])))
+        if p >= 0:
+            nodes[p].addChild(nodes[i])
+    return nodes[0:n_outlets]
+
+
+@pytest.fixture
+def network(rivers):
+    trees = workflow.hydrography.make_global_tree(rivers)
+    for i, node in enumerate(trees[0].preOrder()):
+        node.properties['id'] = i
+    return trees, workflow.river_network.RiverNetwork.from_trees(trees)
+
+
+def test_round_trip(network):
+    trees, net = network
+    assert(len(net) == 5)
+    assert(list(net.parent) == [-1, 0, 0, 2, 2])
+    assert(list(net.children) == [1, 2, 3, 4])
+    assert(list(net.outlets()) == [0,])
+    assert(list(net.leaves()) == [1, 3, 4])
+    assert([p['id'] for p in net.properties] == list(range(5)))
+
+    trees2 = net.to_trees()
+    assert(len(trees2) == 1)
+    assert_close(workflow.tree.forest_to_list(trees2), workflow.tree.forest_to_list(trees))
+    assert([n.properties['id'] for n in trees2[0].preOrder()] == list(range(5)))
+    assert(workflow.tree.is_consistent(trees2[0]))
+
+
+def test_segmentless_root(y):
+    # roots without segments are skipped, their children become outlets
+    root = workflow.tree.Tree()
+    outlet = root.addChild(y[0])
+    outlet.addChild(y[1])
+    outlet.addChild(y[2])
+    root.addChild(shapely.geometry.LineString([(5,5), (4,4)]))
+    net = workflow.river_network.RiverNetwork.from_trees(root)
+    assert(len(net) == 4)
+    assert(list(net.parent) == [-1, 0, 0, -1])
+    assert(len(net.to_trees()) == 2)
+
+
+def test_consistency(network):
+    trees, net = network
+    assert(net.is_consistent())
+    net.coords[net.coord_offsets[3+1]-1] += 0.1
+    assert(not net.is_consistent())
+    assert(list(np.flatnonzero(~net.is_consistent_reach())) == [3,])
+
+
+def test_accumulation(network):
+    trees, net = network
+    lengths = net.lengths()
+    assert(np.allclose(lengths, [s.length for s in workflow.tree.forest_to_list(trees)]))
+    assert(list(net.strahler_order()) == [2, 1, 2, 1, 1])
+    upstream = net.upstream_length()
+    assert(np.allclose(upstream, [lengths.sum(), lengths[1], lengths[2:].sum(), lengths[3], lengths[4]]))
+
+
+def test_hydrologic_attributes(network):
+    trees, net = network
+    for i, node in enumerate(trees[0].preOrder()):
+        node.properties['area'] = float(i+1)
+    attributes = workflow.river_network.hydrologic_attributes(trees, area='area')
+
+    lengths = attributes['length']
+    assert(list(attributes['strahler_order']) == [2, 1, 2, 1, 1])
+    assert(list(attributes['shreve_magnitude']) == [3, 1, 2, 1, 1])
+    assert(np.allclose(attributes['upstream_length'], net.upstream_length()))
+    assert(np.allclose(attributes['distance_to_outlet'],
+                       [0, lengths[0], lengths[0], lengths[0]+lengths[2], lengths[0]+lengths[2]]))
+    assert(np.allclose(attributes['drainage_area'], [15, 2, 12, 4, 5]))
+
+    # attached to the nodes, in forest_to_list order
+    nodes = list(trees[0].preOrder())
+    assert([n.properties['shreve_magnitude'] for n in nodes] == [3, 1, 2, 1, 1])
+    assert(nodes[3].properties['distance_to_outlet'] == attributes['distance_to_outlet'][3])
+    assert(type(nodes[0].properties['strahler_order']) is int)
+
+
+def test_prune(network):
+    trees, net = network
+    pruned = net.prune(3.5)
+    workflow.hydrography.prune(trees[0], 3.5)
+    assert(len(pruned) == 3)
+    assert_close(pruned.to_list(), workflow.tree.forest_to_list(trees))
+    assert(list(pruned.leaves()) == [1, 2])
+
+
+def test_deep_chain():
+    n = 5000
+    root = workflow.tree.Tree(shapely.geometry.LineString([(1,0), (0,0)]))
+    node = root
+    for i in range(1, n):
+        node = node.addChild(shapely.geometry.LineString([(i+1,0), (i,0)]))
+    net = workflow.river_network.RiverNetwork.from_trees([root,])
+    assert(len(net.levels()) == n)
+    assert(np.allclose(net.upstream_length(), np.arange(n, 0, -1)))
+    assert(np.all(net.strahler_order() == 1))
+    assert(net.is_consistent())
+
+
+def test_random_forest():
+    # against the same operations on the Trees
+    trees = _random_forest(300)
+    net = workflow.river_network.RiverNetwork.from_trees(trees)
+    assert(net.is_consistent() and workflow.tree.is_consistent(trees))
+    assert(len(net.leaves()) == sum(len(list(t.leaf_nodes())) for t in trees))
+
+    strahler = dict()
+    upstream = dict()
+    for node in (n for t in trees for n in t.postOrder()):
+        orders = [strahler[id(c)] for c in node.children]
+        if len(orders) == 0:
+            strahler[id(node)] = 1
+        else:
+            strahler[id(node)] = max(orders) + 1 if orders.count(max(orders)) >= 2 else max(orders)
+        upstream[id(node)] = node.segment.length + sum(upstream[id(c)] for c in node.children)
+    preorder = [n for t in trees for n in t.preOrder()]
+    assert(net.strahler_order().tolist() == [strahler[id(n)] for n in preorder])
+    assert(np.allclose(net.upstream_length(), [upstream[id(n)] for n in preorder], rtol=1.e-12))
+
+    pruned = net.prune(15.)
+    assert(len(pruned) < len(net))
+    for t in trees:
+        workflow.hydrography.prune(t, 15.)
+    assert([tuple(s.coords) for s in pruned.segments()] == [tuple(s.coords) for t in trees for s in t.dfs()])
+
+def test_hydrologic_attributes_random_forest():
+    trees = _random_forest(300)
+    preorder = [n for t in trees for n in t.preOrder()]
+    for i, node in enumerate(preorder):
+        node.properties['area'] = float(i % 7 + 1)
+
+    shreve = dict()
+    area = dict()
+    for node in (n for t in trees for n in t.postOrder()):
+        shreve[id(node)] = sum(shreve[id(c)] for c in node.children) if len(node.children) > 0 else 1
+        area[id(node)] = node.properties['area'] + sum(area[id(c)] for c in node.children)
+    distance = dict()
+    for node in preorder:
+        distance[id(node)] = 0. if node.parent is None else distance[id(node.parent)] + node.parent.segment.length
+
+    attributes = workflow.river_network.hydrologic_attributes(trees, area='area')
+    assert(attributes['shreve_magnitude'].tolist() == [shreve[id(n)] for n in preorder])
+    assert(np.allclose(attributes['drainage_area'], [area[id(n)] for n in preorder], rtol=1.e-12))
+    assert(np.allclose(attributes['distance_to_outlet'], [distance[id(n)] for n in preorder], rtol=1.e-12))
+    assert([n.properties['shreve_magnitude'] for n in preorder] == [shreve[id(n)] for n in preorder])
@@ -0,0 +1,121 @@
+import pytest
+
+import workflow.tinytree
+
+
+class Node(workflow.tinytree.Tree):
+    def __init__(self, name, children=None):
+        self.name = name
+        super(Node, self).__init__(children)
+
+    def __repr__(self):
+        return self.name
+
+
+@pytest.fixture
+def tree():
+    # a
+    # |-- b
+    # |   |-- d
+    # |   `-- e
+    # `-- c
+    nodes = dict((n, Node(n)) for n in 'abcde')
+    nodes['a'].addChild(nodes['b'])
+    nodes['a'].addChild(nodes['c'])
+    nodes['b'].addChild(nodes['d'])
+    nodes['b'].addChild(nodes['e'])
+    return nodes
+
+
+def names(nodes):
+    return ''.join(n.name for n in nodes)
+
+
+def test_orders(tree):
+    assert(names(tree['a'].preOrder()) == 'abdec')
+    assert(names(tree['a'].postOrder()) == 'debca')
+    assert(names(tree['b'].preOrder()) == 'bde')
+    assert(names(tree['a'].preOrderList()) == 'abdec')
+    assert(tree['a'].count() == 5)
+    assert(tree['e'].getDepth() == 3)
+
+
+def test_find(tree):
+    assert(tree['d'].getNext() is tree['e'])
+    assert(tree['c'].getPrevious() is tree['e'])
+    assert(tree['a'].getPrevious() is None)
+    assert(tree['c'].getNext() is None)
+    assert(tree['b'].findForwards(name='c') is tree['c'])
+    assert(tree['e'].findBackwards(name='a') is tree['a'])
+
+
+def test_cache_invalidated(tree):
+    a = tree['a']
+    assert(names(a.preOrderList()) == 'abdec')
+    f = Node('f')
+    tree['c'].addChild(f)
+    assert(names(a.preOrderList()) == 'abdecf')
+    tree['d'].remove()
+    assert(names(a.preOrderList()) == 'abecf')
+    g = Node('g')
+    tree['b'].inject(g)
+    assert(names(a.preOrderList()) == 'abgecf')
+    h = Node('h')
+    tree['c'].reparent(h)
+    assert(names(a.preOrderList()) == 'abgehcf')
+    i = Node('i')
+    tree['e'].replace(i)
+    assert(names(a.preOrderList()) == 'abgihcf')
+    assert(f.getPrevious() is tree['c'])
+    assert(a.count() == 7)
+
+
+def test_cache_moved_subtree(tree):
+    a = tree['a']
+    assert(names(a.preOrderList()) == 'abdec')
+    assert(names(tree['b'].preOrderList()) == 'bde')
+
+    # a subtree cached as its own tree, then moved under another
+    b = tree['b']
+    b.remove()
+    assert(names(a.preOrderList()) == 'ac')
+    assert(names(b.preOrderList()) == 'bde')
+    tree['c'].addChild(b)
+    assert(names(a.preOrderList()) == 'acbde')
+    tree['e'].addChild(Node('f'))
+    assert(names(a.preOrderList()) == 'acbdef')
+    assert(tree['e'].getNext().name == 'f')
+
+    # nodes share the cache of their root
+    assert(a._preorder is tree['e']._preorder)
+    tree['b'].removeChildren([tree['d'], tree['e']])
+    assert(names(a.preOrderList()) == 'acb')
+    assert(names(tree['e'].preOrderList()) == 'ef')
+
+
+def test_modified_while_traversing(tree):
+    # children added to the current node are visited, as by workflow.hydrography.snap_crossings
+    visited = []
+    for node in tree['a'].preOrder():
+        visited.append(node.name)
+        if node.name == 'b':
+            node.inject(Node('f'))
+        elif node.name == 'c':
+            node.remove()
+    assert(''.join(visited) == 'abfdec')
+    assert(names(tree['a'].preOrder()) == 'abfde')
+
+
+def test_deep_chain():
+    # far deeper than the recursion limit
+    n = 100000
+    nodes = [Node(str(i)) for i in range(n)]
+    for i in range(1, n):
+        nodes[i-1].addChild(nodes[i])
+    assert(nodes[0].count() == n)
+    assert(list(nodes[0].preOrder()) == nodes)
+    assert(list(nodes[0].postOrder()) == nodes[::-1])
+    assert(nodes[-1].getDepth() == n)
+    assert(nodes[-1].getRoot() is nodes[0])
+    assert(nodes[10].findForwards(name=str(n-1)) is nodes[-1])
+    assert(nodes[-1].getPrevious() is nodes[-2])
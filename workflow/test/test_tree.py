@@ -1,5 +1,6 @@
 import pytest
 import itertools
+import numpy as np
 
 import shapely.geometry
 
@@ -76,3 +77,54 @@ def test_to_list(y_with_junction):
     
 
     
+
+def test_long_chain():
+    # deeper than the recursion limit, given in shuffled order
+    n = 3000
+    segs = [shapely.geometry.LineString([(i+1,0), (i,0)]) for i in range(n)]
+    order = list(reversed(range(n)))
+    trees = workflow.tree.make_trees([segs[i] for i in order])
+    assert(len(trees) == 1)
+    assert_list_same(list(trees[0].dfs()), segs)
+
+def test_find_inconsistent():
+    t = workflow.tree.Tree(shapely.geometry.LineString([(1,0), (0,0)]))
+    a = t.addChild(shapely.geometry.LineString([(2,0), (1,0)]))
+    t.addChild(shapely.geometry.LineString([(2,1), (1,1.e-9)]))
+    a.addChild(shapely.geometry.LineString([(3,0), (2,0.1)]))
+    t2 = workflow.tree.Tree(shapely.geometry.LineString([(5,0), (4,0)]))
+    t2.addChild(shapely.geometry.LineString([(6,0,0), (5,0,0)]))
+
+    assert(list(workflow.tree.find_inconsistent(t)) == [2,])
+    assert(list(workflow.tree.find_inconsistent([t, t2])) == [2, 5])
+    assert(not workflow.tree.is_consistent([t, t2]))
+    assert(workflow.tree.get_inconsistent(t) == [a.children[0],])
+
+    a.children[0].segment = shapely.geometry.LineString([(3,0), (2,0)])
+    assert(workflow.tree.is_consistent(t))
+    assert(all(n.check_child_consistency() for n in t.preOrder()))
+
+def test_find_inconsistent_random():
+    # against close() on each child of a random forest
+    np.random.seed(0)
+    starts = np.zeros((200, 2))
+    starts[0:3, 0] = 1000. * np.arange(3)
+    nodes = []
+    for i in range(len(starts)):
+        p = np.random.randint(i) if i >= 3 else -1
+        end = starts[p] if p >= 0 else starts[i] - (0., 1.)
+        if p >= 0:
+            starts[i] = end + np.random.random(2) * 20 - (10., -10.)
+        if np.random.random() < 0.05:
+            end = end + 1.e-3
+        nodes.append(workflow.tree.Tree(shapely.geometry.LineString([starts[i], (starts[i]+end)/2, end])))
+        if p >= 0:
+            nodes[p].addChild(nodes[i])
+    forest = nodes[0:3]
+
+    preorder = [n for tree in forest for n in tree.preOrder()]
+    expected = [i for (i, n) in enumerate(preorder) if n.parent is not None
+                and not workflow.utils.close(n.segment.coords[-1], n.parent.segment.coords[0])]
+    assert(len(expected) > 0)
+    assert(list(workflow.tree.find_inconsistent(forest)) == expected)
+    assert(workflow.tree.is_consistent(forest) == all(n.check_child_consistency() for n in preorder))
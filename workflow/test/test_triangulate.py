@@ -6,6 +6,7 @@ and make sure it runs and does something.  Can plot for debugging.
 Not sure how to test them..."""
 
 import pytest
+import numpy as np
 import shapely
 from matplotlib import pyplot as plt
 
@@ -13,6 +14,9 @@ import workflow.triangulation
 import workflow.hydrography
 import workflow.split_hucs
 import workflow.plot
+import workflow.tree
+import workflow.connectivity
+import workflow.extrude
 
 @pytest.fixture
 def hucs_rivers():
@@ -58,3 +62,83 @@ def test_triangulate_distance(hucs_rivers):
     # workflow.plot.hucs(hucs,'r')
     # workflow.plot.rivers(rivers,'b')
     # plt.show()
+
+def test_pslg(hucs_rivers):
+    hucs,rivers = hucs_rivers
+    segments = list(hucs.segments) + list(workflow.tree.forest_to_list(rivers))
+    nodes, edges = workflow.triangulation.pslg(segments)
+
+    nodes_edges = workflow.triangulation.NodesEdges(segments)
+    assert(np.allclose(nodes, np.array(list(nodes_edges.nodes))[:,0:2]))
+    assert(set(map(tuple, edges.tolist())) == nodes_edges.edges)
+    assert(len(edges) == len(nodes_edges.edges))
+    workflow.triangulation.check_pslg(nodes, edges)
+
+def test_pslg_duplicates():
+    segments = [shapely.geometry.Polygon([(0,0), (1,0), (1,1), (0,1)]),
+                shapely.geometry.LineString([(1.0001,0), (0.5,0.5), (0.5,0.5), (0,0)]),
+                shapely.geometry.LineString([(0,0), (1,0)])]
+    nodes, edges = workflow.triangulation.pslg(segments)
+    assert(np.allclose(nodes, [(0,0), (1,0), (1,1), (0,1), (0.5,0.5)]))
+    assert(edges.tolist() == [[0,1], [0,3], [0,4], [1,2], [1,4], [2,3]])
+
+    with pytest.raises(TypeError):
+        workflow.triangulation.pslg([shapely.geometry.Point(0,0)])
+
+def test_subdomain_segments(hucs_rivers):
+    hucs,rivers = hucs_rivers
+    subdomains = workflow.triangulation.subdomain_segments(hucs, rivers)
+    assert(len(subdomains) == 3)
+    # each polygon's boundary segments, plus the rivers inside it
+    assert([len(s) for s in subdomains] == [4, 4, 5])
+    for i, segments in enumerate(subdomains):
+        assert(all(hucs.polygon(i).buffer(1.e-6).contains(s) for s in segments))
+
+@pytest.mark.parametrize('nprocs', [1,2])
+def test_triangulate_parallel(hucs_rivers, nprocs):
+    hucs,rivers = hucs_rivers
+    func = workflow.triangulation.refine_from_max_area(1.)
+    points, tris = workflow.triangulation.triangulate_parallel(hucs, rivers, nprocs=nprocs,
+                                                               max_segment_length=1.5,
+                                                               refinement_func=func)
+    coords = np.zeros((len(points),3),'d')
+    coords[:,0:2] = points
+    areas = workflow.connectivity.signed_areas(coords, tris)
+    assert(np.all(areas > 0))
+    assert(areas.max() <= 1.)
+    assert(np.isclose(areas.sum(), 300.))
+
+    # conforming: the only boundary is the exterior
+    m2 = workflow.extrude.Mesh2D(coords, tris)
+    loops = m2.boundary_loops()
+    assert(len(loops) == 1)
+    assert(np.isclose(shapely.geometry.Polygon(points[loops[0][:,0]]).area, 300.))
+
+def test_triangulate_parallel_crossing():
+    # the river crosses the shared huc segment away from its vertices
+    hucs = workflow.split_hucs.SplitHUCs([shapely.geometry.box(0,0,10,10),
+                                          shapely.geometry.box(10,0,20,10)])
+    rivers = workflow.hydrography.make_global_tree([shapely.geometry.LineString([(5,0.3), (15,0)]),])
+    rivers = workflow.hydrography.snap(hucs, rivers, 0.1, 0.3)
+    func = workflow.triangulation.refine_from_max_area(1.)
+    points, tris = workflow.triangulation.triangulate_parallel(hucs, rivers, nprocs=1,
+                                                               max_segment_length=1.5,
+                                                               refinement_func=func)
+    coords = np.zeros((len(points),3),'d')
+    coords[:,0:2] = points
+    areas = workflow.connectivity.signed_areas(coords, tris)
+    assert(np.all(areas > 0))
+    assert(np.isclose(areas.sum(), 200.))
+
+    m2 = workflow.extrude.Mesh2D(coords, tris)
+    loops = m2.boundary_loops()
+    assert(len(loops) == 1)
+    assert(np.isclose(shapely.geometry.Polygon(points[loops[0][:,0]]).area, 200.))
+
+def test_merge():
+    square = np.array([(0,0), (1,0), (1,1), (0,1)], 'd')
+    left = (square, np.array([(0,1,2), (0,2,3)]))
+    right = (square + [1,0], np.array([(0,1,2), (0,2,3)]))
+    points, tris = workflow.triangulation.merge([left, right])
+    assert(np.allclose(points, [(0,0), (1,0), (1,1), (0,1), (2,0), (2,1)]))
+    assert(tris.tolist() == [[0,1,2], [0,2,3], [1,4,5], [1,5,2]])
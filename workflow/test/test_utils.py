@@ -381,10 +381,24 @@ def test_generate_multipolygons():
 
     coordlist = np.array(list(workflow.utils.generate_coords(shapely.geometry.mapping(mpoly))))
     assert(np.allclose(np.concatenate([poly1a,poly2a]), coordlist))
-    
-                                           
-    
-    
-        
-    
 
+
+def test_linestring_coords():
+    segments = [shapely.geometry.LineString(np.random.rand(n, 2)) for n in [2, 5, 3]]
+    coords, offsets = workflow.utils.linestring_coords(segments)
+    assert(list(offsets) == [0, 2, 7, 10])
+    assert(np.array_equal(coords, np.concatenate([np.array(s.coords) for s in segments])))
+
+    segments3 = [shapely.geometry.LineString(np.random.rand(n, 3)) for n in [4, 2]]
+    coords, offsets = workflow.utils.linestring_coords(segments3)
+    assert(coords.shape == (6, 3))
+    assert(np.array_equal(coords, np.concatenate([np.array(s.coords) for s in segments3])))
+
+    # mixed dimensions give x and y
+    coords, offsets = workflow.utils.linestring_coords(segments + segments3)
+    assert(coords.shape == (16, 2))
+    assert(np.array_equal(coords, np.concatenate([np.array(s.coords)[:,0:2] for s in segments + segments3])))
+
+    coords, offsets = workflow.utils.linestring_coords([])
+    assert(coords.shape == (0, 2))
+    assert(list(offsets) == [0,])
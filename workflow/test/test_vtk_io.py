@@ -0,0 +1,80 @@
+import pytest
+import numpy as np
+
+from workflow_tpls import vtk_io
+import workflow.extrude
+import workflow.connectivity
+
+@pytest.fixture
+def mixed():
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.], [2,0,0], [2,1,0]])
+    cells = {'triangle':np.array([[0,1,2], [0,2,3]]), 'quad':np.array([[1,4,5,2]])}
+    return coords, cells
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_read_buffer(tmp_path, mixed, binary):
+    coords, cells = mixed
+    filename = str(tmp_path / 'mixed.vtk')
+    vtk_io.write(filename, coords, cells, write_binary=binary)
+    points, read_cells = vtk_io.read(filename)[0:2]
+    assert(np.array_equal(points, coords))
+    assert(set(read_cells.keys()) == {'triangle', 'quad'})
+    for key in cells:
+        assert(np.array_equal(read_cells[key], cells[key]))
+
+    with open(filename, 'rb') as fid:
+        points, offsets, conn, types = vtk_io.read_buffer_flat(fid)[0:4]
+    assert(offsets.tolist() == [0,3,6,10])
+    assert(conn.tolist() == [0,1,2,0,2,3,1,4,5,2])
+    assert(types.tolist() == [5,5,9])
+
+    m2 = workflow.extrude.Mesh2D.read_VTK(filename)
+    assert(m2.conn.tolist() == [[0,1,2], [0,2,3], [1,4,5,2]])
+
+def test_read_polygons(tmp_path):
+    filename = str(tmp_path / 'polys.vtk')
+    with open(filename, 'w') as fid:
+        fid.write('# vtk DataFile Version 4.2\nmixed\nASCII\nDATASET POLYDATA\n')
+        fid.write('POINTS 7 double\n0 0 0\n1 0 0\n1 1 0\n0 1 0\n2 0 0\n2 1 0\n1.5 1.5 0\n')
+        fid.write('POLYGONS 3 14\n3 0 1 2\n5 1 4 5 6 2\n3 0 2 3\n')
+    with open(filename, 'rb') as fid:
+        points, offsets, conn, types = vtk_io.read_buffer_flat(fid)[0:4]
+    assert(offsets.tolist() == [0,3,8,11])
+    assert(types.tolist() == [5,7,5])
+    m2 = workflow.extrude.Mesh2D.read_VTK(filename)
+    assert(m2.conn.tolist() == [[0,1,2], [1,4,5,6,2], [0,2,3]])
+
+def test_read_not_surface(tmp_path):
+    coords = np.array([[0,0,0], [1,0,0], [0,1,0], [0,0,1.]])
+    filename = str(tmp_path / 'tet.vtk')
+    vtk_io.write(filename, coords, {'tetra':np.array([[0,1,2,3]])})
+    with pytest.raises(RuntimeError):
+        workflow.extrude.Mesh2D.read_VTK(filename)
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_write_mixed(tmp_path, binary):
+    coords = np.array([[0,0,0], [1,0,0], [1,1,0], [0,1,0.], [2,0,0], [2,1,0], [1.5,1.5,0]])
+    conn = workflow.connectivity.CSR.from_lists([[0,1,2], [1,4,5,6,2], [0,2,3], [2,6,3]])
+    filename = str(tmp_path / 'mixed.vtk')
+    workflow.extrude.Mesh2D(coords, conn).write_VTK(filename, write_binary=binary)
+
+    with open(filename, 'rb') as fid:
+        points, offsets, read_conn, types = vtk_io.read_buffer_flat(fid)[0:4]
+    assert(np.array_equal(points, coords))
+    assert(np.array_equal(offsets, conn.offsets))
+    assert(np.array_equal(read_conn, conn.indices))
+    assert(types.tolist() == [5,7,5,5])
+
+def test_write_chunked(tmp_path, mixed, monkeypatch):
+    coords, cells = mixed
+    monkeypatch.setattr(vtk_io, 'write_chunk_size', 2)
+    for binary in [True, False]:
+        filename = str(tmp_path / 'chunked.vtk')
+        vtk_io.write(filename, coords, cells, write_binary=binary,
+                     cell_data={'triangle':{'id':np.array([1,2])}, 'quad':{'id':np.array([3])}})
+        points, read_cells, point_data, cell_data = vtk_io.read(filename)[0:4]
+        assert(np.array_equal(points, coords))
+        for key in cells:
+            assert(np.array_equal(read_cells[key], cells[key]))
+        assert(cell_data['triangle']['id'].tolist() == [1,2])
+        assert(cell_data['quad']['id'].tolist() == [3])
@@ -0,0 +1,93 @@
+import pytest
+import copy
+import numpy as np
+import pyproj
+import shapely.geometry
+import shapely.ops
+
+import workflow.conf
+import workflow.warp
+
+
+@pytest.fixture
+def crss():
+    return workflow.conf.latlon_crs(), workflow.conf.default_crs()
+
+def reference(old_crs, new_crs):
+    return pyproj.Transformer.from_crs(pyproj.CRS.from_user_input(old_crs),
+                                       pyproj.CRS.from_user_input(new_crs), always_xy=True)
+
+def test_transformer_cache(crss):
+    old, new = crss
+    t = workflow.warp.transformer(old, new)
+    assert(t is workflow.warp.transformer(workflow.conf.latlon_crs(), workflow.conf.default_crs()))
+    assert(t is not workflow.warp.transformer(new, old))
+    assert(workflow.warp.transformer(old, old) is None)
+
+    # dictionaries work as keys too
+    t2 = workflow.warp.transformer({'init':'epsg:4269'}, {'init':'epsg:5070'})
+    assert(t2 is workflow.warp.transformer({'init':'epsg:4269'}, {'init':'epsg:5070'}))
+
+def test_warp_xy(crss):
+    old, new = crss
+    x = np.array([-83., -84.5])
+    y = np.array([35., 36.2])
+    x2, y2 = workflow.warp.warp_xy(x, y, old, new)
+    xr, yr = reference(old, new).transform(x, y)
+    assert(np.allclose(x2, xr) and np.allclose(y2, yr))
+
+    x3, y3 = workflow.warp.warp_xy(x2, y2, new, old)
+    assert(np.allclose(x3, x) and np.allclose(y3, y))
+
+    assert(workflow.warp.warp_xy(x, y, old, old) == (x, y))
+
+def test_warp_shapelys(crss):
+    old, new = crss
+    shps = [shapely.geometry.Point(-83, 35),
+            shapely.geometry.LineString([(-83, 35), (-84, 36)]),
+            shapely.geometry.Polygon([(-83, 35), (-84, 35), (-84, 36)],
+                                     [[(-83.8, 35.1), (-83.9, 35.1), (-83.9, 35.2)]]),
+            shapely.geometry.MultiLineString([[(-83, 35), (-84, 36)], [(-85, 35), (-84, 36)]]),
+            shapely.geometry.LineString([(-83, 35, 1.), (-84, 36, 2.)]),
+            shapely.geometry.LineString()]
+    warped = workflow.warp.warp_shapelys(shps, old, new)
+
+    t = reference(old, new)
+    def transform(x, y, z=None):
+        if z is None:
+            return t.transform(x, y)
+        return t.transform(x, y) + (z,)
+
+    assert(len(warped) == len(shps))
+    for shp, w in zip(shps, warped):
+        assert(type(w) is type(shp))
+        assert(w.has_z == shp.has_z)
+        if not shp.is_empty:
+            assert(w.equals_exact(shapely.ops.transform(transform, shp), 1.e-6))
+
+    assert(workflow.warp.warp_shapely(shps[2], old, new).equals_exact(warped[2], 1.e-6))
+
+def test_warp_shapes(crss):
+    old, new = crss
+    features = [{'geometry':{'type':'Point', 'coordinates':(-83., 35.)}},
+                {'geometry':{'type':'LineString', 'coordinates':[(-83., 35., 2.), (-84., 36., 3.)]}},
+                {'geometry':{'type':'Polygon', 'coordinates':[[(-83., 35.), (-84., 35.), (-84., 36.), (-83., 35.)]]}},
+                {'geometry':{'type':'MultiPolygon', 'coordinates':[[[(-83., 35.), (-84., 35.), (-84., 36.), (-83., 35.)]],
+                                                                  [[(-85., 35.), (-86., 35.), (-86., 36.), (-85., 35.)]]]}}]
+    one_at_a_time = copy.deepcopy(features)
+    for f in one_at_a_time:
+        workflow.warp.warp_shape(f, old, new)
+    workflow.warp.warp_shapes(features, old, new)
+
+    t = reference(old, new)
+    x, y = t.transform(-83., 35.)
+    assert(np.allclose(features[0]['geometry']['coordinates'], (x, y)))
+    assert(np.allclose(features[1]['geometry']['coordinates'][0], (x, y)))
+    assert(np.allclose(features[2]['geometry']['coordinates'][0][0], (x, y)))
+    assert(np.allclose(features[3]['geometry']['coordinates'][0][0][0], (x, y)))
+
+    # only x and y are kept
+    assert(len(features[1]['geometry']['coordinates'][1]) == 2)
+    assert(len(features[3]['geometry']['coordinates']) == 2)
+    for f, g in zip(features, one_at_a_time):
+        assert(f == g)
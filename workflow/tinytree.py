@@ -55,6 +55,7 @@ class Tree(object):
             :children A nested list specifying a tree of children
         """
         self.children = []
+        self._preorder = None
         if children:
             self.addChildrenFromList(children)
         self.parent = None
@@ -90,6 +91,8 @@ class Tree(object):
             raise ValueError(s)
         self.children.append(node)
         node.register(self)
+        node._modified()
+        self._modified()
 
     def register(self, parent):
         """
@@ -99,6 +102,16 @@ class Tree(object):
         """
         self.parent = parent
 
+    def _modified(self):
+        """
+            Called after the tree containing this node has changed.  All
+            nodes of a tree share the cache of preOrderList() of its root,
+            so emptying it here drops it for the whole tree in O(1) time.
+        """
+        cache = getattr(self, '_preorder', None)
+        if cache:
+            del cache[:]
+
     def index(self):
         """
             Return the index of this node in the parent child list, based on
@@ -115,10 +128,28 @@ class Tree(object):
             in the parent child list.
         """
         idx = self.index()
-        del self.parent.children[idx:idx+1]
+        parent = self.parent
+        del parent.children[idx:idx+1]
         self.parent = None
+        parent._modified()
         return idx
 
+    def removeChildren(self, nodes):
+        """
+            Remove the specified nodes from the child list of this node in
+            one pass, rather than searching the list once per node.
+            Returns the removed nodes, in child list order.
+
+            :nodes A sequence of Tree objects
+        """
+        ids = set(id(i) for i in nodes)
+        removed = [i for i in self.children if id(i) in ids]
+        self.children = [i for i in self.children if id(i) not in ids]
+        for i in removed:
+            i.parent = None
+        self._modified()
+        return removed
+
     def clear(self):
         """
             Clear all the children of this node. Return a list of the removed
@@ -142,6 +173,8 @@ class Tree(object):
         parent.children[idx:idx] = nodes
         for i in nodes:
             i.register(parent)
+            i._modified()
+        parent._modified()
 
     def inject(self, node):
         """
@@ -229,22 +262,64 @@ class Tree(object):
     def preOrder(self):
         """
             Return a list of subnodes in PreOrder.
+
+            This is iterative, so it takes O(n) time whatever the depth of
+            the tree.  As a node's children are pushed only once the node
+            has been yielded, modifications of the node's children made
+            while it is yielded are seen.
         """
-        yield self
-        # Take copy to make this robust under modification
-        for i in self.children[:]:
-            for j in i.preOrder():
-                yield j
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            # Take copy to make this robust under modification
+            stack.extend(reversed(node.children))
 
     def postOrder(self):
         """
             Return a list of the subnodes in PostOrder.
+
+            This is iterative, so it takes O(n) time whatever the depth of
+            the tree.
         """
         # Take copy to make this robust under modification
-        for i in self.children[:]:
-            for j in i.postOrder():
-                yield j
-        yield self
+        stack = [(self, iter(self.children[:]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                yield node
+            else:
+                stack.append((child, iter(child.children[:])))
+
+    def preOrderList(self):
+        """
+            Return a tuple of the subnodes in PreOrder.
+
+            For the root of a tree, the tuple is cached, and computed again
+            only after the tree has been modified by addChild, remove,
+            removeChildren, replace, inject or reparent.
+        """
+        if self.parent is not None:
+            return tuple(self.preOrder())
+        cache = getattr(self, '_preorder', None)
+        if not cache:
+            order = tuple(self.preOrder())
+            cache = [order, None]
+            for i in order:
+                i._preorder = cache
+        return cache[0]
+
+    def _preOrderIndex(self, node):
+        """
+            Return the position of node in preOrderList() of this root.
+        """
+        order = self.preOrderList()
+        cache = self._preorder
+        if cache[1] is None:
+            cache[1] = dict((id(n), i) for (i, n) in enumerate(order))
+        return cache[1][id(node)]
 
     def _find(self, itr, *func, **kwargs):
         for i in itr:
@@ -310,11 +385,10 @@ class Tree(object):
             attributes exist, and that their values are equal to the specified
             values.
         """
-        itr = self.getRoot().preOrder()
-        for i in itr:
-            if i is self:
-                break
-        return self._find(itr, *func, **kwargs)
+        root = self.getRoot()
+        lst = root.preOrderList()
+        myIndex = root._preOrderIndex(self)
+        return self._find(itertools.islice(lst, myIndex+1, None), *func, **kwargs)
 
     def findBackwards(self, *func, **kwargs):
         """
@@ -328,11 +402,10 @@ class Tree(object):
             attributes exist, and that their values are equal to the specified
             values.
         """
-        # FIXME: Dreadfully inefficient...
-        lst = list(self.getRoot().preOrder())
-        lst.reverse()
-        myIndex = lst.index(self)
-        return self._find(lst[(myIndex+1):], *func, **kwargs)
+        root = self.getRoot()
+        lst = root.preOrderList()
+        myIndex = root._preOrderIndex(self)
+        return self._find(reversed(lst[0:myIndex]), *func, **kwargs)
 
     def getPrevious(self):
         """
@@ -351,7 +424,10 @@ class Tree(object):
             Return the depth of this node, i.e. the number of nodes on the path
             to the root.
         """
-        return len(list(self.pathToRoot()))
+        depth = 0
+        for i in self.pathToRoot():
+            depth += 1
+        return depth
 
     def findAttr(self, attr, default=None):
         """
@@ -417,7 +493,7 @@ class Tree(object):
         """
             Number of nodes in this tree, including the root.
         """
-        return len(list(self.preOrder()))
+        return sum(1 for i in self.preOrder())
 
 
 def constructFromList(lst):
@@ -1,13 +1,16 @@
 """Module for working with tree data structures, built on tinytree"""
+import struct
 import logging
 import collections
 import numpy as np
 import itertools
 
+import scipy.spatial
 import shapely.geometry
 import shapely.ops
 
 import workflow.utils
+import workflow.spatial_index
 import workflow.tinytree
 
 
@@ -49,8 +52,7 @@ class Tree(workflow.tinytree.Tree):
             yield n.segment
 
     def __len__(self):
-        # kinda hacky way of getting the count
-        return sum(1 for i in self.dfs())
+        return sum(1 for node in self.preOrder() if node.segment is not None)
 
     def __iter__(self):
         return self.dfs()
@@ -72,23 +74,68 @@ class Tree(workflow.tinytree.Tree):
         return inconsistent
     
             
-def _get_matches(seg, segments, segment_found):
-    """Find segments attached to seg amongst those not already found"""
-    matches = [i for i in range(len(segments)) if not segment_found[i]
-               and workflow.utils.close(segments[i].coords[-1], seg.coords[0])]
+class _PointIndex:
+    """Finds which of a list of points are close to a query point.
+
+    Candidates come from a KD-tree on x and y; matches are then exactly
+    those of workflow.utils.close(), in the order of the list.
+    """
+    def __init__(self, points, tol=workflow.utils._tol):
+        self.points = list(points)
+        self.tol = tol
+        if len(self.points) > 0:
+            self._kdtree = scipy.spatial.cKDTree(np.array([p[0:2] for p in self.points]))
+        else:
+            self._kdtree = None
+
+    def close(self, point):
+        """Sorted indices of points close to point."""
+        if self._kdtree is None:
+            return []
+        candidates = sorted(self._kdtree.query_ball_point(point[0:2], self.tol))
+        return [i for i in candidates if workflow.utils.close(self.points[i], point, self.tol)]
+
+
+def _begins_ends(segments):
+    """First and last coordinates of each segment."""
+    wkb, parts = workflow.utils.linestring_wkb_parts(segments)
+    begins = []
+    ends = []
+    for order, dim, n, offset in parts:
+        fmt = order + 'd'*dim
+        begins.append(struct.unpack_from(fmt, wkb, offset))
+        ends.append(struct.unpack_from(fmt, wkb, offset+8*dim*(n-1)))
+    return begins, ends
+
+def _get_matches(begin, ends, segment_found):
+    """Find segments ending at begin amongst those not already found"""
+    matches = [i for i in ends.close(begin) if not segment_found[i]]
     segment_found[matches] = True
     return matches
 
-def _go(i_seg, tree, segments, segments_found):
-    """Recursive helper function for generating a tree based on a matching function."""
+def _go(i_seg, tree, segments, begins, ends, segments_found):
+    """Adds the segments upstream of i_seg, in preorder, to tree.
+
+    This is iterative, so that long chains of reaches do not exhaust
+    the recursion limit.
+    """
     count = 0
-    tree.addChild(segments[i_seg])
-    for m in _get_matches(segments[i_seg], segments, segments_found):
-        count += _go(m, tree, segments, segments_found)
-    return count + 1
+    stack = [i_seg,]
+    while len(stack) > 0:
+        i = stack.pop()
+        tree.addChild(segments[i])
+        count += 1
+        # the first match is visited first
+        stack.extend(reversed(_get_matches(begins[i], ends, segments_found)))
+    return count
 
 def make_trees(segments):
-    """Forms tree(s) from a list of segments."""
+    """Forms tree(s) from a list of segments.
+
+    Segment endpoints are indexed, so that finding outlets and
+    upstream segments takes near-linear time in the number of
+    segments.
+    """
     logging.debug("Generating trees")
     endpoint_indices = find_endpoints(segments)
     logging.debug("  found: %i outlets"%len(endpoint_indices))
@@ -98,16 +145,19 @@ def make_trees(segments):
     # check if any endpoint lives on another segment
     segs_to_remove = []
     segs_to_add = []
+    if len(endpoint_indices) > 0:
+        index = workflow.spatial_index.BoundsIndex([seg.bounds for seg in segments])
     for endpoint_index in endpoint_indices:
         endpoint_seg = shapely.geometry.LineString(segments[endpoint_index].coords[-2:])
         try:
-            inter = next(i for i,seg in enumerate(segments)
-                         if endpoint_seg.intersects(seg)
-                         and i is not endpoint_index
-                         and workflow.utils.close(endpoint_seg.intersection(seg).coords[0], endpoint_seg.coords[-1], 1.e-5))
+            inter = next(i for i in index.query(endpoint_seg.bounds)
+                         if endpoint_seg.intersects(segments[i])
+                         and i != endpoint_index
+                         and workflow.utils.close(endpoint_seg.intersection(segments[i]).coords[0], endpoint_seg.coords[-1], 1.e-5))
         except StopIteration:
             logging.debug("   outlet %i is not faux"%endpoint_index)
         else:
+            inter = int(inter)
             logging.debug("   faux outlet: %i segment: %i"%(endpoint_index, inter))
             segs_to_remove.append(inter)
             
@@ -127,12 +177,14 @@ def make_trees(segments):
         logging.debug("  found: %i outlets"%len(endpoint_indices))
 
     # generate all trees
+    begins, ends = _begins_ends(segments)
+    ends = _PointIndex(ends)
     segment_found = np.zeros((len(segments),), bool)
     gcount = 0
     trees = []
     for endpoint_index in endpoint_indices:
         tree = Tree()
-        gcount += _go(endpoint_index, tree, segments, segment_found)
+        gcount += _go(endpoint_index, tree, segments, begins, ends, segment_found)
         trees.append(tree)
     assert(gcount == len(segments))
     return trees
@@ -143,14 +195,9 @@ def find_endpoints(segments):
     Note these may truely be the tree root, or they may end at a
     midpoint on another segment (mistake in input data).
     """
-    endpoints = []
-    for i,s in enumerate(segments):
-        c = s.coords[-1]
-        try:
-            next(s2 for s2 in segments if workflow.utils.close(s2.coords[0], c))
-        except StopIteration:
-            endpoints.append(i)
-    return endpoints
+    begins, ends = _begins_ends(segments)
+    begins = _PointIndex(begins)
+    return [i for i,c in enumerate(ends) if len(begins.close(c)) == 0]
 
 def tree_to_list(tree):
     return shapely.geometry.MultiLineString(list(tree.dfs()))
@@ -159,10 +206,70 @@ def forest_to_list(forest):
     """A forest is a list of trees.  Returns a flattened list of trees."""
     return shapely.geometry.MultiLineString([r for tree in forest for r in tree.dfs()])
 
-def is_consistent(tree, tol=1.e-8):
-    """Checks the geometric consistency of the tree."""
-    return not any(not node.check_child_consistency(tol) for node in tree.preOrder())
+def _preorder_with_parents(forest):
+    """Nodes of a forest in preorder, and the preorder index of each one's parent, or -1."""
+    nodes = []
+    parents = []
+    stack = [(t, -1) for t in reversed(forest)]
+    while len(stack) > 0:
+        node, p = stack.pop()
+        nodes.append(node)
+        parents.append(p)
+        p = len(nodes) - 1
+        stack.extend((c, p) for c in reversed(node.children))
+    return nodes, parents
+
+def find_inconsistent(forest, tol=workflow.utils._tol):
+    """Finds nodes whose segment does not end at the start of their parent's.
+
+    This is the check of Tree.check_child_consistency() for all nodes of
+    a tree or a list of trees at once: the last coordinate of every
+    child and the first coordinate of its parent are gathered into two
+    arrays and compared in one operation.  Nodes without a segment, and
+    their children, are not checked.
+
+    Returns the indices of the inconsistent nodes in the preorder of the
+    forest, i.e. into [n for tree in forest for n in tree.preOrder()].
+    """
+    if isinstance(forest, Tree):
+        forest = [forest,]
+    nodes, parents = _preorder_with_parents(forest)
+    parents = np.array(parents, dtype=int)
+    has_segment = np.array([n.segment is not None for n in nodes], dtype=bool)
+    children = np.flatnonzero(has_segment & (parents >= 0))
+    children = children[has_segment[parents[children]]]
+    if len(children) == 0:
+        return children
+
+    # endpoints of every segment, then of each child and its parent
+    with_segment = np.flatnonzero(has_segment)
+    begins, ends = _begins_ends(nodes[i].segment for i in with_segment)
+    seg_index = np.full((len(nodes),), -1, dtype=int)
+    seg_index[with_segment] = np.arange(len(with_segment))
+    child = seg_index[children]
+    parent = seg_index[parents[children]]
+
+    dims = np.array([len(c) for c in begins])
+    if np.all(dims == dims[0]):
+        d2 = np.sum((np.array(ends)[child] - np.array(begins)[parent])**2, axis=1)
+    else:
+        # mixed dimensions, compare in xy and flag differing dimensions
+        # as inconsistent, as does workflow.utils.close()
+        d2 = np.sum((np.array([c[0:2] for c in ends])[child] - np.array([c[0:2] for c in begins])[parent])**2, axis=1)
+        d2[dims[child] != dims[parent]] = np.inf
+    return children[~(d2 < tol**2)]
+
+def is_consistent(tree, tol=workflow.utils._tol):
+    """Checks the geometric consistency of the tree, or list of trees."""
+    return len(find_inconsistent(tree, tol)) == 0
 
-def get_inconsistent(tree, tol=1.e-8):
+def get_inconsistent(tree, tol=workflow.utils._tol):
     """Gets a list of inconsistent nodes of the tree."""
-    return [n for node in tree.preOrder() for n in node.get_inconsistent(tol)]
+    nodes, parents = _preorder_with_parents([tree,])
+    inconsistent = []
+    for i in find_inconsistent(tree, tol):
+        logging.warning("  INCONSISTENT:")
+        logging.warning("    child: %r"%(nodes[i].segment.coords[:]))
+        logging.warning("    parent: %r"%(nodes[parents[i]].segment.coords[:]))
+        inconsistent.append(nodes[i])
+    return inconsistent
@@ -1,16 +1,24 @@
 """Triangulates polygons"""
+import os
 import logging
 import collections
+import multiprocessing
+import concurrent.futures
 import numpy as np
 import numpy.linalg as la
 from matplotlib import pyplot as plt
 import scipy.spatial
 
 import shapely
+import shapely.ops
+import shapely.prepared
 import meshpy.triangle
 
 import workflow.tree
 import workflow.split_hucs
+import workflow.river_distance
+import workflow.connectivity
+import workflow.spatial_index
 
 
 class Nodes:
@@ -89,24 +97,94 @@ class NodesEdges:
 
     def check(self, tol=0.1):
         """Checks consistency of the interal representation."""
-        logging.info(" checking graph consistency")
-        min_dist = 1.e10
         coords = np.array(list(self.nodes))
-        kdtree = scipy.spatial.cKDTree(coords)
-        bad_pairs = kdtree.query_pairs(tol)
-        assert(len(bad_pairs) is 0)
-        
-        min_node = min(self.nodes[n] for n in self.nodes)
-        max_node = max(self.nodes[n] for n in self.nodes)
-        assert(min_node == 0)
-        assert(max_node == len(self.nodes)-1)
-        
-        min_edge_node = min(n for e in self.edges for n in e)
-        max_edge_node = max(n for e in self.edges for n in e)
-        assert(min_edge_node == 0)
-        assert(max_edge_node == len(self.nodes)-1)
+        edges = np.array(list(self.edges))
+        check_pslg(coords, edges, tol)
+
+
+def _unique_keys(keys):
+    """Deduplicates rows of an integer array of keys.
+
+    Returns the index of the first appearance of each distinct row, in
+    order of first appearance, and the id of each row's distinct value
+    in that order -- the numbering NodesEdges gives to nodes.
+    """
+    # group equal keys with a stable sort; the first of each group is
+    # its first appearance
+    by_key = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[by_key]
+    is_new = np.ones((len(keys),), bool)
+    is_new[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    group = np.empty((len(keys),), np.int64)
+    group[by_key] = np.cumsum(is_new) - 1
+    first = by_key[is_new]
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[group]
+
+
+def pslg(segments, decimals=3):
+    """Builds the nodes and edges of a planar straight line graph, as arrays.
+
+    The vectorized equivalent of NodesEdges: coordinates of all
+    segments are concatenated and rounded to decimals, duplicate nodes
+    are merged with a lexsort in _unique_keys(), which keeps them in
+    order of first appearance, and edges between consecutive
+    coordinates are oriented (smaller node first) and made unique.
+
+    Arguments:
+      segments          | list of shapely LineStrings and Polygons
+      decimals          | number of decimals used to identify nodes
+
+    Returns:
+      nodes             | np.array((n_nodes, 2), 'd'), rounded, in order
+                        | of first appearance
+      edges             | np.array((n_edges, 2), 'i'), sorted
+    """
+    coords = []
+    for obj in segments:
+        if type(obj) is shapely.geometry.LineString:
+            coords.append(np.array(obj.coords)[:,0:2])
+        elif type(obj) is shapely.geometry.Polygon:
+            # the boundary is closed, so the last edge is the round trip
+            coords.append(np.array(obj.boundary.coords)[:,0:2])
+        else:
+            raise TypeError("Invalid type for add, %r"%type(obj))
+    if len(coords) == 0:
+        return np.zeros((0,2),'d'), np.zeros((0,2),'i')
+
+    lengths = np.array([len(c) for c in coords])
+    scale = 10.**decimals
+    keys = np.round(np.concatenate(coords) * scale).astype(np.int64)
+
+    first, ids = _unique_keys(keys)
+    nodes = keys[first] / scale
+
+    # edges between consecutive coordinates of the same segment
+    same = np.ones((len(ids)-1,), bool)
+    same[np.cumsum(lengths)[:-1] - 1] = False
+    e0 = ids[:-1][same]
+    e1 = ids[1:][same]
+    keep = e0 != e1
+    n = len(nodes)
+    edge_keys = np.unique(np.minimum(e0, e1)[keep] * n + np.maximum(e0, e1)[keep])
+    edges = np.stack([edge_keys // n, edge_keys % n], axis=1).astype(workflow.connectivity.index_dtype(n))
+    return nodes, edges
+
+
+def check_pslg(nodes, edges, tol=0.1):
+    """Checks that no two distinct nodes are within tol, and that edges use every node."""
+    logging.info(" checking graph consistency")
+    kdtree = scipy.spatial.cKDTree(nodes)
+    bad_pairs = kdtree.query_pairs(tol)
+    assert len(bad_pairs) == 0, "nodes closer than %g: %r"%(tol, [(tuple(nodes[i]), tuple(nodes[j])) for (i,j) in sorted(bad_pairs)[0:5]])
+
+    assert(edges.min() == 0)
+    assert(edges.max() == len(nodes)-1)
+
 
-        
 def triangulate(hucs, rivers, **kwargs):
     """Triangulates HUCs and rivers.
 
@@ -129,19 +207,24 @@ def triangulate(hucs, rivers, **kwargs):
     if rivers is not None:
         segments = segments + list(workflow.tree.forest_to_list(rivers))
 
-    nodes_edges = NodesEdges(segments)
+    nodes, edges = pslg(segments)
 
-    logging.info("   %i points and %i facets"%(len(nodes_edges.nodes), len(nodes_edges.edges)))
-    nodes_edges.check(tol=1)
+    logging.info("   %i points and %i facets"%(len(nodes), len(edges)))
+    check_pslg(nodes, edges, tol=1)
     
+    mesh_points, mesh_tris = _build(nodes, edges, **kwargs)
+    logging.info("  ...built: %i mesh points and %i triangles"%(len(mesh_points),len(mesh_tris)))
+    return mesh_points, mesh_tris
+
+
+def _build(nodes, edges, **kwargs):
+    """Calls meshpy.triangle.build() on a PSLG, returning points and triangles."""
     logging.info(" building graph data structures")
+    # meshpy copies entries one at a time, so give it python lists
+    # made in one pass rather than numpy rows
     info = meshpy.triangle.MeshInfo()
-    nodes = np.array(list(nodes_edges.nodes), dtype=np.float64)
-    
-    pdata = [tuple([float(c) for c in p]) for p in nodes]
-    info.set_points(pdata)
-    fdata = [[int(i) for i in f] for f in nodes_edges.edges]
-    info.set_facets(fdata)
+    info.set_points(nodes.tolist())
+    info.set_facets(edges.tolist())
 
     logging.info(" triangle.build...")
 
@@ -161,9 +244,218 @@ def triangulate(hucs, rivers, **kwargs):
         else:
             logging.warning("Triangulate: '--enforce-delaunay' option requires a hacked `meshpy.triangle`.  Proceeding without this option because it is not recognized.  See documentation at https://github.com/amanzi/meshing_workflow")
             mesh = meshpy.triangle.build(info, **kwargs)
-            
-    mesh_points = np.array(mesh.points)
-    mesh_tris = np.array(mesh.elements)
+
+    return np.array(mesh.points), np.array(mesh.elements)
+
+
+def _insert_points(line, points, tol=1.e-7):
+    """A LineString of the xy of line, with points on it inserted as vertices.
+
+    Points within tol, along the line, of a vertex are not inserted.
+    """
+    coords = np.array(line.coords)[:,0:2]
+    along = np.zeros((len(coords),), 'd')
+    np.cumsum(np.linalg.norm(np.diff(coords, axis=0), axis=1), out=along[1:])
+    new = []
+    for p in points:
+        d = line.project(shapely.geometry.Point(p))
+        if np.abs(along - d).min() > tol:
+            new.append((d, p))
+    if len(new) == 0:
+        return line
+    new.sort()
+    positions = np.searchsorted(along, [d for (d, p) in new])
+    return shapely.geometry.LineString(np.insert(coords, positions, [p for (d, p) in new], axis=0))
+
+
+def _crossings(hucs, rivers):
+    """Points where rivers cross or touch HUC segments.
+
+    Returns a dict of lists of points by segment handle, and a list of
+    lists of points, one per river.
+    """
+    index = hucs.segment_index()
+    by_segment = dict()
+    by_river = []
+    for river in rivers:
+        points = []
+        for h in index.query(river.bounds):
+            inter = hucs.segments[h].intersection(river)
+            for g in getattr(inter, 'geoms', [inter,]):
+                if type(g) is shapely.geometry.Point:
+                    by_segment.setdefault(h, []).append(g.coords[0][0:2])
+                    points.append(g.coords[0][0:2])
+        by_river.append(points)
+    return by_segment, by_river
+
+
+def subdomain_segments(hucs, rivers=None, max_segment_length=None):
+    """Splits HUCs and rivers into the segments of each polygon.
+
+    Polygon i gets the HUC segments bounding it and the rivers, or
+    pieces of rivers, inside it.  Segments shared by two polygons are
+    the same objects in both lists, so both see identical vertices.
+    Points where rivers cross or touch HUC segments are first made
+    vertices of both, so that a river crossing a shared segment between
+    vertices ends at the same vertex on both sides, and densifying does
+    not put a vertex next to the crossing.
+
+    Arguments:
+      hucs              | a workflow.split_hucs.SplitHUCs instance
+      rivers            | a list of workflow.tree.Tree instances, or None
+      max_segment_length | if provided, HUC segments and rivers are
+                        | first densified so no edge is longer than this
+
+    Returns a list, one entry per polygon, of lists of LineStrings.
+    """
+    if rivers is not None and len(rivers) > 0:
+        reaches = list(workflow.tree.forest_to_list(rivers))
+        crossings, river_crossings = _crossings(hucs, reaches)
+    else:
+        reaches = []
+        crossings = dict()
+
+    segments = dict()
+    for h, seg in hucs.segments.items():
+        if h in crossings:
+            seg = _insert_points(seg, crossings[h])
+        if max_segment_length is not None:
+            seg = shapely.geometry.LineString(workflow.river_distance.densify([seg,], max_segment_length))
+        segments[h] = seg
+
+    subdomains = []
+    for boundary, inter in hucs.gons:
+        subdomain = [segments[s] for h in boundary for s in hucs.boundaries[h]]
+        subdomain.extend(segments[s] for h in inter for s in hucs.intersections[h])
+        subdomains.append(subdomain)
+
+    if len(reaches) > 0:
+        polygons = list(hucs.polygons())
+        prepared = [shapely.prepared.prep(p) for p in polygons]
+        index = workflow.spatial_index.BoundsIndex([p.bounds for p in polygons])
+        for river, points in zip(reaches, river_crossings):
+            if len(points) > 0:
+                river = _insert_points(river, points)
+            if max_segment_length is not None:
+                river = shapely.geometry.LineString(workflow.river_distance.densify([river,], max_segment_length))
+            owners = [i for i in index.query(river.bounds) if prepared[i].intersects(river)]
+            contained = [i for i in owners if prepared[i].contains(river)]
+            if len(contained) > 0:
+                subdomains[contained[0]].append(river)
+                continue
+
+            # the river crosses a shared boundary, or runs along one;
+            # give each polygon the piece inside it
+            for i in owners:
+                inside = polygons[i].intersection(river)
+                if type(inside) is shapely.geometry.MultiLineString:
+                    inside = shapely.ops.linemerge(inside)
+                if type(inside) is shapely.geometry.LineString:
+                    pieces = [inside,]
+                elif hasattr(inside, 'geoms'):
+                    pieces = [g for g in inside.geoms if type(g) is shapely.geometry.LineString]
+                else:
+                    pieces = []
+                subdomains[i].extend(p for p in pieces
+                                     if not p.is_empty and not polygons[i].boundary.contains(p))
+    return subdomains
+
+
+# keyword arguments of meshpy.triangle.build() in worker processes,
+# set by _init_worker() so that refinement functions need not pickle
+_worker_kwargs = None
+
+def _init_worker(kwargs):
+    global _worker_kwargs
+    _worker_kwargs = kwargs
+
+def _triangulate_subdomain(graph):
+    """Triangulates one subdomain's (nodes, edges) without adding vertices to its boundary."""
+    nodes, edges = graph
+    return _build(nodes, edges, allow_boundary_steiner=False, **_worker_kwargs)
+
+
+def merge(meshes, decimals=3):
+    """Merges triangulations that share nodes along their boundaries.
+
+    Nodes are identified as in pslg(), by their coordinates rounded to
+    decimals, and numbered in order of first appearance.
+
+    Arguments:
+      meshes            | list of (points, tris) tuples
+
+    Returns:
+      mesh_points       | np.array((n_points, 2), 'd')
+      mesh_tris         | np.array((n_tris, 3), 'i')
+    """
+    if len(meshes) == 0:
+        return np.zeros((0,2),'d'), np.zeros((0,3),'i')
+    points = np.concatenate([m[0] for m in meshes])
+    offsets = np.cumsum([0,] + [len(m[0]) for m in meshes[:-1]])
+    tris = np.concatenate([m[1] + offset for m, offset in zip(meshes, offsets)])
+
+    keys = np.round(points * 10.**decimals).astype(np.int64)
+    first, ids = _unique_keys(keys)
+    mesh_tris = ids[tris].astype(workflow.connectivity.index_dtype(len(first)))
+    return points[first], mesh_tris
+
+
+def triangulate_parallel(hucs, rivers, nprocs=None, max_segment_length=None, **kwargs):
+    """Triangulates each polygon of a SplitHUCs in a pool of processes.
+
+    Each polygon is triangulated with the rivers inside it, forbidding
+    Triangle from inserting vertices on the polygon's boundary, so that
+    the meshes of neighboring polygons conform along the segments they
+    share.  The meshes are then merged, see merge().  Because the
+    boundary is not refined, the resolution along HUC boundaries is that
+    of the segments, or max_segment_length if provided.  Triangle also
+    meets refinement criteria near rivers less reliably without boundary
+    vertices, so max_segment_length should be about the edge length
+    wanted there.
+
+    Arguments:
+      hucs              | a workflow.split_hucs.SplitHUCs instance
+      rivers            | a list of workflow.tree.Tree instances
+      nprocs            | number of processes, by default the number of
+                        | available cores; 1 triangulates in this process
+      max_segment_length | see subdomain_segments()
+
+    Additional keyword arguments include all options for
+    meshpy.triangle.build().  A refinement_func need not be picklable on
+    platforms that fork processes.
+    """
+    logging.info("Triangulating in parallel...")
+    if type(hucs) is not workflow.split_hucs.SplitHUCs:
+        raise RuntimeError("Parallel triangulate not implemented for container of type '%r'"%type(hucs))
+
+    subdomains = [pslg(segments) for segments in subdomain_segments(hucs, rivers, max_segment_length)]
+    # densified vertices are legitimately closer than 1 to other
+    # features, down to about max_segment_length
+    tol = 1. if max_segment_length is None else min(1., 0.01 * max_segment_length)
+    for nodes, edges in subdomains:
+        check_pslg(nodes, edges, tol)
+
+    if nprocs is None:
+        try:
+            nprocs = len(os.sched_getaffinity(0))
+        except AttributeError:
+            nprocs = os.cpu_count()
+    nprocs = max(1, min(nprocs, len(subdomains)))
+    logging.info("  %i subdomains on %i processes"%(len(subdomains), nprocs))
+
+    if nprocs == 1:
+        _init_worker(kwargs)
+        meshes = [_triangulate_subdomain(graph) for graph in subdomains]
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        with concurrent.futures.ProcessPoolExecutor(nprocs, mp_context=context,
+                                                    initializer=_init_worker, initargs=(kwargs,)) as pool:
+            meshes = list(pool.map(_triangulate_subdomain, subdomains))
+
+    mesh_points, mesh_tris = merge(meshes)
     logging.info("  ...built: %i mesh points and %i triangles"%(len(mesh_points),len(mesh_tris)))
     return mesh_points, mesh_tris
 
@@ -178,7 +470,7 @@ def refine_from_max_area(max_area):
         return res
     return refine
 
-def refine_from_river_distance(near_distance, near_area, away_distance, away_area, rivers):
+def refine_from_river_distance(near_distance, near_area, away_distance, away_area, rivers, tol=None):
     """Returns a graded refinement function based upon a distance function from rivers, for use with Triangle.
 
     Triangle area must be smaller than near_area when the triangle
@@ -189,6 +481,10 @@ def refine_from_river_distance(near_distance, near_area, away_distance, away_are
     near_area and away_area when between
     near_distance and away_distance from the river
     network.
+
+    Distances are computed to within tol, by default 1% of
+    away_distance, by a workflow.river_distance.RiverDistance built
+    once, so each call costs the same however long the rivers are.
     """
     def max_area_valid(distance):
         """A function to make sure max area scales with distance from river network
@@ -203,15 +499,16 @@ def refine_from_river_distance(near_distance, near_area, away_distance, away_are
             area = near_area + (distance - near_distance) / (away_distance - near_distance) * (away_area - near_area)
         return area
 
-    river_multiline = workflow.tree.forest_to_list(rivers)
+    if tol is None:
+        tol = 0.01 * away_distance
+    river_distance = workflow.river_distance.RiverDistance(rivers, tol)
     def refine(vertices, area):
         """A function for use with workflow.triangulate.triangulate's refinement_func argument based on size gradation from a river."""
-        bary = np.sum(np.array(vertices), axis=0)/3
-        bary_p = shapely.geometry.Point(bary[0], bary[1])
-        distance = bary_p.distance(river_multiline)
-        max_area = max_area_valid(distance)
+        x = (vertices[0][0] + vertices[1][0] + vertices[2][0]) / 3.
+        y = (vertices[0][1] + vertices[1][1] + vertices[2][1]) / 3.
+        distance = river_distance(x, y)
         res = bool(area > max_area_valid(distance))
-        #logging.debug("refine? area = %g, distance = %g, max_area = %g: refine = %r"%(area,distance,max_area,res))
+        #logging.debug("refine? area = %g, distance = %g, max_area = %g: refine = %r"%(area,distance,max_area_valid(distance),res))
         return res
 
     return refine
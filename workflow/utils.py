@@ -1,4 +1,5 @@
 """Shape utilities not provided by shapely."""
+import struct
 import logging
 import subprocess
 import numpy as np
@@ -87,6 +88,62 @@ def shply(shape, properties=None, flip=False):
         raise ValueError('Converting to shapely got error: "%s"  Maybe you forgot to do shp["geometry"]?')
 
 
+def linestring_wkb_parts(segments):
+    """WKB of LineStrings written as one MultiLineString, and its parts.
+
+    Reading coordinates of shapely geometries one at a time is slow,
+    and writing them all at once is not.  Returns the WKB and, for each
+    part, its byte order, dimension, number of points and the offset of
+    its first coordinate.  Each part has its own header, so parts may
+    differ in dimension.
+    """
+    segments = list(segments)
+    if len(segments) == 0:
+        return b'', []
+    wkb = shapely.geometry.MultiLineString(segments).wkb
+    parts = []
+    offset = 9
+    for i in range(len(segments)):
+        order = '<' if wkb[offset] == 1 else '>'
+        gtype, n = struct.unpack_from(order+'II', wkb, offset+1)
+        # Z is flagged EWKB-style, or ISO-style as type 1002
+        dim = 3 if (gtype & 0x80000000 or gtype == 1002) else 2
+        parts.append((order, dim, n, offset+9))
+        offset += 9 + 8*dim*n
+    return wkb, parts
+
+
+def linestring_coords(segments):
+    """Coordinates of LineStrings, concatenated.
+
+    Returns coords, an np.array((n_coords, dim), 'd'), and offsets, an
+    np.array((n_segments+1,), int), such that segment i is
+    coords[offsets[i]:offsets[i+1]].  If segments differ in dimension,
+    only x and y are returned.
+    """
+    wkb, parts = linestring_wkb_parts(segments)
+    counts = np.array([n for (order, dim, n, offset) in parts], dtype=np.int64)
+    offsets = np.zeros((len(parts)+1,), dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    formats = set((order, dim) for (order, dim, n, offset) in parts)
+    if len(parts) == 0:
+        coords = np.zeros((0,2), 'd')
+    elif len(formats) == 1:
+        # drop the headers, the rest of the WKB is the coordinates
+        order, dim = formats.pop()
+        starts = np.array([offset for (order, dim, n, offset) in parts], dtype=np.int64)
+        raw = np.frombuffer(wkb, dtype=np.uint8)
+        keep = np.ones((len(raw),), dtype=bool)
+        keep[0:9] = False
+        keep[(starts - 9)[:,None] + np.arange(9)] = False
+        coords = raw[keep].view(order+'f8').reshape(-1, dim).astype('d', copy=False)
+    else:
+        # mixed dimensions
+        coords = np.concatenate([np.frombuffer(wkb, dtype=order+'f8', count=n*dim, offset=offset).reshape(n, dim)[:,0:2]
+                                 for (order, dim, n, offset) in parts]).astype('d', copy=False)
+    return coords, offsets
+
+
 def round(list_of_things, digits):
     """Rounds coordinates in things or shapes to a given digits."""
     for shp in list_of_things:
@@ -192,7 +249,7 @@ def cut(line, cutline, tol=1.e-5):
         seg = shapely.geometry.LineString(coords[i:i + 2])
         #logging.debug("Intersecting seg %d"%i)
         point = seg.intersection(cutline)
-        if type(point) is shapely.geometry.GeometryCollection and len(point) is 0:
+        if point.is_empty:
             #logging.debug("Cut seg no intersection")
             segcoords.append(seg.coords[-1])
             i += 1
@@ -2,6 +2,7 @@
 
 
 import shutil
+import functools
 import numpy as np
 import logging
 
@@ -15,14 +16,57 @@ import warnings
 import workflow.conf
 import workflow.utils
 
+# number of (source, destination) pairs of CRS whose transformers are kept
+transformer_cache_size = 128
+
+
+def _hashable(crs):
+    """A hashable stand-in for crs, which may be a dictionary."""
+    if isinstance(crs, dict):
+        return tuple(sorted(crs.items()))
+    return crs
+
+def _unhashable(crs):
+    if isinstance(crs, tuple):
+        return dict(crs)
+    return crs
+
+@functools.lru_cache(maxsize=transformer_cache_size)
+def _transformer(old_crs, new_crs):
+    old_crs = pyproj.CRS.from_user_input(_unhashable(old_crs))
+    new_crs = pyproj.CRS.from_user_input(_unhashable(new_crs))
+    if old_crs == new_crs:
+        return None
+    return pyproj.Transformer.from_crs(old_crs, new_crs, always_xy=True)
+
+def transformer(old_crs, new_crs):
+    """A pyproj.Transformer from old_crs to new_crs, in x,y order.
+
+    Transformers are cached, so CRS definitions are parsed once per
+    pair rather than once per call.  Returns None if the two CRS are
+    the same.
+    """
+    if old_crs == new_crs:
+        return None
+    return _transformer(_hashable(old_crs), _hashable(new_crs))
+
 def warp_xy(x, y, old_crs, new_crs):
     """Warps a set of points from old_crs to new_crs."""
-    if old_crs == new_crs:
+    trans = transformer(old_crs, new_crs)
+    if trans is None:
         return x,y
+    return trans.transform(x,y)
+
+def warp_coords(coords, old_crs, new_crs):
+    """Warps an (n,2) or (n,3) array of coordinates, NOT IN PLACE.
 
-    old_crs_proj = pyproj.Proj(old_crs)
-    new_crs_proj = pyproj.Proj(new_crs)
-    return pyproj.transform(old_crs_proj, new_crs_proj, x,y)
+    Only x and y are transformed; z, if present, is copied.
+    """
+    coords = np.array(coords, 'd')
+    trans = transformer(old_crs, new_crs)
+    if trans is not None and len(coords) > 0:
+        coords[:,0], coords[:,1] = trans.transform(coords[:,0], coords[:,1])
+    return coords
 
 def warp_bounds(bounds, old_crs, new_crs):
     """Uses proj to reproject bounds, NOT IN PLACE"""
@@ -33,66 +77,94 @@ def warp_bounds(bounds, old_crs, new_crs):
     # x2,y2 = warp_xy(x,y,old_crs, new_crs)
     # return [x2[0],y2[0],x2[1],y2[1]]
 
+def _shapely_coords(shp):
+    """Coordinate arrays of the sequences making up a shapely geometry, in order."""
+    if shp.is_empty:
+        return []
+    if hasattr(shp, 'geoms'):
+        return [c for g in shp.geoms for c in _shapely_coords(g)]
+    if type(shp) is shapely.geometry.Polygon:
+        return [np.array(shp.exterior.coords)] + [np.array(r.coords) for r in shp.interiors]
+    return [np.array(shp.coords)]
+
+def _shapely_rebuild(shp, coords):
+    """Inverse of _shapely_coords, taking arrays from the iterator coords."""
+    if shp.is_empty:
+        return shp
+    if hasattr(shp, 'geoms'):
+        return type(shp)([_shapely_rebuild(g, coords) for g in shp.geoms])
+    if type(shp) is shapely.geometry.Polygon:
+        exterior = next(coords)
+        return shapely.geometry.Polygon(exterior, [next(coords) for r in shp.interiors])
+    if type(shp) is shapely.geometry.Point:
+        return shapely.geometry.Point(next(coords)[0])
+    return type(shp)(next(coords))
+
 def warp_shapely(shp, old_crs, new_crs):
     """Uses proj to reproject shapes, NOT IN PLACE"""
-    old_crs_proj = pyproj.Proj(old_crs)
-    new_crs_proj = pyproj.Proj(new_crs)
-    if old_crs_proj == new_crs_proj:
-        return shp
-    
-    return shapely.ops.transform(lambda x,y:pyproj.transform(old_crs_proj, new_crs_proj, x,y), shp)
+    return warp_shapelys([shp,], old_crs, new_crs)[0]
 
 def warp_shapelys(shps, old_crs, new_crs):
-    return [warp_shapely(shp, old_crs, new_crs) for shp in shps]
+    """Reprojects a list of shapes, NOT IN PLACE.
+
+    Coordinates of all shapes are transformed in one call.
+    """
+    shps = list(shps)
+    if transformer(old_crs, new_crs) is None:
+        return shps
+
+    coords = [_shapely_coords(shp) for shp in shps]
+    arrays = _warp_arrays([c for cs in coords for c in cs], old_crs, new_crs)
+    return [_shapely_rebuild(shp, arrays) for shp in shps]
+
+def _warp_arrays(arrays, old_crs, new_crs):
+    """Warps a list of coordinate arrays in one call, returning an iterator over them."""
+    if len(arrays) == 0:
+        return iter(arrays)
+    warped = warp_coords(np.concatenate([a[:,0:2] for a in arrays]), old_crs, new_crs)
+    warped = np.split(warped, np.cumsum([len(a) for a in arrays[:-1]]))
+    return (w if a.shape[1] == 2 else np.concatenate([w, a[:,2:]], axis=1)
+            for (w, a) in zip(warped, arrays))
+
+def _feature_coords(coords):
+    """Coordinate arrays of the innermost sequences of GeoJSON-like coordinates."""
+    if len(coords) == 0:
+        return []
+    if not hasattr(coords[0], '__len__'):
+        # a point
+        return [np.array([coords,],'d')[:,0:2]]
+    if not hasattr(coords[0][0], '__len__'):
+        # line-like, or a ring
+        coords = np.array(coords,'d')
+        assert(len(coords.shape) == 2 and coords.shape[1] in [2,3])
+        return [coords[:,0:2]]
+    # multi-line, polygon, or multi-polygon
+    return [a for c in coords for a in _feature_coords(c)]
+
+def _feature_rebuild(coords, arrays):
+    """Inverse of _feature_coords, taking arrays from the iterator arrays."""
+    if len(coords) == 0:
+        return coords
+    if not hasattr(coords[0], '__len__'):
+        return tuple(next(arrays)[0].tolist())
+    if not hasattr(coords[0][0], '__len__'):
+        return list(map(tuple, next(arrays).tolist()))
+    return [_feature_rebuild(c, arrays) for c in coords]
 
 def warp_shape(feature, old_crs, new_crs):
     """Uses proj to reproject shapes, IN PLACE"""
-    # find the dimension -- can't trust the shape
-    dim = -1
-    ptr = feature['geometry']['coordinates']
-    done = False
-    while not done:
-        if hasattr(ptr, '__len__'):        
-            assert(len(ptr) is not 0)
-            dim += 1
-            ptr = ptr[0]
-        else:
-            done = True
-
-    if dim == 0:
-        # point
-        x,y = warp_xy(np.array([feature['geometry']['coordinates'][0],]), np.array([feature['geometry']['coordinates'][1],]), old_crs, new_crs)
-        feature['geometry']['coordinates'] = (x[0], y[0])
-
-    elif dim == 1:
-        # line-like or polygon with no holes
-        coords = np.array(feature['geometry']['coordinates'],'d')
-        assert(len(coords.shape) is 2 and coords.shape[1] in [2,3] )
-        x,y = warp_xy(coords[:,0], coords[:,1], old_crs, new_crs)
-        new_coords = [xy for xy in zip(x,y)]
-        feature['geometry']['coordinates'] = new_coords
-
-    elif dim == 2:
-        # multi-line or polygon with holes
-        new_rings = []
-        for i in range(len(feature['geometry']['coordinates'])):
-            coords = np.array(feature['geometry']['coordinates'][i],'d')
-            assert(len(coords.shape) is 2 and coords.shape[1] in [2,3])
-            x,y = warp_xy(coords[:,0], coords[:,1], old_crs, new_crs)
-            new_coords = list(zip(x,y))
-            new_rings.append(new_coords)
-        feature['geometry']['coordinates'] = new_rings
-        
-    elif dim == 3:
-        # multi-polygon
-        for i in range(len(feature['geometry']['coordinates'])):
-            for j in range(len(feature['geometry']['coordinates'][i])):
-                coords = np.array(feature['geometry']['coordinates'][i][j],'d')
-                assert(len(coords.shape) is 2 and coords.shape[1] in [2,3])
-                x,y = warp_xy(coords[:,0], coords[:,1], old_crs, new_crs)
-                new_coords = [xy for xy in zip(x,y)]
-                feature['geometry']['coordinates'][i][j] = new_coords
-            
+    warp_shapes([feature,], old_crs, new_crs)
+
+def warp_shapes(features, old_crs, new_crs):
+    """Reprojects a list of fiona-style features, IN PLACE.
+
+    Coordinates of all features are transformed in one call.  As with
+    warp_shape(), only x and y are kept.
+    """
+    coords = [_feature_coords(f['geometry']['coordinates']) for f in features]
+    arrays = _warp_arrays([c for cs in coords for c in cs], old_crs, new_crs)
+    for f in features:
+        f['geometry']['coordinates'] = _feature_rebuild(f['geometry']['coordinates'], arrays)
                     
     
 def warp_shapefile(infile, outfile, epsg=None):
@@ -34,6 +34,7 @@ SOFTWARE.
 
 
 '''
+import io
 import logging
 import numpy
 
@@ -49,7 +50,7 @@ vtk_to_meshio_type = {
     # 4: 'poly_line',
     5: 'triangle',
     # 6: 'triangle_strip',
-    # 7: 'polygon',
+    7: 'polygon',
     # 8: 'pixel',
     9: 'quad',
     10: 'tetra',
@@ -86,6 +87,13 @@ vtk_to_meshio_type = {
     }
 meshio_to_vtk_type = {v: k for k, v in vtk_to_meshio_type.items()}
 
+# number of nodes of each fixed-size vtk cell type
+vtk_type_num_nodes = {
+    1: 1, 3: 2, 5: 3, 9: 4, 10: 4, 12: 8, 13: 6, 14: 5, 15: 10, 16: 12,
+    21: 3, 22: 6, 23: 8, 24: 10, 25: 20, 26: 15, 27: 13, 28: 9, 29: 27,
+    30: 6, 31: 12, 32: 18, 33: 24, 34: 7, 35: 4,
+    }
+
 
 # These are all VTK data types. One sometimes finds 'vtktypeint64', but
 # this is ill-formed.
@@ -116,6 +124,111 @@ def read(filename):
 
 
 def read_buffer(f):
+    points, c, offsets, ct, point_data, cell_data_raw, field_data = \
+        _read_sections(f)
+    cells, cell_data = translate_cells(c, offsets, ct, cell_data_raw)
+    return points, cells, point_data, cell_data, field_data
+
+
+def read_buffer_flat(f):
+    '''Reads cells as flat arrays, in file order, rather than by type.
+
+    Handles both UNSTRUCTURED_GRID (CELLS and CELL_TYPES) and POLYDATA
+    (POLYGONS) datasets in a single pass.  Cell i is
+    connectivity[offsets[i]:offsets[i+1]], of vtk type types[i]; types
+    of POLYGONS are triangle, quad, or polygon by their number of nodes.
+
+    Returns points, offsets, connectivity, types, point_data,
+    cell_data_raw, field_data.
+    '''
+    points, c, offsets, ct, point_data, cell_data_raw, field_data = \
+        _read_sections(f)
+
+    lengths = c[offsets]
+    num_cells = len(offsets)
+    cell_offsets = numpy.zeros((num_cells+1,), numpy.int64)
+    numpy.cumsum(lengths, out=cell_offsets[1:])
+
+    if num_cells > 0 and numpy.all(lengths == lengths[0]):
+        connectivity = c.reshape(num_cells, -1)[:, 1:].ravel()
+    else:
+        counts = numpy.zeros((len(c),), bool)
+        counts[offsets] = True
+        connectivity = c[~counts]
+    return points, cell_offsets, connectivity, ct, point_data, \
+        cell_data_raw, field_data
+
+
+def _read_binary(f, count, dtype):
+    '''Reads count binary values, returned in native byte order.'''
+    # Binary data is big endian, see
+    # <https://www.vtk.org/Wiki/VTK/Writing_VTK_files_using_python#.22legacy.22>.
+    dtype = numpy.dtype(dtype).newbyteorder('>')
+    try:
+        f.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        data = numpy.frombuffer(f.read(count * dtype.itemsize), dtype=dtype)
+    else:
+        # read straight from the file into the array
+        data = numpy.fromfile(f, dtype=dtype, count=count)
+    assert len(data) == count, 'Unexpected end of VTK file.'
+    line = f.readline().decode('utf-8')
+    assert line == '\n'
+    return data.astype(dtype.newbyteorder('='))
+
+
+def _read_ints(f, count, is_ascii):
+    if is_ascii:
+        return numpy.fromfile(f, count=count, sep=' ', dtype=int)
+    return _read_binary(f, count, 'i4')
+
+
+def cell_offsets(c, num_cells, types=None):
+    '''Positions of the leading node count of each cell in c.
+
+    c is a VTK CELLS or POLYGONS array,
+    (num_points0, p0, p1, ... ,pk, numpoints1, p10, p11, ..., p1k, ...
+    '''
+    if num_cells == 0:
+        return numpy.zeros((0,), numpy.int64)
+
+    # all cells the same size
+    n = int(c[0]) + 1
+    if len(c) == num_cells * n and numpy.all(c[::n] == n - 1):
+        return numpy.arange(0, len(c), n, dtype=numpy.int64)
+
+    # sizes known from the cell types
+    if types is not None and len(types) == num_cells:
+        lengths = numpy.zeros((num_cells,), numpy.int64)
+        for tpe in numpy.unique(types):
+            lengths[types == tpe] = vtk_type_num_nodes.get(tpe, -1) + 1
+        if numpy.all(lengths > 0):
+            offsets = numpy.zeros((num_cells,), numpy.int64)
+            numpy.cumsum(lengths[:-1], out=offsets[1:])
+            if offsets[-1] + lengths[-1] == len(c) and \
+               numpy.all(c[offsets] == lengths - 1):
+                return offsets
+
+    # general polygons: follow the counts
+    offsets = numpy.zeros((num_cells,), numpy.int64)
+    idx = 0
+    for i in range(num_cells):
+        offsets[i] = idx
+        idx += c.item(idx) + 1
+    assert idx == len(c), 'Inconsistent VTK cell sizes.'
+    return offsets
+
+
+def _polygon_types(c, offsets):
+    '''VTK types of POLYGONS, by their number of nodes.'''
+    n = c[offsets]
+    types = numpy.full(len(offsets), meshio_to_vtk_type['polygon'])
+    types[n == 3] = meshio_to_vtk_type['triangle']
+    types[n == 4] = meshio_to_vtk_type['quad']
+    return types
+
+
+def _read_sections(f):
     # initialize output data
     points = None
     field_data = {}
@@ -132,8 +245,9 @@ def read_buffer(f):
     is_ascii = data_type == 'ASCII'
 
     c = None
-    offsets = None
+    num_cells = None
     ct = None
+    polygons = False
 
     # One of the problem in reading VTK files are POINT_DATA and CELL_DATA
     # fields. They can contain a number of SCALARS+LOOKUP_TABLE tables, without
@@ -158,8 +272,8 @@ def read_buffer(f):
 
         if section == 'DATASET':
             dataset_type = split[1]
-            assert dataset_type == 'UNSTRUCTURED_GRID', \
-                'Only VTK UNSTRUCTURED_GRID supported.'
+            assert dataset_type in ['UNSTRUCTURED_GRID', 'POLYDATA'], \
+                'Only VTK UNSTRUCTURED_GRID and POLYDATA supported.'
 
         elif section == 'POINTS':
             active = 'POINTS'
@@ -172,54 +286,22 @@ def read_buffer(f):
                     dtype=dtype
                     )
             else:
-                # binary
-                num_bytes = numpy.dtype(dtype).itemsize
-                total_num_bytes = num_points * (3 * num_bytes)
-                # Binary data is big endian, see
-                # <https://www.vtk.org/Wiki/VTK/Writing_VTK_files_using_python#.22legacy.22>.
-                dtype = dtype.newbyteorder('>')
-                points = \
-                    numpy.fromstring(f.read(total_num_bytes), dtype=dtype)
-                line = f.readline().decode('utf-8')
-                assert line == '\n'
+                points = _read_binary(f, num_points*3, dtype)
 
             points = points.reshape((num_points, 3))
 
-        elif section == 'CELLS':
-            active = 'CELLS'
-
+        elif section in ['CELLS', 'POLYGONS']:
+            active = section
+            polygons = section == 'POLYGONS'
+            num_cells = int(split[1])
             num_items = int(split[2])
-            if is_ascii:
-                c = numpy.fromfile(f, count=num_items, sep=' ', dtype=int)
-            else:
-                # binary
-                num_bytes = 4
-                total_num_bytes = num_items * num_bytes
-                c = numpy.fromstring(f.read(total_num_bytes), dtype='>i4')
-                line = f.readline().decode('utf-8')
-                assert line == '\n'
-
-            offsets = []
-            if len(c) > 0:
-                offsets.append(0)
-                while offsets[-1] + c[offsets[-1]] + 1 < len(c):
-                    offsets.append(offsets[-1] + c[offsets[-1]] + 1)
-            offsets = numpy.array(offsets)
+            c = _read_ints(f, num_items, is_ascii)
 
         elif section == 'CELL_TYPES':
             active = 'CELL_TYPES'
 
             num_items = int(split[1])
-            if is_ascii:
-                ct = \
-                    numpy.fromfile(f, count=int(num_items), sep=' ', dtype=int)
-            else:
-                # binary
-                num_bytes = 4
-                total_num_bytes = num_items * num_bytes
-                ct = numpy.fromstring(f.read(total_num_bytes), dtype='>i4')
-                line = f.readline().decode('utf-8')
-                assert line == '\n'
+            ct = _read_ints(f, num_items, is_ascii)
 
         elif section == 'POINT_DATA':
             active = 'POINT_DATA'
@@ -273,13 +355,16 @@ def read_buffer(f):
             d.update(_read_fields(f, int(split[2]), is_ascii))
 
     assert c is not None, \
-        'Required section CELLS not found.'
-    assert ct is not None, \
-        'Required section CELL_TYPES not found.'
-
-    cells, cell_data = translate_cells(c, offsets, ct, cell_data_raw)
+        'Required section CELLS or POLYGONS not found.'
+    if polygons:
+        offsets = cell_offsets(c, num_cells)
+        ct = _polygon_types(c, offsets)
+    else:
+        assert ct is not None, \
+            'Required section CELL_TYPES not found.'
+        offsets = cell_offsets(c, num_cells, ct)
 
-    return points, cells, point_data, cell_data, field_data
+    return points, c, offsets, ct, point_data, cell_data_raw, field_data
 
 
 def _read_scalar_field(f, num_data, split):
@@ -340,15 +425,7 @@ def _read_fields(f, num_fields, is_ascii):
                 f, count=shape0 * shape1, sep=' ', dtype=dtype
                 )
         else:
-            # binary
-            num_bytes = numpy.dtype(dtype).itemsize
-            total_num_bytes = shape0 * shape1 * num_bytes
-            # Binary data is big endian, see
-            # <https://www.vtk.org/Wiki/VTK/Writing_VTK_files_using_python#.22legacy.22>.
-            dtype = dtype.newbyteorder('>')
-            dat = numpy.fromstring(f.read(total_num_bytes), dtype=dtype)
-            line = f.readline().decode('utf-8')
-            assert line == '\n'
+            dat = _read_binary(f, shape0 * shape1, dtype)
 
         if shape0 != 1:
             dat = dat.reshape((shape1, shape0))
@@ -390,9 +467,7 @@ def translate_cells(data, offsets, types, cell_data_raw):
         meshio_type = vtk_to_meshio_type[tpe]
         n = data[offsets[b[0]]]
         assert (data[offsets[b]] == n).all()
-        indices = numpy.array([
-            numpy.arange(1, n+1) + o for o in offsets[b]
-            ])
+        indices = offsets[b][:, None] + numpy.arange(1, n+1)[None, :]
         cells[meshio_type] = data[indices]
         cell_data[meshio_type] = \
             {key: value[b] for key, value in cell_data_raw.items()}
@@ -400,6 +475,11 @@ def translate_cells(data, offsets, types, cell_data_raw):
     return cells, cell_data
 
 
+# cells, or points, formatted and written at a time, so that memory
+# stays bounded for large meshes
+write_chunk_size = 2**20
+
+
 def write(filename,
           points,
           cells,
@@ -407,6 +487,29 @@ def write(filename,
           cell_data=None,
           field_data=None,
           write_binary=True):
+    offsets, connectivity, types = flatten_cells(cells)
+    cell_data_raw = None
+    if cell_data is not None:
+        cell_data_raw = raw_from_cell_data(cell_data)
+    write_flat(filename, points, offsets, connectivity, types,
+               point_data, cell_data_raw, write_binary)
+    return
+
+
+def write_flat(filename,
+               points,
+               offsets,
+               connectivity,
+               types,
+               point_data=None,
+               cell_data_raw=None,
+               write_binary=True):
+    '''Writes cells given as flat arrays, in order.
+
+    Cell i is connectivity[offsets[i]:offsets[i+1]], of vtk type
+    types[i], so mixed triangles, quads and polygons can be written in
+    any order.  This is the inverse of read_buffer_flat.
+    '''
     if not write_binary:
         logging.warning('VTK ASCII files are only meant for debugging.')
 
@@ -418,7 +521,7 @@ def write(filename,
 
         # write points and cells
         _write_points(f, points, write_binary)
-        _write_cells(f, cells, write_binary)
+        _write_cells(f, offsets, connectivity, types, write_binary)
 
         # write point data
 
@@ -428,75 +531,114 @@ def write(filename,
             _write_field_data(f, point_data, write_binary)
 
         # write cell data
-        if cell_data is not None:
-            total_num_cells = sum([len(c) for c in cells.values()])
-            cell_data_raw = raw_from_cell_data(cell_data)
-            f.write('CELL_DATA {}\n'.format(total_num_cells).encode('utf-8'))
+        if cell_data_raw is not None:
+            f.write('CELL_DATA {}\n'.format(len(types)).encode('utf-8'))
             _write_field_data(f, cell_data_raw, write_binary)
 
     return
 
 
+def flatten_cells(cells):
+    '''Offsets, connectivity and types of a dictionary of cells by type.'''
+    lengths = [numpy.full(len(c), c.shape[1], numpy.int64)
+               for c in cells.values()]
+    types = [numpy.full(len(c), meshio_to_vtk_type[key], numpy.int32)
+             for key, c in cells.items()]
+    connectivity = [c.ravel() for c in cells.values()]
+    if len(lengths) == 0:
+        return numpy.zeros((1,), numpy.int64), \
+            numpy.zeros((0,), numpy.int32), numpy.zeros((0,), numpy.int32)
+
+    lengths = numpy.concatenate(lengths)
+    offsets = numpy.zeros((len(lengths)+1,), numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets, numpy.concatenate(connectivity), numpy.concatenate(types)
+
+
+def _write_ascii(f, values, fmt, line_ends=None):
+    '''Formats values in bulk, one row per line, or with line breaks
+    after the entries where line_ends is True.'''
+    if line_ends is None:
+        values = values.reshape(len(values), -1)
+        line = ' '.join([fmt] * values.shape[1]) + '\n'
+        template = line * len(values)
+    else:
+        template = ''.join(numpy.where(line_ends, fmt + '\n', fmt + ' ').tolist())
+    f.write((template % tuple(values.ravel().tolist())).encode('utf-8'))
+
+
+def _chunks(n, chunk_size):
+    for start in range(0, n, chunk_size):
+        yield start, min(start + chunk_size, n)
+
+
 def _write_points(f, points, write_binary):
     f.write(
         'POINTS {} {}\n'.format(
             len(points), numpy_to_vtk_dtype[points.dtype.name]
             ).encode('utf-8'))
 
-    if write_binary:
-        # Binary data must be big endian, see
-        # <https://www.vtk.org/Wiki/VTK/Writing_VTK_files_using_python#.22legacy.22>.
-        points.astype(points.dtype.newbyteorder('>')).tofile(f, sep='')
-    else:
-        # ascii
-        points.tofile(f, sep=' ')
+    for start, end in _chunks(len(points), write_chunk_size):
+        chunk = points[start:end]
+        if write_binary:
+            # Binary data must be big endian, see
+            # <https://www.vtk.org/Wiki/VTK/Writing_VTK_files_using_python#.22legacy.22>.
+            chunk.astype(chunk.dtype.newbyteorder('>')).tofile(f, sep='')
+        else:
+            # ascii, shortest repr that reads back exactly
+            _write_ascii(f, chunk, '%r')
     f.write('\n'.encode('utf-8'))
     return
 
 
-def _write_cells(f, cells, write_binary):
-    total_num_cells = sum([len(c) for c in cells.values()])
-    total_num_idx = sum([numpy.prod(c.shape) for c in cells.values()])
-    # For each cell, the number of nodes is stored
-    total_num_idx += total_num_cells
+def _cell_records(offsets, connectivity, start, end):
+    '''VTK CELLS records, (n, p0, ... pn-1, ...), of cells [start, end).
+
+    Returns the flat records, and the position after the end of each
+    record.
+    '''
+    lengths = offsets[start+1:end+1] - offsets[start:end]
+    ends = numpy.cumsum(lengths + 1)
+    records = numpy.empty((ends[-1],), numpy.int64)
+    heads = ends - lengths - 1
+    records[heads] = lengths
+    nodes = numpy.ones((len(records),), bool)
+    nodes[heads] = False
+    records[nodes] = connectivity[offsets[start]:offsets[end]]
+    return records, ends
+
+
+def _write_cells(f, offsets, connectivity, types, write_binary):
+    total_num_cells = len(types)
+    total_num_idx = len(connectivity) + total_num_cells
     f.write(
-        'CELLS {} {}\n'.format(total_num_cells, total_num_idx)
-        .encode('utf-8'))
-    if write_binary:
-        for key in cells:
-            n = cells[key].shape[1]
-            d = numpy.column_stack([
-                numpy.full(len(cells[key]), n), cells[key]
-                ]).astype(numpy.dtype('>i4'))
-            f.write(d.tostring())
+        'CELLS {} {}\n'
+        .format(total_num_cells, total_num_idx).encode('utf-8'))
+
+    for start, end in _chunks(total_num_cells, write_chunk_size):
+        records, ends = _cell_records(offsets, connectivity, start, end)
         if write_binary:
-            f.write('\n'.encode('utf-8'))
-    else:
-        # ascii
-        for key in cells:
-            n = cells[key].shape[1]
-            for cell in cells[key]:
-                f.write((' '.join([
-                    '{}'.format(idx)
-                    for idx in numpy.concatenate([[n], cell])
-                    ]) + '\n').encode('utf-8'))
+            records.astype(numpy.dtype('>i4')).tofile(f, sep='')
+        elif numpy.all(numpy.diff(ends, prepend=0) == ends[0]):
+            # one cell per line
+            _write_ascii(f, records.reshape(end - start, -1), '%d')
+        else:
+            line_ends = numpy.zeros((len(records),), bool)
+            line_ends[ends - 1] = True
+            _write_ascii(f, records, '%d', line_ends)
+    if write_binary:
+        f.write('\n'.encode('utf-8'))
 
     # write cell types
     f.write('CELL_TYPES {}\n'.format(total_num_cells).encode('utf-8'))
+    for start, end in _chunks(total_num_cells, write_chunk_size):
+        if write_binary:
+            types[start:end].astype(numpy.dtype('>i4')).tofile(f, sep='')
+        else:
+            # ascii
+            _write_ascii(f, types[start:end], '%d')
     if write_binary:
-        for key in cells:
-            d = numpy.full(
-                len(cells[key]), meshio_to_vtk_type[key]
-                ).astype(numpy.dtype('>i4'))
-            f.write(d.tostring())
         f.write('\n'.encode('utf-8'))
-    else:
-        # ascii
-        for key in cells:
-            for _ in range(len(cells[key])):
-                f.write(
-                    '{}\n'.format(meshio_to_vtk_type[key]).encode('utf-8')
-                    )
     return
 
 